@@ -1,34 +1,53 @@
-
-from crawler.stock_price import (
-    fetch_and_save_zz500_list,
-    parse_stock_list,
-    download_all_stock_data,
-    find_top_gainers,
-    update_existing_stock_data,
-    ensure_zz500_list,
-)
-
-from analysis.stock_search import (
-    filter_limit_up,
-    filter_limit_down,
-    filter_top_gainers,
-)
-
-from analysis.stock_analysis import (
-    download_quarterly_financials,
-    batch_download_financials,
-    search_and_save_stock_code,
-    function_plot_financial_metric,
-    function_plot_all_metrics
-)
-
-import pandas as pd
-import os
 from datetime import datetime
-import baostock as bs
+
+from crawler.downloader import close_session_pools
+from crawler.session import logout
+
+# Heavy modules (pandas, pyarrow, matplotlib, baostock) are imported inside the menu that needs
+# them, and baostock logs in on the first remote call, so the main menu appears immediately.
+
+
+def ask_worker_count() -> int:
+    workers_input = input("Parallel download workers (default 1): ").strip()
+    return int(workers_input) if workers_input.isdigit() and int(workers_input) > 0 else 1
+
+
+def function_resume_job():
+    from crawler.jobs import list_jobs
+
+    jobs = list_jobs()
+    if not jobs:
+        print("No unfinished download jobs.")
+        return
+
+    print("\nUnfinished jobs:")
+    for idx, job in enumerate(jobs):
+        done = len(job["units"]) - len(job["pending"])
+        print(f"{idx}. {job['id']} ({job['kind']}) — {done}/{len(job['units'])} done, "
+              f"{len(job['failed'])} failed, created {job['created']}")
+    choice = input("Enter job index to resume: ").strip()
+    if not choice.isdigit() or int(choice) >= len(jobs):
+        print("Invalid index input.")
+        return
+
+    job = jobs[int(choice)]
+    if job["kind"] == "prices":
+        from crawler.stock_price import resume_download_job
+        resume_download_job(job["id"], workers=ask_worker_count())
+    else:
+        from analysis.stock_analysis import resume_financial_job
+        resume_financial_job(job["id"], workers=ask_worker_count())
 
 
 def function_download_history():
+    from crawler.stock_price import (
+        fetch_and_save_zz500_list,
+        download_all_stock_data,
+        update_existing_stock_data,
+        ensure_zz500_list,
+    )
+    from crawler.price_store import export_store_to_csv
+
     while True:
         print("\nData Download & Update Menu")
         today_str = datetime.today().strftime("%Y-%m-%d")
@@ -37,9 +56,11 @@ def function_download_history():
         print("1. Update existing stock data (incremental)")
         print("2. Refresh CSI 500 stock list only")
         print("3. Download full historical stock data (may take long)")
+        print("4. Export price store to per-stock CSV files")
+        print("5. Resume an unfinished download job")
         print("0. Return to previous menu")
 
-        sub_choice = input("Enter your choice (0–3): ").strip()
+        sub_choice = input("Enter your choice (0–5): ").strip()
 
         if sub_choice == "1":
             stock_code_list, name_code_map, stock_dic = ensure_zz500_list()
@@ -48,7 +69,8 @@ def function_download_history():
             if confirm != "y":
                 print("Update canceled.")
                 continue
-            update_existing_stock_data(stock_code_list, stock_dic, today_str)
+            workers = ask_worker_count()
+            update_existing_stock_data(stock_code_list, stock_dic, today_str, workers=workers)
 
         elif sub_choice == "2":
             end = input(f"Enter end date (YYYY-MM-DD, default {today_str}): ").strip()
@@ -62,20 +84,27 @@ def function_download_history():
             end = input(f"End date (YYYY-MM-DD, default {today_str}): ").strip()
             start_date = start if start else "2022-07-01"
             end_date = end if end else today_str
+            workers = ask_worker_count()
             confirm = input("This may take a while. Continue? (y/n): ").strip().lower()
             if confirm != "y":
                 print("Download canceled.")
                 continue
             stock_code_list, name_code_map, stock_dic = ensure_zz500_list()
-            download_all_stock_data(stock_code_list, stock_dic, start_date, end_date)
+            download_all_stock_data(stock_code_list, stock_dic, start_date, end_date, workers=workers)
             print("All data downloaded successfully.")
 
+        elif sub_choice == "4":
+            export_store_to_csv("daily_data_history")
+
+        elif sub_choice == "5":
+            function_resume_job()
+
         elif sub_choice == "0":
             print("Returning to main menu...")
             break
 
         else:
-            print("Invalid input. Please enter a number between 0 and 3.")
+            print("Invalid input. Please enter a number between 0 and 5.")
 
 
 def function_analysis_menu():
@@ -95,6 +124,7 @@ def function_analysis_menu():
             function_financial_data_menu()
 
         elif choice == "3":
+            from analysis.stock_analysis import search_and_save_stock_code
             search_and_save_stock_code()
 
         elif choice == "0":
@@ -105,23 +135,49 @@ def function_analysis_menu():
             print("Invalid input. Please try again.")
 
 
+def ask_save_limit_table(df, kind: str):
+    from analysis.stock_search import save_limit_table
+
+    if df.empty:
+        return
+    if input("Save results to CSV file? (y/n): ").strip().lower() == "y":
+        save_limit_table(df, kind)
+    else:
+        print("Results not saved. Display only.")
+
+
 def function_stock_filter_menu():
+    from analysis.stock_search import (
+        filter_limit_up, filter_limit_down, filter_top_gainers, save_top_gainers,
+        filter_limit_streaks, save_streak_table,
+    )
+
     while True:
         print("\nStock Filter Menu")
-        print("1. Filter continuous limit-up stocks")
-        print("2. Filter continuous limit-down stocks")
+        print("1. Count limit-up days (intraday move above a threshold)")
+        print("2. Count limit-down days (intraday move below a threshold)")
         print("3. Top N gainers (based on min→max range)")
+        print("4. Consecutive limit-up streaks (board price limits)")
+        print("5. Consecutive limit-down streaks (board price limits)")
         print("0. Return to previous menu")
 
-        choice = input("Enter your choice (0–3): ").strip()
+        choice = input("Enter your choice (0–5): ").strip()
 
         if choice == "1":
-            df = filter_limit_up()
+            days_input = input("Enter number of days to check (default 30): ").strip()
+            threshold_input = input("Enter limit-up threshold as decimal (default 0.098): ").strip()
+            df = filter_limit_up(threshold=float(threshold_input) if threshold_input else 0.098,
+                                 recent_days=int(days_input) if days_input.isdigit() else 30)
+            ask_save_limit_table(df, "limit_up")
             print("\nLimit-up filter result:")
             print(df)
 
         elif choice == "2":
-            df = filter_limit_down()
+            days_input = input("Enter number of days to check (default 30): ").strip()
+            threshold_input = input("Enter limit-down threshold (e.g. -0.098): ").strip()
+            df = filter_limit_down(threshold=float(threshold_input) if threshold_input else -0.098,
+                                   recent_days=int(days_input) if days_input.isdigit() else 30)
+            ask_save_limit_table(df, "limit_down")
             print("\nLimit-down filter result:")
             print(df)
 
@@ -131,9 +187,21 @@ def function_stock_filter_menu():
             days = int(days_input) if days_input.isdigit() else 30
             top_n = int(topn_input) if topn_input.isdigit() else 10
             df = filter_top_gainers(recent_days=days, top_n=top_n)
+            if input(f"Save Top {top_n} results as CSV? (y/n): ").strip().lower() == "y":
+                save_top_gainers(df, top_n)
             print(f"Top {top_n} gainers in last {days} days:")
             print(df)
 
+        elif choice in ("4", "5"):
+            direction = "up" if choice == "4" else "down"
+            streak_input = input("Minimum streak length in days (default 2): ").strip()
+            df = filter_limit_streaks(direction=direction,
+                                      min_streak=int(streak_input) if streak_input.isdigit() else 2)
+            if not df.empty and input("Save results to CSV file? (y/n): ").strip().lower() == "y":
+                save_streak_table(df, direction)
+            print(f"\nLimit-{direction} streaks:")
+            print(df)
+
         elif choice == "0":
             print("Returning to previous menu")
             break
@@ -143,15 +211,24 @@ def function_stock_filter_menu():
 
 
 def function_financial_data_menu():
+    from analysis.stock_analysis import (
+        download_quarterly_financials,
+        batch_download_financials,
+        function_plot_financial_metric,
+        function_plot_all_metrics,
+        function_plot_saved_stocks,
+    )
+
     while True:
         print("\nFinancial Data Menu")
         print("1. Download financial data for one stock and quarter")
         print("2. Batch download for multiple stocks and quarters")
         print("3. Manually plot financial metrics")
         print("4. Automatically plot all categorized metrics")
+        print("5. Plot all metrics for every stock in saved_stocks.txt")
         print("0. Return to previous menu")
 
-        choice = input("Enter your choice (0–4): ").strip()
+        choice = input("Enter your choice (0–5): ").strip()
 
         if choice == "1":
             stock_code = input("Enter stock code (e.g., sh.600000): ").strip()
@@ -175,6 +252,9 @@ def function_financial_data_menu():
         elif choice == "4":
             function_plot_all_metrics()
 
+        elif choice == "5":
+            function_plot_saved_stocks()
+
         elif choice == "0":
             print("Returning to previous menu")
             break
@@ -184,7 +264,6 @@ def function_financial_data_menu():
 
 
 def main_menu():
-    bs.login()
     try:
         while True:
             print("\nWelcome to CSI500 Quant Tool")
@@ -207,7 +286,8 @@ def main_menu():
             else:
                 print("Invalid input. Please enter a number between 0 and 2.")
     finally:
-        bs.logout()
+        close_session_pools()
+        logout()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,227 @@
+"""
+Headless batch run: incremental price update → screens → financial charts, in one process
+
+    python Pipeline.py                              # default stages and screens
+    python Pipeline.py --config pipeline.json       # stages and screens from a JSON file
+    python Pipeline.py --skip update --end-date 2025-07-23
+    python Pipeline.py --profile output/profile.json  # also time fetch/decode/write/load/screen/render
+
+The config file holds any of the keys of DEFAULT_CONFIG; missing keys keep their defaults.
+Every stage reuses the same baostock session and the same loaded price panel, and a timing
+report (seconds per stage) is printed and written to output/pipeline_report.json.
+Exits with status 1 if any stage or screen failed.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from crawler import metrics
+from crawler.downloader import close_session_pools
+from crawler.query_cache import cache_stats
+from crawler.session import logout
+
+
+DEFAULT_CONFIG = {
+    "store_dir": "daily_data_store",
+    "data_folder": "daily_data_history",
+    "output_dir": "output",
+    "update": {"enabled": True, "end_date": None, "workers": 1, "requests_per_second": 10.0},
+    "screens": [
+        {"type": "limit_up", "recent_days": 30, "threshold": 0.098},
+        {"type": "limit_down", "recent_days": 30, "threshold": -0.098},
+        {"type": "top_gainers", "recent_days": 30, "top_n": 10},
+    ],
+    "charts": {"enabled": True, "stocks_file": "analysis/saved_stocks.txt", "workers": None},
+}
+
+SCREEN_TYPES = ["limit_up", "limit_down", "top_gainers", "range_gainers", "limit_up_streaks", "limit_down_streaks"]
+
+
+def load_config(path: str = None) -> dict:
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            user = json.load(f)
+        for key, value in user.items():
+            if isinstance(value, dict) and isinstance(config.get(key), dict):
+                config[key].update(value)
+            else:
+                config[key] = value
+    return config
+
+
+def stage_update(config: dict) -> dict:
+    from crawler.stock_price import ensure_zz500_list, update_existing_stock_data
+
+    opts = config["update"]
+    end_date = opts.get("end_date") or datetime.today().strftime("%Y-%m-%d")
+    # no login here: the first query the cache cannot answer opens the session (crawler.session.call)
+    stock_code_list, _, stock_dic = ensure_zz500_list(os.path.join(config["output_dir"], "zz500_list.csv"))
+    failed = update_existing_stock_data(stock_code_list, stock_dic, end_date,
+                                        data_folder=config["data_folder"], store_dir=config["store_dir"],
+                                        workers=opts.get("workers", 1),
+                                        requests_per_second=opts.get("requests_per_second", 10.0))
+    return {"stocks": len(stock_code_list), "end_date": end_date, "failed": len(failed or [])}
+
+
+def run_screen(screen: dict, panel, config: dict):
+    """Run one configured screen on the loaded panel and save its table; returns the row count"""
+    from analysis.stock_search import (
+        filter_limit_up, filter_limit_down, filter_top_gainers, save_limit_table, save_top_gainers,
+        filter_range_gainers, save_range_gainers, filter_limit_streaks, save_streak_table,
+    )
+
+    kind = screen["type"]
+    days = screen.get("recent_days", 30)
+    output_dir = config["output_dir"]
+    if kind == "limit_up":
+        df = filter_limit_up(threshold=screen.get("threshold", 0.098), recent_days=days, panel=panel)
+        if not df.empty:
+            save_limit_table(df, "limit_up", output_dir)
+    elif kind == "limit_down":
+        df = filter_limit_down(threshold=screen.get("threshold", -0.098), recent_days=days, panel=panel)
+        if not df.empty:
+            save_limit_table(df, "limit_down", output_dir)
+    elif kind == "top_gainers":
+        top_n = screen.get("top_n", 10)
+        df = filter_top_gainers(recent_days=days, top_n=top_n, panel=panel)
+        save_top_gainers(df, top_n, output_dir)
+    elif kind == "range_gainers":
+        top_n = screen.get("top_n", 10)
+        df = filter_range_gainers(recent_days=days, top_n=top_n, panel=panel)
+        save_range_gainers(df, top_n, output_dir)
+    elif kind in ("limit_up_streaks", "limit_down_streaks"):
+        direction = kind.split("_")[1]
+        df = filter_limit_streaks(direction=direction, min_streak=screen.get("min_streak", 2), panel=panel)
+        if not df.empty:
+            save_streak_table(df, direction, output_dir)
+    else:
+        raise ValueError(f"Unknown screen type '{kind}' (expected one of {', '.join(SCREEN_TYPES)})")
+    return len(df)
+
+
+def stage_screens(config: dict, report: dict) -> dict:
+    from crawler.price_panel import load_price_panel, memory_footprint
+
+    start = time.perf_counter()
+    panel = load_price_panel(config["store_dir"], config["data_folder"])
+    report["timings"]["screens.load_panel"] = time.perf_counter() - start
+    if panel is None:
+        raise RuntimeError("No price data found")
+    report["panel_memory"] = memory_footprint(panel)
+
+    results = {}
+    for i, screen in enumerate(config["screens"]):
+        name = f"screens.{i}.{screen.get('type')}"
+        start = time.perf_counter()
+        try:
+            results[name] = run_screen(screen, panel, config)
+        except Exception as e:
+            print(f"Screen {name} failed: {e}")
+            report["errors"][name] = str(e)
+        report["timings"][name] = time.perf_counter() - start
+    return results
+
+
+def stage_charts(config: dict) -> dict:
+    from analysis.chart_render import render_stock_charts
+    from analysis.fundamentals_store import ensure_fundamentals_store
+
+    opts = config["charts"]
+    stocks_file = opts.get("stocks_file", "analysis/saved_stocks.txt")
+    if not os.path.exists(stocks_file):
+        raise RuntimeError(f"{stocks_file} not found")
+    with open(stocks_file, "r", encoding="utf-8") as f:
+        stock_list = [line.strip() for line in f if line.strip()]
+    # fundamentals table, legacy financial CSVs and figures all live under output_dir
+    output_dir = config["output_dir"]
+    store_dir = ensure_fundamentals_store(os.path.join(output_dir, "financial_data"), output_dir,
+                                          store_dir=os.path.join(output_dir, "fundamentals"))
+    return render_stock_charts(stock_list, workers=opts.get("workers"), store_dir=store_dir,
+                               figure_dir=os.path.join(output_dir, "figure"))
+
+
+def run_pipeline(config: dict, skip=()) -> dict:
+    """
+    Run the enabled stages in order
+    Returns the report: per-stage timings (seconds), stage results and errors
+    """
+    report = {"started": datetime.now().isoformat(timespec="seconds"), "timings": {}, "results": {}, "errors": {}}
+    stages = [
+        ("update", lambda: stage_update(config), config["update"].get("enabled", True)),
+        ("screens", lambda: stage_screens(config, report), bool(config["screens"])),
+        ("charts", lambda: stage_charts(config), config["charts"].get("enabled", True)),
+    ]
+    total = time.perf_counter()
+    try:
+        for name, func, enabled in stages:
+            if not enabled or name in skip:
+                continue
+            print(f"\n=== {name} ===")
+            start = time.perf_counter()
+            try:
+                with metrics.span(f"stage.{name}"):
+                    report["results"][name] = func()
+            except Exception as e:
+                print(f"Stage {name} failed: {e}")
+                report["errors"][name] = str(e)
+            report["timings"][name] = time.perf_counter() - start
+    finally:
+        close_session_pools()
+        logout()
+    report["timings"]["total"] = time.perf_counter() - total
+    report["query_cache"] = cache_stats()
+    return report
+
+
+def print_report(report: dict):
+    print(f"\n{'stage':<32}{'seconds':>10}")
+    for name, seconds in report["timings"].items():
+        print(f"{name:<32}{seconds:>10.2f}")
+    hits = sum(s["hits"] for s in report.get("query_cache", {}).values())
+    misses = sum(s["misses"] for s in report.get("query_cache", {}).values())
+    memory = report.get("panel_memory")
+    if memory:
+        print(f"\nPrice panel: {memory['panel_total'] / 2**20:.1f} MB "
+              f"(+ {memory['fragments'] / 2**20:.1f} MB cached fragments, {memory['fragment_rows']} rows)")
+    if hits + misses:
+        print(f"\nQuery cache: {hits} hits, {misses} misses (all runs)")
+    if report["errors"]:
+        print(f"\n{len(report['errors'])} failed: {', '.join(report['errors'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--config", help="JSON config file (see DEFAULT_CONFIG)")
+    parser.add_argument("--skip", action="append", default=[], choices=["update", "screens", "charts"],
+                        help="Stage to leave out (repeatable)")
+    parser.add_argument("--end-date", help="Update prices up to this date (default today)")
+    parser.add_argument("--workers", type=int, help="Parallel download workers for the update stage")
+    parser.add_argument("--report", help="Where to write the JSON report (default <output_dir>/pipeline_report.json)")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="Record spans, counters and latency histograms and write them to PATH (JSON)")
+    args = parser.parse_args()
+
+    if args.profile:
+        metrics.enable(args.profile)
+    config = load_config(args.config)
+    if args.end_date:
+        config["update"]["end_date"] = args.end_date
+    if args.workers:
+        config["update"]["workers"] = args.workers
+
+    report = run_pipeline(config, skip=set(args.skip))
+    print_report(report)
+    if metrics.enabled():
+        metrics.print_summary()
+
+    from crawler.jobs import atomic_write_json
+    atomic_write_json(report, args.report or os.path.join(config["output_dir"], "pipeline_report.json"))
+    sys.exit(1 if report["errors"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import time
+
+import matplotlib
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+from tqdm import tqdm
+
+from crawler import metrics
+from crawler.jobs import atomic_path, atomic_write_json
+from analysis.fundamentals_store import FUNDAMENTALS_DIR, read_fundamentals
+
+matplotlib.rcParams['font.sans-serif'] = ['Microsoft YaHei', 'SimHei', 'Arial Unicode MS']
+matplotlib.rcParams['axes.unicode_minus'] = False
+
+
+# field → (axis label, formula shown under the title), grouped by category
+FIELD_CATEGORIES = {
+    "Profitability": {
+        "profit_roeAvg": ("ROE (%)", "Net Profit / Avg. Net Assets"),
+        "profit_npMargin": ("Net Profit Margin (%)", "Net Profit / Revenue"),
+        "profit_gpMargin": ("Gross Margin (%)", "Gross Profit / Revenue"),
+        "profit_netProfit": ("Net Profit", "Total Profit - Tax"),
+        "profit_epsTTM": ("EPS (Yuan)", "Net Profit / Total Shares"),
+    },
+    "Operational Efficiency": {
+        "operation_NRTurnRatio": ("AR Turnover", "Net Sales / Avg. AR"),
+        "operation_NRTurnDays": ("AR Turnover Days", "365 / AR Turnover"),
+        "operation_INVTurnRatio": ("Inventory Turnover", "COGS / Avg. Inventory"),
+        "operation_INVTurnDays": ("Inventory Turnover Days", "365 / Inventory Turnover"),
+        "operation_CATurnRatio": ("Current Asset Turnover", "Revenue / Avg. Current Assets"),
+        "operation_AssetTurnRatio": ("Total Asset Turnover", "Revenue / Avg. Total Assets"),
+    },
+    "Growth": {
+        "growth_YOYEquity": ("Equity YoY (%)", "(Current - Prev) / Prev"),
+        "growth_YOYAsset": ("Assets YoY (%)", "(Current - Prev) / Prev"),
+        "growth_YOYNI": ("Net Profit YoY (%)", "(Current - Prev) / Prev"),
+        "growth_YOYEPSBasic": ("EPS YoY (%)", "(Current - Prev) / Prev"),
+        "growth_YOYPNI": ("Non-recurring Net Profit YoY (%)", "(Current - Prev) / Prev"),
+    },
+    "Solvency": {
+        "balance_currentRatio": ("Current Ratio", "Current Assets / Current Liabilities"),
+        "balance_quickRatio": ("Quick Ratio", "Quick Assets / Current Liabilities"),
+        "balance_cashRatio": ("Cash Ratio", "Cash / Current Liabilities"),
+        "balance_YOYLiability": ("Liability YoY", "(Current - Prev) / Prev"),
+        "balance_liabilityToAsset": ("Debt-to-Asset Ratio", "Total Liabilities / Total Assets"),
+        "balance_assetToEquity": ("Equity Multiplier", "Total Assets / Shareholder Equity"),
+    },
+    "Cash Flow": {
+        "cash_CAToAsset": ("Current Assets / Total Assets", "Current Assets / Total Assets"),
+        "cash_NCAToAsset": ("Non-Current Assets / Total", "Non-Current Assets / Total Assets"),
+        "cash_tangibleAssetToAsset": ("Tangible / Total Assets", "Tangible Assets / Total"),
+        "cash_ebitToInterest": ("EBIT / Interest", "EBIT / Interest Expense"),
+        "cash_CFOToOR": ("Operating CF / Revenue", "Operating Cash Flow / Revenue"),
+        "cash_CFOToNP": ("Operating CF / Net Profit", "OCF / Net Profit"),
+        "cash_CFOToGr": ("Operating CF / Capex", "OCF / Capital Expenditure"),
+    },
+    "DuPont Analysis": {
+        "dupont_dupontROE": ("DuPont ROE", "Net Profit / Equity"),
+        "dupont_dupontAssetStoEquity": ("Equity Multiplier", "Assets / Equity"),
+        "dupont_dupontAssetTurn": ("Asset Turnover", "Revenue / Assets"),
+        "dupont_dupontPnitoni": ("Net Profit Margin", "Net Profit / Revenue"),
+        "dupont_dupontNitogr": ("Net Margin", "Net Profit / Revenue"),
+        "dupont_dupontTaxBurden": ("Tax Burden", "Net Profit / Pre-Tax Profit"),
+        "dupont_dupontIntburden": ("Interest Burden", "Pre-Tax Profit / EBIT"),
+        "dupont_dupontEbittogr": ("EBIT Margin", "EBIT / Revenue"),
+    }
+}
+
+# bump whenever the look of the auto charts changes, so every PNG is redrawn once
+CHART_TEMPLATE_VERSION = 1
+CHART_MANIFEST = "charts.json"
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIGURE_DIR = os.path.join(PROJECT_ROOT, "output", "figure")
+
+
+def date_to_quarter(date_obj) -> str:
+    return f"{date_obj.year}Q{(date_obj.month - 1) // 3 + 1}"
+
+
+def load_stock_name_map(list_path=os.path.join(PROJECT_ROOT, "output", "all_stocks.csv")) -> dict:
+    """Code → company name from the cached stock list (empty if it cannot be read)"""
+    try:
+        df = pd.read_csv(list_path, usecols=["code", "code_name"])
+    except Exception:
+        return {}
+    return dict(zip(df["code"], df["code_name"]))
+
+
+def chart_hash(code: str, field_key: str, label: str, formula: str, dates, values) -> str:
+    """Hash of everything a chart is drawn from: template version, titles and the series itself"""
+    h = hashlib.sha256()
+    h.update(f"{CHART_TEMPLATE_VERSION}|{code}|{field_key}|{label}|{formula}".encode("utf-8"))
+    h.update(np.asarray(dates, dtype="datetime64[D]").astype("int64").tobytes())
+    h.update(np.asarray(values, dtype="float64").tobytes())
+    return h.hexdigest()
+
+
+def render_chart(job: dict) -> str:
+    """
+    Draw one metric chart to PNG without pyplot (safe in worker processes, no display needed)
+    job keys: save_path, code, field_key, label, formula, dates, values
+    """
+    dates = pd.to_datetime(job["dates"])
+    fig = Figure(figsize=(10, 5))
+    ax = fig.subplots()
+    ax.plot(dates, job["values"], marker='o', linestyle='-', label=job["code"])
+    ax.set_xlabel("Quarter", fontsize=12)
+    ax.set_ylabel(job["label"], fontsize=12)
+    ax.tick_params(axis="x", labelrotation=45)
+    fig.suptitle(f"{job['label']}", fontsize=14, fontweight="bold", y=0.97)
+    ax.set_title(f"{job['field_key']} · Formula: {job['formula']}", fontsize=10, color="gray", pad=2)
+    ax.legend(title="Stock Code")
+    ax.grid(True)
+    fig.tight_layout(rect=[0.07, 0.07, 0.985, 0.92])
+
+    with atomic_path(job["save_path"]) as tmp_path:
+        fig.savefig(tmp_path, format="png", dpi=300, bbox_inches="tight")
+    return job["save_path"]
+
+
+def _load_chart_manifest(output_dir: str) -> dict:
+    path = os.path.join(output_dir, CHART_MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def plan_stock_charts(code: str, df: pd.DataFrame, stock_name: str, start_date=None, end_date=None,
+                      figure_dir=FIGURE_DIR):
+    """
+    Chart jobs for one stock's reports, every field of FIELD_CATEGORIES that has data
+    Returns (output_dir, list of job dicts each with its input hash)
+    """
+    start_date = df["statDate"].min() if start_date is None else pd.to_datetime(start_date)
+    end_date = df["statDate"].max() if end_date is None else pd.to_datetime(end_date)
+    df = df[(df["statDate"] >= start_date) & (df["statDate"] <= end_date)]
+    span = f"{date_to_quarter(start_date)}-{date_to_quarter(end_date)}"
+    output_dir = os.path.join(figure_dir, f"{stock_name}_{code}")
+
+    jobs = []
+    for fields in FIELD_CATEGORIES.values():
+        for field_key, (field_label, field_formula) in fields.items():
+            if field_key not in df.columns:
+                continue
+            df_plot = df[["statDate", field_key]].dropna().sort_values("statDate")
+            if df_plot.empty:
+                continue
+            dates = df_plot["statDate"].to_numpy(dtype="datetime64[D]")
+            values = df_plot[field_key].to_numpy(dtype="float64")
+            jobs.append({
+                "save_path": os.path.join(output_dir, f"{field_key}_{span}.png"),
+                "code": code,
+                "field_key": field_key,
+                "label": field_label,
+                "formula": field_formula,
+                "dates": dates,
+                "values": values,
+                "hash": chart_hash(code, field_key, field_label, field_formula, dates, values),
+            })
+    return output_dir, jobs
+
+
+def render_stock_charts(codes: list, start_date=None, end_date=None, workers=None, force=False,
+                        store_dir=FUNDAMENTALS_DIR, figure_dir=FIGURE_DIR) -> dict:
+    """
+    Render every categorized metric chart for many stocks at once
+    Parameters:
+        codes: Stock codes to render
+        start_date / end_date: statDate range, default each stock's full history
+        workers: Rendering processes (default: CPU count); 1 renders in this process
+        force: Redraw even charts whose inputs are unchanged
+    A chart is skipped when its PNG exists and the hash of its series and template version
+    matches the one recorded in the folder's charts.json.
+    Returns dict with rendered / skipped / missing counts and the elapsed seconds
+    """
+    start = time.perf_counter()
+    df_all = read_fundamentals(codes=codes, store_dir=store_dir)
+    names = load_stock_name_map()
+
+    manifests = {}
+    todo = []
+    skipped = 0
+    for code, df in df_all.groupby("code", sort=True):
+        output_dir, jobs = plan_stock_charts(code, df, names.get(code, code), start_date, end_date, figure_dir)
+        manifest = manifests.setdefault(output_dir, _load_chart_manifest(output_dir))
+        for job in jobs:
+            filename = os.path.basename(job["save_path"])
+            if not force and manifest.get(filename) == job["hash"] and os.path.exists(job["save_path"]):
+                skipped += 1
+            else:
+                todo.append(job)
+    missing = sorted(set(codes) - set(df_all["code"]))
+    if missing:
+        print(f"Warning: no financial data for {', '.join(missing)}")
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(todo)))
+
+    def finished(results):
+        for job, path in results:
+            output_dir = os.path.dirname(path)
+            manifests[output_dir][os.path.basename(path)] = job["hash"]
+            pbar.update(1)
+
+    pbar = tqdm(total=len(todo), desc="Rendering")
+    try:
+        with metrics.span("render.charts"):
+            if workers == 1:
+                finished((job, render_chart(job)) for job in todo)
+            else:
+                with mp.Pool(workers) as pool:
+                    finished(zip(todo, pool.imap(render_chart, todo, chunksize=4)))
+    finally:
+        pbar.close()
+        for output_dir, manifest in manifests.items():
+            if manifest:
+                atomic_write_json(manifest, os.path.join(output_dir, CHART_MANIFEST))
+
+    metrics.count("charts.rendered", len(todo))
+    metrics.count("charts.skipped", skipped)
+    elapsed = time.perf_counter() - start
+    print(f"Rendered {len(todo)} charts, skipped {skipped} unchanged ({elapsed:.1f}s)")
+    return {"rendered": len(todo), "skipped": skipped, "missing": missing, "seconds": elapsed}
@@ -0,0 +1,210 @@
+import json
+import os
+import time
+from datetime import date, timedelta
+from functools import partial
+
+import baostock as bs
+import pandas as pd
+
+from crawler import metrics
+from crawler.decode import decode_result
+from crawler.downloader import run_tasks
+from crawler.jobs import atomic_write_json
+from crawler.query_cache import register_ttl, end_of_day
+from crawler.session import call
+from analysis.fundamentals_store import FUNDAMENTALS_DIR
+
+
+# (column prefix, baostock query function name, label used in error messages), in merge order
+FINANCIAL_QUERIES = [
+    ("profit",    "query_profit_data",    "profitability"),
+    ("operation", "query_operation_data", "operational"),
+    ("growth",    "query_growth_data",    "growth"),
+    ("balance",   "query_balance_data",   "solvency"),
+    ("cash",      "query_cash_flow_data", "cashflow"),
+    ("dupont",    "query_dupont_data",    "dupont"),
+]
+
+# statements baostock answered with no rows: 'code|year|quarter|prefix' → ISO date of the check,
+# kept in the fundamentals store it belongs to (see empty_cache_path)
+EMPTY_CACHE_NAME = "empty_queries.json"
+EMPTY_CACHE_FILE = os.path.join(FUNDAMENTALS_DIR, EMPTY_CACHE_NAME)
+# days past the legal deadline after which a missing report is taken as final
+PUBLICATION_GRACE_DAYS = 30
+# an empty answer for a quarter that may still be published is trusted this long
+RECHECK_DAYS = 1
+
+
+def publication_deadline(year: int, quarter: int) -> date:
+    """Last day to publish a report: Q1 by Apr 30, half-year by Aug 31, Q3 by Oct 31, annual by next Apr 30"""
+    return {
+        1: date(year, 4, 30),
+        2: date(year, 8, 31),
+        3: date(year, 10, 31),
+        4: date(year + 1, 4, 30),
+    }[quarter]
+
+
+def _statement_ttl(args, kwargs, now):
+    # a report is final once its publication window has closed; until then recheck daily
+    year, quarter = int(kwargs["year"]), int(kwargs["quarter"])
+    if date.fromtimestamp(now) > publication_deadline(year, quarter) + timedelta(days=PUBLICATION_GRACE_DAYS):
+        return None
+    return end_of_day(now)
+
+
+for _, _query_name, _ in FINANCIAL_QUERIES:
+    register_ttl(_query_name, _statement_ttl)
+
+
+def empty_cache_path(store_dir=FUNDAMENTALS_DIR) -> str:
+    """Negative cache of one fundamentals store, e.g. output/fundamentals/empty_queries.json"""
+    return os.path.join(store_dir, EMPTY_CACHE_NAME)
+
+
+def load_empty_cache(path: str = EMPTY_CACHE_FILE) -> dict:
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def known_empty(cache: dict, prefix: str, code: str, year: int, quarter: int, today: date = None) -> bool:
+    """
+    True if a statement is cached as empty and the entry has not expired
+    Entries checked after the publication deadline (plus grace) never expire (delisted, pre-IPO,
+    never published); earlier ones expire after RECHECK_DAYS so recent quarters are rechecked.
+    """
+    checked = cache.get(f"{code}|{year}|{quarter}|{prefix}")
+    if checked is None:
+        return False
+    checked = date.fromisoformat(checked)
+    if checked > publication_deadline(year, quarter) + timedelta(days=PUBLICATION_GRACE_DAYS):
+        return True
+    return ((today or date.today()) - checked).days < RECHECK_DAYS
+
+
+def fetch_financial_table(query_name: str, code: str, year: int, quarter: int, queries=None) -> pd.DataFrame:
+    """
+    One baostock financial query as a typed DataFrame (dates as datetime64, metrics float64)
+    queries: Stand-in for the baostock module (e.g. crawler.replay.ReplayBaostock), default bs
+    Raises RuntimeError if Baostock reports an error, so callers can retry.
+    """
+    start = time.perf_counter()
+    with metrics.span("fetch.financial"):
+        rs = call(getattr(bs if queries is None else queries, query_name), code=code, year=year, quarter=quarter)
+    if rs.error_code != '0':
+        raise RuntimeError(rs.error_msg)
+    with metrics.span("decode.financial"):
+        df = decode_result(rs, query_name)
+    metrics.count("rows.financial", len(df))
+    metrics.observe("latency.financial", time.perf_counter() - start, label=f"{code} {year}Q{quarter} {query_name}")
+    return df
+
+
+def assemble_quarter(tables: dict, year: int, quarter: int) -> pd.DataFrame:
+    """
+    Merge the six statement tables of one (stock, quarter) side by side with prefixed columns
+    Parameters:
+        tables: prefix → DataFrame (empty for unpublished statements), or None for a failed query
+    Returns an empty DataFrame if every table is empty, or if any query failed: a quarter missing
+    a statement because of an error must not be stored as if it were complete.
+    """
+    if any(tables.get(prefix) is None for prefix, _, _ in FINANCIAL_QUERIES):
+        return pd.DataFrame()
+
+    def tag(df, prefix):
+        return df.add_prefix(prefix + "_") if not df.empty else pd.DataFrame()
+
+    merged = pd.concat([tag(tables[prefix], prefix) for prefix, _, _ in FINANCIAL_QUERIES], axis=1)
+
+    if merged.empty:
+        return pd.DataFrame()
+
+    profit_df, op_df = tables["profit"], tables["operation"]
+    if not profit_df.empty and "statDate" in profit_df.columns:
+        merged["statDate"] = profit_df["statDate"]
+    elif not op_df.empty and "statDate" in op_df.columns:
+        merged["statDate"] = op_df["statDate"]
+    else:
+        merged["statDate"] = f"{year}Q{quarter}"
+    return merged
+
+
+def fetch_quarters(units: list, workers=1, requests_per_second=20.0, retries=2, queries=None,
+                   empty_cache=EMPTY_CACHE_FILE):
+    """
+    Fetch all six statements for many (code, year, quarter) units across a pool of sessions
+    Every single query is its own task, so one slow statement does not hold up a worker.
+    Failed queries are retried; a unit with a query that still fails yields an empty DataFrame
+    and its errors, so the caller can tell it apart from a quarter that is not published yet.
+    Statements found empty before are not asked again until their cache entry expires
+    (see known_empty); empty_cache=None disables the cache.
+    queries: Local stand-in for the baostock module (see crawler.replay); no login is made with it.
+    Yields:
+        (code, year, quarter, merged DataFrame, errors) as soon as a unit's six queries are back;
+        errors maps the prefix of every failed statement to its error message (empty if none)
+    Prints throughput (calls/s, including retries) when done.
+    """
+    cache = load_empty_cache(empty_cache) if empty_cache else {}
+    today = date.today()
+    prefix_of = {query_name: prefix for prefix, query_name, _ in FINANCIAL_QUERIES}
+    label_of = {query_name: label for _, query_name, label in FINANCIAL_QUERIES}
+
+    pending = {}
+    # (code, year, quarter) -> {prefix: error message} of the queries that failed
+    failed = {}
+    tasks = []
+    for code, year, quarter in units:
+        for prefix, query_name, _ in FINANCIAL_QUERIES:
+            if known_empty(cache, prefix, code, year, quarter, today):
+                pending.setdefault((code, year, quarter), {})[prefix] = pd.DataFrame()
+            else:
+                tasks.append((query_name, code, year, quarter))
+    skipped = sum(len(tables) for tables in pending.values())
+    if skipped:
+        print(f"Skipping {skipped} statement queries known to be empty")
+
+    calls = 0
+    start = time.perf_counter()
+    try:
+        # units with every statement known empty need no calls at all
+        for key, tables in list(pending.items()):
+            if len(tables) == len(FINANCIAL_QUERIES):
+                del pending[key]
+                yield key[0], key[1], key[2], pd.DataFrame(), {}
+
+        fetch = fetch_financial_table if queries is None else partial(fetch_financial_table, queries=queries)
+        for task, df, error, attempts in run_tasks(fetch, tasks, workers=workers,
+                                                   requests_per_second=requests_per_second, retries=retries,
+                                                   login=queries is None):
+            query_name, code, year, quarter = task
+            calls += attempts
+            cache_key = f"{code}|{year}|{quarter}|{prefix_of[query_name]}"
+            if error is not None:
+                print(f"Error: {code} - {year}Q{quarter} - {label_of[query_name]} failed: {error}")
+                df = None
+            elif df.empty:
+                cache[cache_key] = today.isoformat()
+            else:
+                cache.pop(cache_key, None)
+
+            tables = pending.setdefault((code, year, quarter), {})
+            tables[prefix_of[query_name]] = df
+            if error is not None:
+                failed.setdefault((code, year, quarter), {})[prefix_of[query_name]] = str(error)
+            if len(tables) == len(FINANCIAL_QUERIES):
+                del pending[(code, year, quarter)]
+                yield (code, year, quarter, assemble_quarter(tables, year, quarter),
+                       failed.pop((code, year, quarter), {}))
+    finally:
+        if empty_cache and tasks:
+            atomic_write_json(cache, empty_cache)
+
+    elapsed = time.perf_counter() - start
+    if calls:
+        print(f"\nFetched {calls} calls in {elapsed:.1f}s ({calls / max(elapsed, 1e-9):.1f} calls/s)")
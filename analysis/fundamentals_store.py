@@ -0,0 +1,236 @@
+import os
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from crawler import metrics
+from crawler.jobs import atomic_path, atomic_write_csv
+
+
+FUNDAMENTALS_DIR = "output/fundamentals"
+KEY_COLUMNS = ["code", "statDate", "pubDate"]
+# compact the table once it holds this many upsert fragments
+COMPACT_FRAGMENTS = 20
+
+
+def quarter_end(year: int, quarter: int) -> pd.Timestamp:
+    """Report date of a quarter, e.g. (2023, 2) → 2023-06-30"""
+    return pd.Timestamp(year=int(year), month=int(quarter) * 3, day=1) + pd.offsets.MonthEnd(0)
+
+
+def normalize_quarter(merged: pd.DataFrame, code: str, year: int = None, quarter: int = None) -> pd.DataFrame:
+    """
+    Turn merged statement rows (prefixed columns, as from assemble_quarter) into warehouse rows
+    statDate / pubDate become single date columns taken from the first statement that has them,
+    per-statement code/statDate/pubDate columns are dropped and every metric is stored as float64.
+    (year, quarter) fill in statDate when no statement reports one.
+    """
+    if merged.empty:
+        return pd.DataFrame(columns=KEY_COLUMNS)
+
+    df = merged.reset_index(drop=True)
+    stat_cols = [c for c in df.columns if c.endswith("statDate") and c != "statDate"]
+    pub_cols = [c for c in df.columns if c.endswith("pubDate") and c != "pubDate"]
+
+    def first_date(cols):
+        value = pd.Series(pd.NaT, index=df.index)
+        for col in cols:
+            value = value.fillna(pd.to_datetime(df[col], errors="coerce"))
+        return value
+
+    # the merged 'statDate' can be a '2023Q2' placeholder, so it is only the last resort
+    stat = first_date(stat_cols)
+    if year is not None and quarter is not None:
+        stat = stat.fillna(quarter_end(year, quarter))
+    if "statDate" in df.columns:
+        stat = stat.fillna(pd.to_datetime(df["statDate"], errors="coerce"))
+    pub = first_date((["pubDate"] if "pubDate" in df.columns else []) + pub_cols)
+
+    drop = set(stat_cols + pub_cols + ["statDate", "pubDate", "code"])
+    drop.update(c for c in df.columns if c.endswith("_code"))
+    metrics = [c for c in df.columns if c not in drop]
+
+    # one constructor call: inserting ~40 metric columns one by one dominated the cost per quarter
+    columns = {"code": code, "statDate": stat, "pubDate": pub}
+    for col in metrics:
+        columns[col] = pd.to_numeric(df[col], errors="coerce").astype("float64")
+    out = pd.DataFrame(columns, index=df.index)
+    return out.dropna(subset=["statDate"]).reset_index(drop=True)
+
+
+def _to_table(df: pd.DataFrame) -> pa.Table:
+    out = df.copy()
+    out["code"] = out["code"].astype(str)
+    for col in ("statDate", "pubDate"):
+        out[col] = pd.to_datetime(out[col]).dt.date
+    out = out.sort_values(["code", "statDate"]).reset_index(drop=True)
+    fields = [("code", pa.string()), ("statDate", pa.date32()), ("pubDate", pa.date32())]
+    fields += [(c, pa.float64()) for c in out.columns if c not in KEY_COLUMNS]
+    return pa.Table.from_pandas(out, schema=pa.schema(fields), preserve_index=False)
+
+
+def fundamentals_paths(store_dir: str = FUNDAMENTALS_DIR) -> list:
+    """Fragments of the fundamentals table, oldest first"""
+    if not os.path.isdir(store_dir):
+        return []
+    return [os.path.join(store_dir, f) for f in sorted(os.listdir(store_dir)) if f.endswith(".parquet")]
+
+
+def upsert_fundamentals(df: pd.DataFrame, store_dir: str = FUNDAMENTALS_DIR, compact_at: int = COMPACT_FRAGMENTS) -> str:
+    """
+    Add or replace rows of the fundamentals table (keyed by code, statDate)
+    Only the new rows are written, as one fragment; a later fragment wins on read.
+    Once `compact_at` fragments have piled up they are folded back into a single file.
+    Returns the fragment path, or None if there was nothing to write.
+    """
+    if df.empty:
+        return None
+    os.makedirs(store_dir, exist_ok=True)
+    path = os.path.join(store_dir, f"part-{time.time_ns()}.parquet")
+    with metrics.span("write.fundamentals"), atomic_path(path) as tmp_path:
+        pq.write_table(_to_table(df), tmp_path, compression="zstd")
+    metrics.count("bytes.written", os.path.getsize(path))
+    if compact_at and len(fundamentals_paths(store_dir)) >= compact_at:
+        compact_fundamentals(store_dir)
+    return path
+
+
+def read_fundamentals(codes=None, start_date=None, end_date=None, columns=None,
+                      store_dir: str = FUNDAMENTALS_DIR) -> pd.DataFrame:
+    """
+    Query the fundamentals table
+    Parameters:
+        codes: Optional list of stock codes to keep
+        start_date / end_date: Inclusive statDate bounds, None for open-ended
+        columns: Metric columns to load (e.g. ['profit_roeAvg']); code, statDate, pubDate always included
+    Returns:
+        pd.DataFrame sorted by code, statDate with datetime64 statDate / pubDate
+        (metrics a fragment does not have come back as NaN)
+    """
+    paths = fundamentals_paths(store_dir)
+    frames = []
+    for path in paths:
+        names = pq.read_schema(path).names
+        wanted = names if columns is None else KEY_COLUMNS + [c for c in columns if c in names and c not in KEY_COLUMNS]
+        filters = []
+        if codes is not None:
+            filters.append(("code", "in", list(codes)))
+        if start_date is not None:
+            filters.append(("statDate", ">=", pd.to_datetime(start_date).date()))
+        if end_date is not None:
+            filters.append(("statDate", "<=", pd.to_datetime(end_date).date()))
+        with metrics.span("load.fundamentals"):
+            table = pq.read_table(path, columns=wanted, filters=filters or None)
+        if table.num_rows:
+            frames.append(table.to_pandas(date_as_object=False))
+
+    if not frames:
+        return pd.DataFrame(columns=KEY_COLUMNS + list(columns or []))
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+    if len(frames) > 1:
+        df = df.drop_duplicates(subset=["code", "statDate"], keep="last")
+    if columns is not None:
+        df = df.reindex(columns=KEY_COLUMNS + [c for c in columns if c not in KEY_COLUMNS])
+    return df.sort_values(["code", "statDate"]).reset_index(drop=True)
+
+
+def latest_fundamentals(columns=None, as_of=None, codes=None, store_dir: str = FUNDAMENTALS_DIR) -> pd.DataFrame:
+    """
+    Cross-section for screening: each stock's most recent report
+    With `as_of`, only reports published on or before that date count (no look-ahead).
+    """
+    df = read_fundamentals(codes=codes, columns=columns, store_dir=store_dir)
+    if as_of is not None:
+        df = df[df["pubDate"].isna() | (df["pubDate"] <= pd.to_datetime(as_of))]
+    return df.groupby("code", sort=True).tail(1).reset_index(drop=True)
+
+
+def stored_quarters(codes=None, store_dir: str = FUNDAMENTALS_DIR) -> set:
+    """(code, statDate Timestamp) pairs already in the table"""
+    df = read_fundamentals(codes=codes, columns=[], store_dir=store_dir)
+    return set(zip(df["code"], df["statDate"]))
+
+
+def fundamentals_codes(store_dir: str = FUNDAMENTALS_DIR) -> list:
+    """Stock codes with at least one report in the table"""
+    return sorted(read_fundamentals(columns=[], store_dir=store_dir)["code"].unique().tolist())
+
+
+def compact_fundamentals(store_dir: str = FUNDAMENTALS_DIR):
+    """Fold all fragments into one deduplicated, sorted file"""
+    paths = fundamentals_paths(store_dir)
+    if len(paths) < 2:
+        return
+    df = read_fundamentals(store_dir=store_dir)
+    final_path = os.path.join(store_dir, f"part-{time.time_ns()}.parquet")
+    with atomic_path(final_path) as tmp_path:
+        pq.write_table(_to_table(df), tmp_path, compression="zstd")
+    for p in paths:
+        os.remove(p)
+
+
+def import_financial_csvs(folder="output/financial_data", cleaned_folder="output",
+                          store_dir: str = FUNDAMENTALS_DIR) -> int:
+    """
+    Migrate the legacy CSV layout into the fundamentals table:
+    '{code}_cleaned.csv' files in `cleaned_folder`, then quarterly '{code}_{year}_Q{q}.csv' files
+    in `folder` (which win for the same report). Returns the number of reports imported.
+    """
+    frames = []
+    if os.path.isdir(cleaned_folder):
+        for filename in sorted(os.listdir(cleaned_folder)):
+            if not filename.endswith("_cleaned.csv"):
+                continue
+            try:
+                df = pd.read_csv(os.path.join(cleaned_folder, filename), dtype=str)
+            except Exception as e:
+                print(f"Warning: skipped corrupted file {filename} - {e}")
+                continue
+            frames.append(normalize_quarter(df, filename[:-len("_cleaned.csv")]))
+
+    if os.path.isdir(folder):
+        for filename in sorted(os.listdir(folder)):
+            parts = filename[:-4].split("_") if filename.endswith(".csv") else []
+            if len(parts) != 3 or not parts[2].startswith("Q"):
+                continue
+            code, year, quarter = parts[0], parts[1], parts[2][1:]
+            try:
+                df = pd.read_csv(os.path.join(folder, filename), dtype=str)
+            except Exception as e:
+                print(f"Warning: skipped corrupted file {filename} - {e}")
+                continue
+            frames.append(normalize_quarter(df, code, int(year), int(quarter)))
+
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return 0
+    df = pd.concat(frames, ignore_index=True).drop_duplicates(subset=["code", "statDate"], keep="last")
+    upsert_fundamentals(df, store_dir)
+    print(f"Imported {len(df)} quarterly reports into {store_dir}")
+    return len(df)
+
+
+def ensure_fundamentals_store(folder="output/financial_data", cleaned_folder="output",
+                              store_dir: str = FUNDAMENTALS_DIR) -> str:
+    """Build the table from legacy financial CSVs on first use"""
+    if not fundamentals_paths(store_dir):
+        import_financial_csvs(folder, cleaned_folder, store_dir)
+    return store_dir
+
+
+def export_cleaned_csv(code: str, output_folder="output", store_dir: str = FUNDAMENTALS_DIR) -> str:
+    """Write one stock's reports in the legacy '{code}_cleaned.csv' layout; returns the path or None"""
+    df = read_fundamentals(codes=[code], store_dir=store_dir)
+    if df.empty:
+        print(f"Warning: no financial data for {code}")
+        return None
+    df = df.dropna(axis=1, how="all")
+    for col in ("statDate", "pubDate"):
+        if col in df.columns:
+            df[col] = df[col].dt.strftime("%Y-%m-%d")
+    output_path = os.path.join(output_folder, f"{code}_cleaned.csv")
+    atomic_write_csv(df, output_path)
+    print(f"Cleaned file saved: {output_path}")
+    return output_path
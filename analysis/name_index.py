@@ -0,0 +1,221 @@
+"""
+Search index over the stock list (output/all_stocks.csv): name fragments, full pinyin, pinyin
+initials and code prefixes, with ranked results
+
+    index = load_name_index()
+    search_names(index, "pfyh")     # 浦发银行
+    search_names(index, "银行")      # every bank, names starting with it first
+    search_names(index, "6000")     # codes starting with 6000
+
+The index is saved next to the list (all_stocks_index.json) together with the list's size, mtime
+and hash, and rebuilt only when the list changes. Pinyin keys need the optional pypinyin package
+(pip install pypinyin); without it names and codes are still searchable, and the index is rebuilt
+once pypinyin becomes available.
+"""
+import bisect
+import csv
+import hashlib
+import json
+import os
+import re
+import unicodedata
+
+from crawler.jobs import atomic_write_json
+
+
+LIST_PATH = "output/all_stocks.csv"
+INDEX_VERSION = 1
+MAX_RESULTS = 20
+
+# rank of a match, best first
+EXACT, PREFIX, PINYIN_PREFIX, PINYIN_INNER, SUBSTRING = range(5)
+
+# (index path) -> (source size and mtime, index)
+_INDEX_CACHE = {}
+
+_CODE_QUERY = re.compile(r"^(?:(sh|sz|bj)\.?)?(\d{1,6})$")
+
+
+def index_path(list_path=LIST_PATH) -> str:
+    root, _ = os.path.splitext(list_path)
+    return root + "_index.json"
+
+
+def normalize(text: str) -> str:
+    """Full-width to half-width, lower case, no spaces or '*' (as in '*ST')"""
+    text = unicodedata.normalize("NFKC", str(text)).lower()
+    return "".join(ch for ch in text if not ch.isspace() and ch != "*")
+
+
+def _pinyin_funcs():
+    try:
+        from pypinyin import Style, lazy_pinyin
+    except ImportError:
+        return None
+    return (lambda name: lazy_pinyin(name),
+            lambda name: lazy_pinyin(name, style=Style.FIRST_LETTER))
+
+
+def _syllables(parts: list) -> list:
+    # punctuation and symbols come back from pypinyin unchanged; only letters and digits are kept
+    cleaned = (re.sub(r"[^0-9a-z]", "", normalize(part)) for part in parts)
+    return [part for part in cleaned if part]
+
+
+def _boundary_keys(syllables: list) -> list:
+    # 'pu fa yin hang' -> pufayinhang, fayinhang, yinhang, hang: a query matches from any syllable on
+    return ["".join(syllables[i:]) for i in range(len(syllables))]
+
+
+def _read_list(list_path: str) -> list:
+    with open(list_path, encoding="utf-8-sig", newline="") as f:
+        return [row for row in csv.DictReader(f) if row.get("code")]
+
+
+def _file_hash(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _source_signature(path: str):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def build_name_index(list_path=LIST_PATH) -> dict:
+    """
+    Index every row of the stock list
+    Returns:
+        {"entries": [[code, name, tradeStatus], ...],
+         "grams": {1- and 2-character fragment of a normalized name: [entry ids]},
+         "keys" / "ids": sorted prefix keys (code digits, pinyin and initials from each syllable)
+                         and the entry id of each, for bisect prefix lookups,
+         "starts": key positions that begin at the first syllable / first code digit}
+    """
+    rows = _read_list(list_path)
+    pinyin = _pinyin_funcs()
+    entries, grams, prefix = [], {}, []
+    for i, row in enumerate(rows):
+        code, name = row["code"], row.get("code_name", "")
+        entries.append([code, name, row.get("tradeStatus", "")])
+        text = normalize(name)
+        for gram in {text[j:j + n] for n in (1, 2) for j in range(len(text) - n + 1)}:
+            grams.setdefault(gram, []).append(i)
+        prefix.append((code.split(".")[-1], i, True))
+        if pinyin is not None and text:
+            full, initials = pinyin
+            for syllables in (_syllables(full(name)), _syllables(initials(name))):
+                prefix.extend((key, i, pos == 0) for pos, key in enumerate(_boundary_keys(syllables)))
+    prefix = sorted(set(prefix))
+    return {
+        "version": INDEX_VERSION,
+        "pinyin": pinyin is not None,
+        "entries": entries,
+        "grams": grams,
+        "keys": [key for key, _, _ in prefix],
+        "ids": [i for _, i, _ in prefix],
+        "starts": [pos for pos, (_, _, start) in enumerate(prefix) if start],
+    }
+
+
+def load_name_index(list_path=LIST_PATH, path=None) -> dict:
+    """
+    Index of the stock list, from memory, from the saved file, or rebuilt if the list changed
+    A list rewritten with the same content (same hash) keeps its index.
+    """
+    path = path or index_path(list_path)
+    signature = _source_signature(list_path)
+    cached = _INDEX_CACHE.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    index = None
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            index = json.load(f)
+        fresh = (index.get("version") == INDEX_VERSION
+                 and (index.get("pinyin") or _pinyin_funcs() is None)
+                 and (tuple(index.get("source_signature", ())) == signature
+                      or index.get("source_hash") == _file_hash(list_path)))
+        if not fresh:
+            index = None
+    if index is None:
+        index = build_name_index(list_path)
+        index["source_hash"] = _file_hash(list_path)
+        index["source_signature"] = list(signature)
+        atomic_write_json(index, path)
+    index["_starts"] = set(index["starts"])
+    index["_names"] = [normalize(name) for _, name, _ in index["entries"]]
+    _INDEX_CACHE[path] = (signature, index)
+    return index
+
+
+def _prefix_matches(index: dict, key: str) -> dict:
+    """entry id -> True if some key starting with `key` begins at the first syllable / code digit"""
+    keys, ids, starts = index["keys"], index["ids"], index["_starts"]
+    found = {}
+    lo = bisect.bisect_left(keys, key)
+    hi = bisect.bisect_left(keys, key + "\uffff", lo)
+    for pos in range(lo, hi):
+        found[ids[pos]] = found.get(ids[pos], False) or pos in starts
+    return found
+
+
+def _substring_matches(index: dict, text: str) -> list:
+    grams = index["grams"]
+    pieces = [text] if len(text) == 1 else [text[j:j + 2] for j in range(len(text) - 1)]
+    postings = [grams.get(piece) for piece in pieces]
+    if not all(postings):
+        return []
+    if len(postings) == 1:
+        return postings[0]
+    candidates = set(min(postings, key=len))
+    for ids in postings:
+        candidates.intersection_update(ids)
+    names = index["_names"]
+    return [i for i in candidates if text in names[i]]
+
+
+def search_names(index: dict, query: str, limit=MAX_RESULTS) -> list:
+    """
+    Stocks matching a name fragment, pinyin ('pufa', 'yinhang'), initials ('pfyh') or code
+    ('600000', 'sh.600', '600'), best first: exact name or code, name / code prefix, pinyin from
+    the first syllable, pinyin from a later syllable, name fragment elsewhere; ties go to shorter
+    names, then to listed (tradeStatus 1) stocks, then by code
+    Parameters:
+        limit: Most results returned (None: all)
+    Returns:
+        List of {"code", "code_name", "tradeStatus"} dicts
+    """
+    text = normalize(query)
+    if not text:
+        return []
+    entries = index["entries"]
+    best = {}
+
+    def offer(i, rank):
+        if rank < best.get(i, SUBSTRING + 1):
+            best[i] = rank
+
+    code_query = _CODE_QUERY.match(text)
+    if code_query:
+        market, digits = code_query.groups()
+        for i, start in _prefix_matches(index, digits).items():
+            code = entries[i][0]
+            if start and (market is None or code.startswith(market + ".")):
+                offer(i, EXACT if code.endswith("." + digits) else PREFIX)
+    if text.isascii() and text.isalnum() and not text.isdigit():
+        for i, start in _prefix_matches(index, text).items():
+            offer(i, PINYIN_PREFIX if start else PINYIN_INNER)
+    for i in _substring_matches(index, text):
+        name = index["_names"][i]
+        offer(i, EXACT if name == text else PREFIX if name.startswith(text) else SUBSTRING)
+
+    order = sorted(best, key=lambda i: (best[i], len(entries[i][1]), entries[i][2] != "1", entries[i][0]))
+    return [{"code": entries[i][0], "code_name": entries[i][1], "tradeStatus": entries[i][2]}
+            for i in order[:limit]]
+
+
+def complete_names(index: dict, prefix: str, limit: int = MAX_RESULTS) -> list:
+    """Names for autocompletion of a partly typed name, pinyin or code"""
+    return [row["code_name"] for row in search_names(index, prefix, limit)]
@@ -0,0 +1,134 @@
+"""
+Client of the local query daemon (analysis/query_server.py); standard library only, so a query
+costs an interpreter start and one socket round trip, not a pandas import and a panel load
+
+    python -m analysis.query_client limit_up --recent_days 10 --threshold 0.095
+    python -m analysis.query_client lookup --code sh.600000 --days 5
+    python -m analysis.query_client search --q pfyh
+
+    from analysis.query_client import query
+    rows = query("top_gainers", recent_days=30, top_n=10)
+"""
+import json
+import socket
+import sys
+
+
+SOCKET_PATH = "output/query.sock"
+# TCP fallback on platforms without Unix sockets
+DEFAULT_PORT = 8765
+
+
+def default_address(socket_path: str = None, port: int = None):
+    """Unix socket path, or ('127.0.0.1', port) when a port is given or Unix sockets are unavailable"""
+    if port is not None or not hasattr(socket, "AF_UNIX"):
+        return "127.0.0.1", port or DEFAULT_PORT
+    return socket_path or SOCKET_PATH
+
+
+def _connect(address, timeout: float) -> socket.socket:
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(address)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def request(payload: dict, address=None, timeout: float = 30.0) -> dict:
+    """Send one request and return the whole reply ({"ok": ..., "result" / "error": ..., "ms": ...})"""
+    address = address or default_address()
+    with _connect(address, timeout) as sock:
+        sock.sendall(json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n")
+        with sock.makefile("rb") as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError("Query server closed the connection without answering")
+    return json.loads(line)
+
+
+def query(op: str, address=None, timeout: float = 30.0, **params):
+    """
+    Run one query on the daemon and return its result (usually a list of row dicts)
+    Raises ConnectionError (OSError) if no daemon is listening, RuntimeError if the query failed.
+    """
+    reply = request({"op": op, **params}, address, timeout)
+    if not reply.get("ok"):
+        raise RuntimeError(reply.get("error", "query failed"))
+    return reply["result"]
+
+
+def server_available(address=None) -> bool:
+    try:
+        return request({"op": "ping"}, address, timeout=1.0).get("ok", False)
+    except (OSError, ValueError):
+        return False
+
+
+def _parse_value(text: str):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _print_rows(rows):
+    if not isinstance(rows, list) or not rows or not isinstance(rows[0], dict):
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+        return
+    columns = list(rows[0])
+    cells = [[str(row.get(c, "")) for c in columns] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(r, widths)))
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0] in ("-h", "--help"):
+        print(__doc__)
+        print("ops: ping, stats, limit_up, limit_down, top_gainers, range_gainers, limit_streaks, lookup, search, fundamentals")
+        print("options: --socket PATH | --port N, --json (raw reply), any --name value is passed as a parameter")
+        return 0
+    op, params, address, raw = argv[0], {}, None, False
+    i = 1
+    while i < len(argv):
+        key = argv[i].lstrip("-").replace("-", "_")
+        if key == "json":
+            raw = True
+            i += 1
+            continue
+        if i + 1 >= len(argv):
+            print(f"Missing value for {argv[i]}")
+            return 2
+        value = argv[i + 1]
+        if key == "socket":
+            address = value
+        elif key == "port":
+            address = default_address(port=int(value))
+        else:
+            params[key] = _parse_value(value)
+        i += 2
+
+    try:
+        reply = request({"op": op, **params}, address or default_address())
+    except OSError as e:
+        print(f"Query server not reachable ({e}); start it with: python -m analysis.query_server")
+        return 1
+    if raw:
+        print(json.dumps(reply, ensure_ascii=False, indent=2))
+    elif not reply.get("ok"):
+        print(f"Error: {reply.get('error')}")
+        return 1
+    else:
+        _print_rows(reply["result"])
+        print(f"({reply.get('ms', 0):.1f} ms on the server)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+"""
+Local query daemon: keeps the price panel, the fundamentals table and the stock name index in
+memory and answers screening queries for any number of clients (analysis/query_client.py)
+
+    python -m analysis.query_server [--socket output/query.sock | --port 8765]
+
+Listens on a Unix socket (127.0.0.1 TCP with --port, or where Unix sockets are unavailable).
+Protocol: one JSON object per line each way, several requests per connection allowed.
+    request  {"op": "limit_up", "recent_days": 10, "threshold": 0.095}
+    reply    {"ok": true, "result": [...], "ms": 2.4}  or  {"ok": false, "error": "..."}
+Before every query the store files are stat'ed (the same signature check as load_price_panel):
+after an update only new or changed fragments are read, and the panel is rebuilt in memory;
+otherwise the query runs straight on the arrays already loaded. Queries run on their own
+threads and take no lock; one thread at a time reloads, while the others keep answering from
+the data already loaded.
+"""
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from crawler import metrics
+from crawler.price_store import STORE_DIR
+from crawler.price_panel import load_price_panel, memory_footprint, panel_signature
+from analysis.query_client import SOCKET_PATH, default_address, server_available
+from analysis.screening import range_change_screen
+from analysis.stock_search import filter_limit_up, filter_limit_down, filter_top_gainers, filter_limit_streaks
+from analysis.fundamentals_store import FUNDAMENTALS_DIR, fundamentals_paths, read_fundamentals
+from analysis.name_index import LIST_PATH, load_name_index, search_names
+
+
+class QueryState:
+    """
+    The data the daemon serves, refreshed when the files behind it change
+    Every query stats the files (no lock); only when they changed does one thread reload, and
+    queries arriving meanwhile keep answering from the data already loaded.
+    """
+
+    def __init__(self, store_dir=STORE_DIR, data_folder="daily_data_history", fundamentals_dir=FUNDAMENTALS_DIR,
+                 list_path=LIST_PATH):
+        self.store_dir = store_dir
+        self.data_folder = data_folder
+        self.fundamentals_dir = fundamentals_dir
+        self.list_path = list_path
+        # resource -> (signature, value), and one reload lock per resource
+        self._loaded = {}
+        self._locks = {name: threading.Lock() for name in ("panel", "fundamentals", "names")}
+        self.started = time.time()
+        self.requests = {}
+        self.reloads = 0
+
+    def _current(self, name: str, signature, load):
+        loaded = self._loaded.get(name)
+        if loaded is not None and loaded[0] == signature:
+            return loaded[1]
+        lock = self._locks[name]
+        # somebody is reloading: answer from what is loaded instead of queueing behind the reload
+        if not lock.acquire(blocking=loaded is None):
+            return loaded[1]
+        try:
+            loaded = self._loaded.get(name)
+            if loaded is None or loaded[0] != signature:
+                loaded = (signature, load())
+                self._loaded[name] = loaded
+                if name == "panel":
+                    self.reloads += 1
+            return loaded[1]
+        finally:
+            lock.release()
+
+    def panel(self):
+        return self._current("panel", panel_signature(self.store_dir),
+                             lambda: load_price_panel(self.store_dir, self.data_folder))
+
+    def fundamentals_table(self) -> pd.DataFrame:
+        signature = tuple((path, os.stat(path).st_mtime_ns, os.stat(path).st_size)
+                          for path in fundamentals_paths(self.fundamentals_dir))
+        return self._current("fundamentals", signature,
+                             lambda: read_fundamentals(store_dir=self.fundamentals_dir))
+
+    def name_index(self):
+        """Search index of the full stock list, or None without output/all_stocks.csv"""
+        if not os.path.exists(self.list_path):
+            return None
+        st = os.stat(self.list_path)
+        return self._current("names", (st.st_mtime_ns, st.st_size), lambda: load_name_index(self.list_path))
+
+
+def _records(df: pd.DataFrame) -> list:
+    return df.to_dict(orient="records")
+
+
+def _json_default(value):
+    if isinstance(value, (np.integer, np.floating)):
+        return value.item()
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(value).strftime("%Y-%m-%d")
+    return str(value)
+
+
+def _require_panel(state: QueryState):
+    panel = state.panel()
+    if panel is None:
+        raise ValueError("No price data in the store")
+    return panel
+
+
+def op_ping(state: QueryState, **_):
+    panel = state.panel()
+    return {"pid": os.getpid(), "uptime_s": round(time.time() - state.started, 1),
+            "days": 0 if panel is None else len(panel.dates), "stocks": 0 if panel is None else len(panel.codes),
+            "last_date": "" if panel is None else pd.Timestamp(panel.dates[-1]).strftime("%Y-%m-%d")}
+
+
+def op_stats(state: QueryState, **_):
+    panel = state.panel()
+    footprint = memory_footprint(panel)
+    return {"requests": dict(state.requests), "reloads": state.reloads,
+            "panel_mb": round(footprint.get("panel_total", 0) / 2**20, 1),
+            "fragments_mb": round(footprint["fragments"] / 2**20, 1),
+            "fundamentals_rows": len(state.fundamentals_table())}
+
+
+def op_limit_up(state: QueryState, recent_days=30, threshold=0.098, **_):
+    return _records(filter_limit_up(recent_days=int(recent_days), threshold=float(threshold), panel=_require_panel(state)))
+
+
+def op_limit_down(state: QueryState, recent_days=30, threshold=-0.098, **_):
+    return _records(filter_limit_down(recent_days=int(recent_days), threshold=float(threshold),
+                                      panel=_require_panel(state)))
+
+
+def op_top_gainers(state: QueryState, recent_days=30, top_n=10, **_):
+    return _records(filter_top_gainers(recent_days=int(recent_days), top_n=int(top_n), panel=_require_panel(state)))
+
+
+def op_range_gainers(state: QueryState, recent_days=30, top_n=10, **_):
+    """Top-N by change from the first to the last close of the window (as find_top_gainers, without the file)"""
+    panel = _require_panel(state)
+    screen = range_change_screen(panel, int(recent_days), int(top_n))
+    labels = panel.labels()
+    return [{"Stock": labels[col], "Start Price": round(float(screen["start_price"][col]), 2),
+             "End Price": round(float(screen["end_price"][col]), 2),
+             "Change %": round(float(screen["change"][col]) * 100, 2)} for col in screen["order"]]
+
+
+def op_limit_streaks(state: QueryState, direction="up", min_streak=2, **_):
+    return _records(filter_limit_streaks(direction=direction, min_streak=int(min_streak), panel=_require_panel(state)))
+
+
+def _find_columns(panel, code=None, name=None, index=None) -> list:
+    if code:
+        return [i for i, c in enumerate(panel.codes) if c == code or c.endswith("." + str(code))]
+    if name and index is not None:
+        # name fragment, pinyin or initials, in the index's ranking
+        columns = {c: i for i, c in enumerate(panel.codes)}
+        ranked = search_names(index, str(name), limit=None)
+        return [columns[row["code"]] for row in ranked if row["code"] in columns]
+    if name:
+        return [i for i, c in enumerate(panel.codes) if name in panel.names.get(c, "")]
+    raise ValueError("lookup needs code or name")
+
+
+def op_lookup(state: QueryState, code=None, name=None, days=10, **_):
+    """Last `days` bars of the stocks matching a code ('sh.600000' or '600000') or a name (see op_search)"""
+    panel = _require_panel(state)
+    out = []
+    for col in _find_columns(panel, code, name, state.name_index() if name else None)[:20]:
+        rows = np.flatnonzero(~np.isnan(panel.close[:, col]))[-int(days):]
+        out.append({
+            "code": str(panel.codes[col]), "name": panel.names.get(panel.codes[col], ""),
+            "bars": [{"date": pd.Timestamp(panel.dates[r]).strftime("%Y-%m-%d"),
+                      **{f: round(float(getattr(panel, f)[r, col]), 4) for f in ("open", "high", "low", "close")},
+                      "volume": int(panel.volume[r, col])} for r in rows],
+        })
+    return out
+
+
+def op_search(state: QueryState, q="", limit=20, **_):
+    """Whole-market stocks matching a name fragment, pinyin, initials or code prefix, best first"""
+    index = state.name_index()
+    if index is None:
+        raise ValueError(f"No stock list at {state.list_path}")
+    return search_names(index, str(q), int(limit))
+
+
+def op_fundamentals(state: QueryState, code=None, columns=None, latest=True, **_):
+    """Reports of one stock (or every stock's latest report without a code), optionally only some columns"""
+    df = state.fundamentals_table()
+    if code:
+        df = df[(df["code"] == code) | df["code"].str.endswith("." + str(code))]
+    if latest:
+        df = df.groupby("code", sort=True).tail(1)
+    if columns:
+        columns = [columns] if isinstance(columns, str) else list(columns)
+        df = df[["code", "statDate", "pubDate"] + [c for c in columns if c in df.columns]]
+    return _records(df.reset_index(drop=True))
+
+
+OPS = {name[3:]: func for name, func in globals().items() if name.startswith("op_")}
+
+
+def handle(state: QueryState, payload: dict) -> dict:
+    start = time.perf_counter()
+    if not isinstance(payload, dict):
+        return {"ok": False, "error": f"Bad request: expected a JSON object, got {type(payload).__name__}"}
+    op = payload.pop("op", None)
+    func = OPS.get(op)
+    if func is None:
+        return {"ok": False, "error": f"Unknown op {op!r}; known: {', '.join(sorted(OPS))}"}
+    state.requests[op] = state.requests.get(op, 0) + 1
+    try:
+        with metrics.span(f"serve.{op}"):
+            result = func(state, **payload)
+    except Exception as e:
+        return {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    return {"ok": True, "result": result, "ms": (time.perf_counter() - start) * 1000}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                reply = handle(self.server.state, json.loads(line))
+            except ValueError as e:
+                reply = {"ok": False, "error": f"Bad request: {e}"}
+            self.wfile.write(json.dumps(reply, ensure_ascii=False, default=_json_default).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+
+def serve(address=None, store_dir=STORE_DIR, data_folder="daily_data_history", fundamentals_dir=FUNDAMENTALS_DIR):
+    """Load everything once, then answer queries until interrupted"""
+    address = address or default_address()
+    if server_available(address):
+        print(f"A query server is already listening on {address}")
+        return 1
+    state = QueryState(store_dir, data_folder, fundamentals_dir)
+    start = time.perf_counter()
+    panel = state.panel()
+    fundamentals = state.fundamentals_table()
+    index = state.name_index()
+    shape = "no price data" if panel is None else f"{len(panel.dates)} days x {len(panel.codes)} stocks"
+    names = 0 if index is None else len(index["entries"])
+    print(f"Loaded panel ({shape}), {len(fundamentals)} fundamentals rows and {names} stock names "
+          f"in {time.perf_counter() - start:.1f}s")
+
+    if isinstance(address, str):
+        if os.path.exists(address):
+            # left behind by a server that did not shut down cleanly (nothing answered above)
+            os.unlink(address)
+        os.makedirs(os.path.dirname(address) or ".", exist_ok=True)
+        server = _UnixServer(address, _Handler)
+    else:
+        server = _TCPServer(address, _Handler)
+    server.state = state
+    # `kill` stops the server like Ctrl-C, so the socket file is removed
+    signal.signal(signal.SIGTERM, _interrupt)
+    print(f"Query server listening on {address} (Ctrl-C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if isinstance(address, str) and os.path.exists(address):
+            os.unlink(address)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=None, help=f"Unix socket path (default {SOCKET_PATH})")
+    parser.add_argument("--port", type=int, default=None, help="Listen on 127.0.0.1:PORT instead")
+    parser.add_argument("--store-dir", default=STORE_DIR)
+    parser.add_argument("--data-folder", default="daily_data_history")
+    parser.add_argument("--fundamentals-dir", default=FUNDAMENTALS_DIR)
+    args = parser.parse_args()
+    return serve(default_address(args.socket, args.port), args.store_dir, args.data_folder, args.fundamentals_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
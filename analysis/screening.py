@@ -0,0 +1,243 @@
+import numpy as np
+
+
+def _tail_block(panel, depth: int):
+    """
+    Rank each stock's bars from the end, looking only as far back as needed to see `depth` bars
+    Returns:
+        rows: slice of panel rows examined (a tail of the history)
+        valid: bool array for those rows, True where the stock has a bar
+        rank_from_end: int32 array, 1 on a stock's last bar, 2 on the one before, ...
+    The tail doubles until every stock either has `depth` bars in it or the whole history is used,
+    so long suspensions are handled without ranking the full 20-year history every time.
+    """
+    n_rows = len(panel.dates)
+    total = np.count_nonzero(~np.isnan(panel.close), axis=0)
+    need = np.minimum(total, depth)
+    k = min(n_rows, max(depth * 2, 1))
+    while True:
+        valid = ~np.isnan(panel.close[n_rows - k:])
+        rank_from_end = np.cumsum(valid[::-1], axis=0, dtype=np.int32)[::-1]
+        if k == n_rows or (k and (rank_from_end[0] >= need).all()):
+            break
+        k = min(n_rows, k * 2)
+    return slice(n_rows - k, n_rows), valid, rank_from_end
+
+
+def window_mask(panel, recent_days: int):
+    """
+    Mark the last `recent_days` bars each stock actually traded, for all stocks at once
+    Returns:
+        rows: slice of panel rows the mask refers to
+        mask: bool array (rows × stocks), True inside each stock's window
+        full: bool array (stocks,), True if the stock has at least `recent_days` bars
+    """
+    rows, valid, rank_from_end = _tail_block(panel, recent_days)
+    mask = valid & (rank_from_end <= recent_days)
+    full = np.count_nonzero(mask, axis=0) >= recent_days
+    # trim leading rows that no stock's window reaches
+    used = np.flatnonzero(mask.any(axis=1))
+    first = used[0] if len(used) else mask.shape[0]
+    return slice(rows.start + first, rows.stop), mask[first:], full
+
+
+def intraday_move(panel, rows: slice = slice(None)) -> np.ndarray:
+    """
+    (close - open) / open for every bar in `rows`, NaN where there is no bar
+    Always float64, so a compact (float32) panel adds only its storage rounding to the result.
+    """
+    opens = panel.open[rows].astype(np.float64, copy=False)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (panel.close[rows].astype(np.float64, copy=False) - opens) / opens
+
+
+def threshold_screen(panel, recent_days: int, threshold: float, direction: str = "up") -> dict:
+    """
+    Count bars beyond a move threshold in each stock's recent window, across the whole panel
+    Parameters:
+        direction: 'up' for move >= threshold, 'down' for move <= threshold
+    Returns dict of:
+        rows: slice of panel rows covered by the windows
+        move: move matrix for those rows
+        hits: bool matrix, True where a bar is inside the window and beyond the threshold
+        counts: hits per stock (0 for stocks with fewer than `recent_days` bars)
+        window_start / window_end: first and last date of the common window
+    """
+    rows, mask, full = window_mask(panel, recent_days)
+    move = intraday_move(panel, rows)
+    with np.errstate(invalid="ignore"):
+        beyond = move >= threshold if direction == "up" else move <= threshold
+    hits = beyond & mask & full
+    dates = panel.dates[rows]
+    return {
+        "rows": rows,
+        "move": move,
+        "hits": hits,
+        "counts": hits.sum(axis=0),
+        "window_start": dates[0] if len(dates) else None,
+        "window_end": dates[-1] if len(dates) else None,
+    }
+
+
+def top_n_desc(values: np.ndarray, top_n: int) -> np.ndarray:
+    """
+    Column indexes of the `top_n` largest values, largest first (NaN never selected)
+    Uses a partial sort, so only the selected entries are fully ordered.
+    """
+    candidates = np.flatnonzero(~np.isnan(values))
+    if top_n <= 0 or len(candidates) == 0:
+        return np.array([], dtype=int)
+    if len(candidates) > top_n:
+        part = np.argpartition(-values[candidates], top_n - 1)[:top_n]
+        candidates = candidates[part]
+    # ties keep panel (code) order
+    return candidates[np.lexsort((candidates, -values[candidates]))]
+
+
+def max_move_screen(panel, recent_days: int, top_n: int) -> dict:
+    """
+    Best single-day move per stock in its recent window, and the top-N stocks by that move
+    Returns dict of:
+        best_row: absolute panel row of each stock's best day (-1 if no valid bar)
+        best_move: the move on that day (NaN if no valid bar)
+        order: column indexes of the top-N stocks, best first
+    """
+    rows, mask, _ = window_mask(panel, recent_days)
+    move = np.where(mask, intraday_move(panel, rows), -np.inf)
+    move = np.where(np.isnan(move), -np.inf, move)
+
+    best = np.argmax(move, axis=0)
+    best_move = move[best, np.arange(move.shape[1])]
+    has_bar = np.isfinite(best_move)
+    best_move = np.where(has_bar, best_move, np.nan)
+    best_row = np.where(has_bar, best + rows.start, -1)
+    return {
+        "best_row": best_row,
+        "best_move": best_move,
+        "order": top_n_desc(best_move, top_n),
+    }
+
+
+def range_change_screen(panel, recent_days: int, top_n: int) -> dict:
+    """
+    Close-to-close change over the last `recent_days` trading days of each stock, and the top-N
+    Returns dict of:
+        start_price / end_price: closes `recent_days` bars ago and on the last bar (NaN if too short)
+        change: (end - start) / start
+        order: column indexes of the top-N stocks, best first
+    """
+    rows, valid, rank_from_end = _tail_block(panel, recent_days + 1)
+    close = panel.close[rows].astype(np.float64, copy=False)
+    cols = np.arange(close.shape[1])
+
+    start_at = valid & (rank_from_end == recent_days + 1)
+    end_at = valid & (rank_from_end == 1)
+    long_enough = start_at.any(axis=0)
+
+    start_price = np.where(long_enough, close[np.argmax(start_at, axis=0), cols], np.nan)
+    end_price = np.where(long_enough, close[np.argmax(end_at, axis=0), cols], np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        change = np.where(start_price != 0, (end_price - start_price) / start_price, np.nan)
+    return {
+        "start_price": start_price,
+        "end_price": end_price,
+        "change": change,
+        "order": top_n_desc(change, top_n),
+    }
+
+
+# daily price limits by board: STAR (688/689) and ChiNext (300/301) ±20% (ST included),
+# main-board ST ±5%, every other stock ±10%
+WIDE_LIMIT_PREFIXES = ("688", "689", "300", "301")
+# a close within this much of the limit counts as limit-up/down (prices are rounded to the cent,
+# and forward-adjusted history shifts them slightly)
+LIMIT_TOLERANCE = 0.002
+
+
+def board_limits(codes, names: dict) -> np.ndarray:
+    """
+    Daily price limit of each stock (fraction, e.g. 0.1) from its code and current name
+    Parameters:
+        codes: stock codes like 'sh.688001'
+        names: code → company name; a name containing 'ST' marks special treatment
+    """
+    limits = np.full(len(codes), 0.1)
+    for i, code in enumerate(codes):
+        if code[3:6] in WIDE_LIMIT_PREFIXES:
+            limits[i] = 0.2
+        elif "ST" in names.get(code, ""):
+            limits[i] = 0.05
+    return limits
+
+
+def prev_close_returns(panel) -> np.ndarray:
+    """
+    close / previous close - 1 for every bar of the panel (float64)
+    The previous close is the stock's last bar before, so a suspension does not break the chain.
+    NaN where there is no bar and on each stock's first bar.
+    """
+    close = panel.close
+    n_rows = close.shape[0]
+    valid = ~np.isnan(close)
+    last = np.where(valid, np.arange(n_rows, dtype=np.int32)[:, None], np.int32(-1))
+    np.maximum.accumulate(last, axis=0, out=last)
+    prev = np.empty_like(last)
+    prev[0] = -1
+    prev[1:] = last[:-1]
+    prev_close = np.take_along_axis(close, np.maximum(prev, 0), axis=0).astype(np.float64)
+    prev_close[prev < 0] = np.nan
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return close / prev_close - 1
+
+
+def limit_streak_screen(panel, direction: str = "up", tolerance: float = LIMIT_TOLERANCE) -> dict:
+    """
+    Consecutive limit-up (or limit-down) runs of every stock over the whole history, in one pass
+    A bar is a limit bar when its prev-close return reaches the stock's board limit less `tolerance`.
+    Runs count trading bars, so suspended days neither extend nor break a streak.
+    Returns dict of:
+        limits: board limit per stock
+        ret: prev-close return matrix
+        hits: bool matrix, True on limit bars
+        run: int32 matrix, length of the streak ending at each bar (0 off-streak; carried over suspensions)
+        current: streak length at each stock's last bar (0 if that bar is not a limit bar)
+        current_start: panel row where the current streak began (-1 if none)
+        max: longest streak in the history
+        max_start / max_end: panel rows of the first longest streak (-1 if none)
+        last_row: row of each stock's last bar (-1 for stocks without bars)
+    """
+    limits = board_limits(panel.codes, panel.names)
+    ret = prev_close_returns(panel)
+    valid = ~np.isnan(panel.close)
+    with np.errstate(invalid="ignore"):
+        hits = ret >= limits - tolerance if direction == "up" else ret <= -(limits - tolerance)
+
+    n_rows = len(panel.dates)
+    row_index = np.arange(n_rows, dtype=np.int32)[:, None]
+    count = np.cumsum(hits, axis=0, dtype=np.int32)
+    # a traded bar off the limit resets the run; suspended rows leave it as it was
+    reset = np.where(valid & ~hits, count, np.int32(0))
+    np.maximum.accumulate(reset, axis=0, out=reset)
+    run = count - reset
+    start = np.where(hits & (run == 1), row_index, np.int32(-1))
+    np.maximum.accumulate(start, axis=0, out=start)
+
+    cols = np.arange(run.shape[1])
+    has_bar = valid.any(axis=0)
+    last_row = np.where(has_bar, n_rows - 1 - np.argmax(valid[::-1], axis=0), -1)
+    current = np.where(has_bar, run[np.maximum(last_row, 0), cols], 0)
+    current_start = np.where(current > 0, start[np.maximum(last_row, 0), cols], -1)
+    max_end = np.argmax(run, axis=0)
+    longest = run[max_end, cols]
+    return {
+        "limits": limits,
+        "ret": ret,
+        "hits": hits,
+        "run": run,
+        "current": current,
+        "current_start": current_start,
+        "max": longest,
+        "max_start": np.where(longest > 0, start[max_end, cols], -1),
+        "max_end": np.where(longest > 0, max_end, -1),
+        "last_row": last_row,
+    }
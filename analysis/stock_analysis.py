@@ -6,53 +6,47 @@ from tqdm import tqdm
 import matplotlib
 import matplotlib.pyplot as plt
 
+from crawler.jobs import atomic_write_csv, create_job, load_job, record_units
+from crawler.session import call
+from crawler.decode import decode_result
+from analysis.financial_fetch import (
+    FINANCIAL_QUERIES, fetch_financial_table, assemble_quarter, fetch_quarters, empty_cache_path,
+)
+from analysis.fundamentals_store import (
+    FUNDAMENTALS_DIR,
+    quarter_end,
+    normalize_quarter,
+    upsert_fundamentals,
+    read_fundamentals,
+    stored_quarters,
+    fundamentals_codes,
+    ensure_fundamentals_store,
+)
+from analysis.chart_render import FIELD_CATEGORIES, FIGURE_DIR, render_stock_charts
+from analysis.name_index import load_name_index, search_names, complete_names
+
 matplotlib.rcParams['font.sans-serif'] = ['Microsoft YaHei', 'SimHei', 'Arial Unicode MS']
 matplotlib.rcParams['axes.unicode_minus'] = False
 
-def download_quarterly_financials(stock_code: str, year: int, quarter: int, save_folder="output/financial_data") -> pd.DataFrame:
-    def query_data(query_func, name, **kwargs):
-        rs = query_func(**kwargs)
-        if rs.error_code != '0':
-            print(f"Error: {stock_code} - {year}Q{quarter} - {name} failed: {rs.error_msg}")
-            return pd.DataFrame()
-        data = []
-        while rs.next():
-            data.append(rs.get_row_data())
-        return pd.DataFrame(data, columns=rs.fields)
-
-    os.makedirs(save_folder, exist_ok=True)
-
-    profit_df  = query_data(bs.query_profit_data,    "profitability", code=stock_code, year=year, quarter=quarter)
-    op_df      = query_data(bs.query_operation_data, "operational",    code=stock_code, year=year, quarter=quarter)
-    growth_df  = query_data(bs.query_growth_data,    "growth",         code=stock_code, year=year, quarter=quarter)
-    balance_df = query_data(bs.query_balance_data,   "solvency",       code=stock_code, year=year, quarter=quarter)
-    cash_df    = query_data(bs.query_cash_flow_data, "cashflow",       code=stock_code, year=year, quarter=quarter)
-    dupont_df  = query_data(bs.query_dupont_data,    "dupont",         code=stock_code, year=year, quarter=quarter)
-
-    def tag(df, prefix):
-        return df.add_prefix(prefix + "_") if not df.empty else pd.DataFrame()
-
-    merged = pd.concat([
-        tag(profit_df,  "profit"),
-        tag(op_df,      "operation"),
-        tag(growth_df,  "growth"),
-        tag(balance_df, "balance"),
-        tag(cash_df,    "cash"),
-        tag(dupont_df,  "dupont")
-    ], axis=1)
+def download_quarterly_financials(stock_code: str, year: int, quarter: int, store_dir=FUNDAMENTALS_DIR) -> pd.DataFrame:
+    def query_data(query_name, name):
+        try:
+            return fetch_financial_table(query_name, stock_code, year, quarter)
+        except RuntimeError as e:
+            print(f"Error: {stock_code} - {year}Q{quarter} - {name} failed: {e}")
+            return None
+
+    tables = {prefix: query_data(query_name, name) for prefix, query_name, name in FINANCIAL_QUERIES}
+    failed = [prefix for prefix, table in tables.items() if table is None]
+    if failed:
+        print(f"Not saved: {stock_code} {year}Q{quarter} is incomplete ({', '.join(failed)} failed), try again later.")
+        return pd.DataFrame()
+    merged = assemble_quarter(tables, year, quarter)
 
     if merged.empty:
         return pd.DataFrame()
 
-    if not profit_df.empty and "statDate" in profit_df.columns:
-        merged["statDate"] = profit_df["statDate"]
-    elif not op_df.empty and "statDate" in op_df.columns:
-        merged["statDate"] = op_df["statDate"]
-    else:
-        merged["statDate"] = f"{year}Q{quarter}"
-
-    filename = os.path.join(save_folder, f"{stock_code}_{year}_Q{quarter}.csv")
-    merged.to_csv(filename, index=False, encoding="utf-8-sig")
+    upsert_fundamentals(normalize_quarter(merged, stock_code, year, quarter), store_dir)
     return merged
 
 def batch_download_financials():
@@ -98,130 +92,140 @@ def batch_download_financials():
                 continue
             quarters.append((y, q))
 
-    os.makedirs("output/financial_data", exist_ok=True)
+    workers_input = input("Parallel baostock sessions (default 1): ").strip()
+    workers = int(workers_input) if workers_input.isdigit() and int(workers_input) > 0 else 1
+
+    run_financial_download(stock_list, quarters, workers=workers)
+
+
+def financial_unit(code: str, year: int, quarter) -> str:
+    """Job journal key of one (stock, quarter) download"""
+    return f"{code}|{year}|{quarter}"
+
+
+def run_financial_download(stock_list: list, quarters: list, job_id=None, workers=1, requests_per_second=20.0,
+                           retries=2, flush_every=200, store_dir=FUNDAMENTALS_DIR, queries=None):
+    """
+    Download quarters for many stocks into the fundamentals table
+    The six statement queries of every (stock, quarter) are scheduled across `workers` baostock
+    sessions with a shared rate limit and per-call retry (workers=1 uses the current session).
+    Quarters already in the table are skipped. New ones are upserted every `flush_every` quarters
+    and only journaled as done once written, so an interrupted run loses at most one batch.
+    Quarters with a statement query that still failed after its retries are journaled as failed
+    and not written, so resuming the job asks for them again.
+    Every run is journaled under output/jobs/; with `job_id`, only its unfinished units are redone.
+    `queries` replaces the baostock module (e.g. crawler.replay.ReplayBaostock for offline runs).
+    """
+    if job_id is None:
+        units = [financial_unit(code, y, q) for code in stock_list for y, q in quarters]
+        job_id = create_job("financials", {"stocks": stock_list, "quarters": quarters}, units)
+        print(f"Download job journal: {job_id}")
+        pending = set(units)
+    else:
+        pending = set(load_job(job_id)["pending"])
+        # journals written before the fundamentals table also hold a per-stock merge step
+        legacy = [u for u in pending if u.endswith("|all|merge")]
+        if legacy:
+            record_units(job_id, legacy)
 
-    total_tasks = len(stock_list) * len(quarters)
-    pbar = tqdm(total=total_tasks, desc="Downloading")
-    success_quarters = 0
-    success_stocks = 0
+    ensure_fundamentals_store(store_dir=store_dir)
+    stored = stored_quarters(stock_list, store_dir)
 
+    to_fetch = []
+    already = []
     for code in stock_list:
         for y, q in quarters:
-            filename = f"{code}_{y}_Q{q}.csv"
-            fpath = os.path.join("output", "financial_data", filename)
-
-            if os.path.exists(fpath):
-                try:
-                    df_old = pd.read_csv(fpath)
-                    if not df_old.empty:
-                        pbar.update(1)
-                        success_quarters += 1
-                        continue
-                except:
-                    pass
+            unit = financial_unit(code, y, q)
+            if unit not in pending:
+                continue
+            if (code, quarter_end(y, q)) in stored:
+                already.append(unit)
+            else:
+                to_fetch.append((code, y, q))
+    if already:
+        record_units(job_id, already)
+
+    success_quarters = len(already)
+    failed_quarters = 0
+    batch = []
+    batch_units = []
+
+    def flush():
+        if not batch_units:
+            return
+        if batch:
+            upsert_fundamentals(pd.concat(batch, ignore_index=True), store_dir)
+        record_units(job_id, batch_units)
+        batch.clear()
+        batch_units.clear()
 
+    pbar = tqdm(total=len(to_fetch), desc="Downloading")
+    try:
+        for code, y, q, df, errors in fetch_quarters(to_fetch, workers=workers, requests_per_second=requests_per_second,
+                                             retries=retries, queries=queries,
+                                             empty_cache=empty_cache_path(store_dir)):
+            unit = financial_unit(code, y, q)
+            if errors:
+                # not written and left pending in the journal, so a resume asks for it again
+                error = "; ".join(f"{prefix}: {message}" for prefix, message in sorted(errors.items()))
+                record_units(job_id, [unit], "failed", error)
+                failed_quarters += 1
+                pbar.update(1)
+                continue
             try:
-                df = download_quarterly_financials(code, y, q)
-                if df is not None and not df.empty:
+                rows = normalize_quarter(df, code, y, q)
+                if not rows.empty:
+                    batch.append(rows)
                     success_quarters += 1
+                batch_units.append(unit)
             except Exception as e:
                 print(f"Error: {code} {y}Q{q} - {e}")
+                record_units(job_id, [unit], "failed", str(e))
             pbar.update(1)
 
-        try:
-            merge_financial_quarters(code)
-            success_stocks += 1
-        except Exception as e:
-            print(f"Warning: merge failed - {code} - {e}")
-
-        try:
-            clean_financial_dates(code)
-            print(f"Saved to output/{code}_cleaned.csv")
-        except Exception as e:
-            print(f"Warning: failed to clean date - {code} - {e}")
-
-    pbar.close()
-    print(f"\nCompleted: {success_quarters} quarters downloaded.")
-    print(f"{success_stocks} stock files merged and saved.")
-
-def merge_financial_quarters(code: str, folder="output/financial_data"):
-    files = [
-        f for f in os.listdir(folder)
-        if f.startswith(f"{code}_") and f.endswith(".csv")
-    ]
-
-    if not files:
-        print(f"Warning: no quarterly files found for {code}")
-        return
-
-    dataframes = []
-    for f in files:
-        try:
-            path = os.path.join(folder, f)
-            df = pd.read_csv(path)
-            if not df.empty:
-                dataframes.append(df)
-        except Exception as e:
-            print(f"Warning: skipped corrupted file {f} - {e}")
-
-    if not dataframes:
-        print(f"Warning: all quarterly data invalid for {code}")
-        return
+            if len(batch_units) >= flush_every:
+                flush()
+    finally:
+        flush()
+        pbar.close()
 
-    df_all = pd.concat(dataframes, ignore_index=True)
+    print(f"\nCompleted: {success_quarters} quarters in the fundamentals table ({store_dir}).")
+    if failed_quarters:
+        print(f"{failed_quarters} quarters failed and were not saved; resume job {job_id} to retry them.")
 
-    if "statDate" in df_all.columns:
-        try:
-            df_all["statDate"] = pd.to_datetime(df_all["statDate"])
-            df_all = df_all.sort_values("statDate")
-        except Exception as e:
-            print(f"Warning: sorting failed - {code} - {e}")
-    else:
-        print(f"Warning: no statDate found in {code}")
-
-    merged_path = os.path.join(folder, f"{code}.csv")
-    df_all.to_csv(merged_path, index=False, encoding="utf-8-sig")
-    print(f"Merged file saved: {merged_path}")
 
-def clean_financial_dates(code: str, input_folder="output/financial_data", output_folder="output"):
-    input_path = os.path.join(input_folder, f"{code}.csv")
-    if not os.path.exists(input_path):
-        print(f"Error: file not found - {input_path}")
+def resume_financial_job(job_id: str, workers=1):
+    """Rerun only the unfinished units of a journaled financial download"""
+    job = load_job(job_id)
+    if not job["pending"]:
+        print(f"Job {job_id} is already complete.")
         return
+    print(f"Resuming {job_id}: {len(job['pending'])} of {len(job['units'])} units left.")
+    quarters = [tuple(q) for q in job["params"]["quarters"]]
+    run_financial_download(job["params"]["stocks"], quarters, job_id=job_id, workers=workers)
 
-    df = pd.read_csv(input_path)
-
-    stat_cols = [col for col in df.columns if "statDate" in col]
-    pub_cols = [col for col in df.columns if "pubDate" in col]
 
-    stat_val = None
-    for col in stat_cols:
-        if df[col].notna().sum() > 0:
-            stat_val = df[col]
-            break
-
-    pub_val = None
-    for col in pub_cols:
-        if df[col].notna().sum() > 0:
-            pub_val = df[col]
-            break
-
-    if stat_val is not None:
-        df["statDate"] = stat_val
-    if pub_val is not None:
-        df["pubDate"] = pub_val
+def _enable_name_completion(index):
+    """Complete stock names on Tab where readline exists; returns a function undoing it"""
+    try:
+        import readline
+    except ImportError:
+        return lambda: None
+    previous = readline.get_completer(), readline.get_completer_delims()
 
-    drop_cols = [col for col in stat_cols + pub_cols if col in df.columns and col not in ["statDate", "pubDate"]]
-    df.drop(columns=drop_cols, inplace=True)
+    def complete(text, state):
+        options = complete_names(index, text)
+        return options[state] if state < len(options) else None
 
-    new_cols = [c for c in ["statDate", "pubDate"] if c in df.columns]
-    rest_cols = [c for c in df.columns if c not in new_cols]
-    df = df[new_cols + rest_cols]
+    readline.set_completer(complete)
+    # the whole line is the search text
+    readline.set_completer_delims("")
+    readline.parse_and_bind("tab: complete")
 
-    os.makedirs(output_folder, exist_ok=True)
-    output_path = os.path.join(output_folder, f"{code}_cleaned.csv")
-    df.to_csv(output_path, index=False, encoding="utf-8-sig")
-    print(f"Cleaned file saved: {output_path}")
+    def restore():
+        readline.set_completer(previous[0])
+        readline.set_completer_delims(previous[1])
+    return restore
 
 
 def search_and_save_stock_code(
@@ -236,43 +240,35 @@ def search_and_save_stock_code(
         update_choice = input("Update stock list? (y/n): ").strip().lower()
         if update_choice == "y":
             print("Fetching full market stock list...")
-            rs = bs.query_all_stock()
-            data_list = []
-            while (rs.error_code == '0') & rs.next():
-                data_list.append(rs.get_row_data())
-            df = pd.DataFrame(data_list, columns=rs.fields)
-            os.makedirs(os.path.dirname(list_path), exist_ok=True)
-            df.to_csv(list_path, index=False, encoding="utf-8-sig")
+            df = decode_result(call(bs.query_all_stock), "query_all_stock")
+            atomic_write_csv(df, list_path)
             print(f"Stock list updated and saved to: {list_path}")
         else:
             print("Using local cached stock list.")
-            df = pd.read_csv(list_path)
     else:
         print("No local stock list found. Fetching for the first time...")
-        rs = bs.query_all_stock()
-        data_list = []
-        while (rs.error_code == '0') & rs.next():
-            data_list.append(rs.get_row_data())
-        df = pd.DataFrame(data_list, columns=rs.fields)
-        os.makedirs(os.path.dirname(list_path), exist_ok=True)
-        df.to_csv(list_path, index=False, encoding="utf-8-sig")
+        df = decode_result(call(bs.query_all_stock), "query_all_stock")
+        atomic_write_csv(df, list_path)
         print(f"Stock list saved to: {list_path}")
 
+    index = load_name_index(list_path)
+    if not index["pinyin"]:
+        print("Tip: pip install pypinyin to also search by pinyin and initials (e.g. pfyh).")
+    restore_completion = _enable_name_completion(index)
     selected_codes = set()
 
     while True:
-        keyword = input("\nEnter partial company name in Chinese (or 'q' to quit): ").strip()
+        keyword = input("\nEnter name, pinyin, initials or code (Tab completes, 'q' to quit): ").strip()
         if keyword.lower() in ["q", "quit", "exit"]:
             break
 
-        match_df = df[df["code_name"].str.contains(keyword)]
-        if match_df.empty:
+        matches = search_names(index, keyword, limit=None)
+        if not matches:
             print("No match found, try another keyword.")
             continue
 
         print("\nMatch results:")
-        match_df = match_df.reset_index(drop=True)
-        for idx, row in match_df.iterrows():
+        for idx, row in enumerate(matches):
             print(f"{idx}. {row['code_name']} ({row['code']})")
 
         choice = input("Enter index(es) to save (e.g. 0,2,4), or press Enter to skip: ").strip()
@@ -281,8 +277,8 @@ def search_and_save_stock_code(
                 indexes = [int(x.strip()) for x in choice.split(",") if x.strip().isdigit()]
                 added = []
                 for i in indexes:
-                    if 0 <= i < len(match_df):
-                        code = match_df.loc[i, "code"]
+                    if 0 <= i < len(matches):
+                        code = matches[i]["code"]
                         selected_codes.add(code)
                         added.append(code)
                     else:
@@ -293,6 +289,7 @@ def search_and_save_stock_code(
                     print("No codes saved this round.")
             except Exception as e:
                 print(f"Invalid input: {e}. No codes saved.")
+    restore_completion()
 
     if selected_codes:
         os.makedirs(os.path.dirname(save_path), exist_ok=True)
@@ -339,84 +336,31 @@ def get_time_range_from_user(df):
     return start_date, end_date
 
 
-def function_plot_financial_metric(folder="output"):
-
-    field_categories = {
-        "Profitability": {
-            "profit_roeAvg": ("ROE (%)", "Net Profit / Avg. Net Assets"),
-            "profit_npMargin": ("Net Profit Margin (%)", "Net Profit / Revenue"),
-            "profit_gpMargin": ("Gross Margin (%)", "Gross Profit / Revenue"),
-            "profit_netProfit": ("Net Profit", "Total Profit - Tax"),
-            "profit_epsTTM": ("EPS (Yuan)", "Net Profit / Total Shares"),
-        },
-        "Operational Efficiency": {
-            "operation_NRTurnRatio": ("AR Turnover", "Net Sales / Avg. AR"),
-            "operation_NRTurnDays": ("AR Turnover Days", "365 / AR Turnover"),
-            "operation_INVTurnRatio": ("Inventory Turnover", "COGS / Avg. Inventory"),
-            "operation_INVTurnDays": ("Inventory Turnover Days", "365 / Inventory Turnover"),
-            "operation_CATurnRatio": ("Current Asset Turnover", "Revenue / Avg. Current Assets"),
-            "operation_AssetTurnRatio": ("Total Asset Turnover", "Revenue / Avg. Total Assets"),
-        },
-        "Growth": {
-            "growth_YOYEquity": ("Equity YoY (%)", "(Current - Prev) / Prev"),
-            "growth_YOYAsset": ("Assets YoY (%)", "(Current - Prev) / Prev"),
-            "growth_YOYNI": ("Net Profit YoY (%)", "(Current - Prev) / Prev"),
-            "growth_YOYEPSBasic": ("EPS YoY (%)", "(Current - Prev) / Prev"),
-            "growth_YOYPNI": ("Non-recurring Net Profit YoY (%)", "(Current - Prev) / Prev"),
-        },
-        "Solvency": {
-            "balance_currentRatio": ("Current Ratio", "Current Assets / Current Liabilities"),
-            "balance_quickRatio": ("Quick Ratio", "Quick Assets / Current Liabilities"),
-            "balance_cashRatio": ("Cash Ratio", "Cash / Current Liabilities"),
-            "balance_YOYLiability": ("Liability YoY", "(Current - Prev) / Prev"),
-            "balance_liabilityToAsset": ("Debt-to-Asset Ratio", "Total Liabilities / Total Assets"),
-            "balance_assetToEquity": ("Equity Multiplier", "Total Assets / Shareholder Equity"),
-        },
-        "Cash Flow": {
-            "cash_CAToAsset": ("Current Assets / Total Assets", "Current Assets / Total Assets"),
-            "cash_NCAToAsset": ("Non-Current Assets / Total", "Non-Current Assets / Total Assets"),
-            "cash_tangibleAssetToAsset": ("Tangible / Total Assets", "Tangible Assets / Total"),
-            "cash_ebitToInterest": ("EBIT / Interest", "EBIT / Interest Expense"),
-            "cash_CFOToOR": ("Operating CF / Revenue", "Operating Cash Flow / Revenue"),
-            "cash_CFOToNP": ("Operating CF / Net Profit", "OCF / Net Profit"),
-            "cash_CFOToGr": ("Operating CF / Capex", "OCF / Capital Expenditure"),
-        },
-        "DuPont Analysis": {
-            "dupont_dupontROE": ("DuPont ROE", "Net Profit / Equity"),
-            "dupont_dupontAssetStoEquity": ("Equity Multiplier", "Assets / Equity"),
-            "dupont_dupontAssetTurn": ("Asset Turnover", "Revenue / Assets"),
-            "dupont_dupontPnitoni": ("Net Profit Margin", "Net Profit / Revenue"),
-            "dupont_dupontNitogr": ("Net Margin", "Net Profit / Revenue"),
-            "dupont_dupontTaxBurden": ("Tax Burden", "Net Profit / Pre-Tax Profit"),
-            "dupont_dupontIntburden": ("Interest Burden", "Pre-Tax Profit / EBIT"),
-            "dupont_dupontEbittogr": ("EBIT Margin", "EBIT / Revenue"),
-        }
-    }
-
-    files = [f for f in os.listdir(folder) if f.endswith("_cleaned.csv")]
-    if not files:
-        print("No cleaned CSV files found in directory.")
-        return
+def choose_fundamentals_stock(store_dir=FUNDAMENTALS_DIR):
+    """List the stocks in the fundamentals table and return the one the user picks (None if invalid)"""
+    ensure_fundamentals_store(store_dir=store_dir)
+    codes = fundamentals_codes(store_dir)
+    if not codes:
+        print("No financial data found. Download some quarters first.")
+        return None
 
-    print("\nAvailable stock files:")
-    for idx, f in enumerate(files):
-        print(f"{idx}. {f}")
-    f_idx = input("Enter file index to plot: ").strip()
-    if not f_idx.isdigit() or int(f_idx) >= len(files):
+    print("\nAvailable stocks:")
+    for idx, code in enumerate(codes):
+        print(f"{idx}. {code}")
+    f_idx = input("Enter stock index to plot: ").strip()
+    if not f_idx.isdigit() or int(f_idx) >= len(codes):
         print("Invalid index input.")
-        return
+        return None
+    return codes[int(f_idx)]
+
 
-    filename = files[int(f_idx)]
-    filepath = os.path.join(folder, filename)
-    code = filename.replace("_cleaned.csv", "")
+def function_plot_financial_metric(store_dir=FUNDAMENTALS_DIR):
 
-    df = pd.read_csv(filepath)
-    if "statDate" not in df.columns:
-        print("statDate column not found in file.")
+    code = choose_fundamentals_stock(store_dir)
+    if code is None:
         return
 
-    df["statDate"] = pd.to_datetime(df["statDate"], errors="coerce")
-    df = df.dropna(subset=["statDate"])
+    df = read_fundamentals(codes=[code], store_dir=store_dir)
     if df.empty:
         print("No valid statDate data.")
         return
@@ -426,7 +370,7 @@ def function_plot_financial_metric(folder="output"):
 
     while True:
         print("\nAvailable indicator categories:")
-        categories = list(field_categories.keys())
+        categories = list(FIELD_CATEGORIES.keys())
         for i, cat in enumerate(categories):
             print(f"{i}. {cat}")
         cat_input = input("Select category index: ").strip()
@@ -434,7 +378,7 @@ def function_plot_financial_metric(folder="output"):
             print("Invalid category selection.")
             return
         selected_cat = categories[int(cat_input)]
-        fields = field_categories[selected_cat]
+        fields = FIELD_CATEGORIES[selected_cat]
 
         print(f"\nAvailable fields in {selected_cat}:")
         keys = list(fields.keys())
@@ -502,134 +446,37 @@ def function_plot_financial_metric(folder="output"):
         if again != "y":
             break
 
-def function_plot_all_metrics(folder="output"):
-    field_categories = {
-        "Profitability": {
-            "profit_roeAvg": ("ROE (%)", "Net Profit / Avg. Net Assets"),
-            "profit_npMargin": ("Net Profit Margin (%)", "Net Profit / Revenue"),
-            "profit_gpMargin": ("Gross Margin (%)", "Gross Profit / Revenue"),
-            "profit_netProfit": ("Net Profit", "Total Profit - Tax"),
-            "profit_epsTTM": ("EPS (Yuan)", "Net Profit / Total Shares"),
-        },
-        "Operational Efficiency": {
-            "operation_NRTurnRatio": ("AR Turnover", "Net Sales / Avg. AR"),
-            "operation_NRTurnDays": ("AR Turnover Days", "365 / AR Turnover"),
-            "operation_INVTurnRatio": ("Inventory Turnover", "COGS / Avg. Inventory"),
-            "operation_INVTurnDays": ("Inventory Turnover Days", "365 / Inventory Turnover"),
-            "operation_CATurnRatio": ("Current Asset Turnover", "Revenue / Avg. Current Assets"),
-            "operation_AssetTurnRatio": ("Total Asset Turnover", "Revenue / Avg. Total Assets"),
-        },
-        "Growth": {
-            "growth_YOYEquity": ("Equity YoY (%)", "(Current - Prev) / Prev"),
-            "growth_YOYAsset": ("Assets YoY (%)", "(Current - Prev) / Prev"),
-            "growth_YOYNI": ("Net Profit YoY (%)", "(Current - Prev) / Prev"),
-            "growth_YOYEPSBasic": ("EPS YoY (%)", "(Current - Prev) / Prev"),
-            "growth_YOYPNI": ("Non-recurring Net Profit YoY (%)", "(Current - Prev) / Prev"),
-        },
-        "Solvency": {
-            "balance_currentRatio": ("Current Ratio", "Current Assets / Current Liabilities"),
-            "balance_quickRatio": ("Quick Ratio", "Quick Assets / Current Liabilities"),
-            "balance_cashRatio": ("Cash Ratio", "Cash / Current Liabilities"),
-            "balance_YOYLiability": ("Liability YoY", "(Current - Prev) / Prev"),
-            "balance_liabilityToAsset": ("Debt-to-Asset Ratio", "Total Liabilities / Total Assets"),
-            "balance_assetToEquity": ("Equity Multiplier", "Total Assets / Equity"),
-        },
-        "Cash Flow": {
-            "cash_CAToAsset": ("Current Assets / Total Assets", "Current Assets / Total Assets"),
-            "cash_NCAToAsset": ("Non-Current Assets / Total", "Non-Current Assets / Total Assets"),
-            "cash_tangibleAssetToAsset": ("Tangible / Total Assets", "Tangible Assets / Total"),
-            "cash_ebitToInterest": ("EBIT / Interest", "EBIT / Interest Expense"),
-            "cash_CFOToOR": ("Operating CF / Revenue", "OCF / Revenue"),
-            "cash_CFOToNP": ("Operating CF / Net Profit", "OCF / Net Profit"),
-            "cash_CFOToGr": ("Operating CF / Capex", "OCF / Capital Expenditure"),
-        },
-        "DuPont Analysis": {
-            "dupont_dupontROE": ("DuPont ROE", "Net Profit / Equity"),
-            "dupont_dupontAssetStoEquity": ("Equity Multiplier", "Assets / Equity"),
-            "dupont_dupontAssetTurn": ("Asset Turnover", "Revenue / Assets"),
-            "dupont_dupontPnitoni": ("Net Profit Margin", "Net Profit / Revenue"),
-            "dupont_dupontNitogr": ("Net Margin", "Net Profit / Revenue"),
-            "dupont_dupontTaxBurden": ("Tax Burden", "Net Profit / Pre-Tax Profit"),
-            "dupont_dupontIntburden": ("Interest Burden", "Pre-Tax Profit / EBIT"),
-            "dupont_dupontEbittogr": ("EBIT Margin", "EBIT / Revenue"),
-        }
-    }
-
-    files = [f for f in os.listdir(folder) if f.endswith("_cleaned.csv")]
-    if not files:
-        print("No cleaned CSV files found.")
+def function_plot_all_metrics(store_dir=FUNDAMENTALS_DIR):
+    code = choose_fundamentals_stock(store_dir)
+    if code is None:
         return
 
-    print("\nAvailable stocks:")
-    for idx, f in enumerate(files):
-        print(f"{idx}. {f}")
-    f_idx = input("Enter file index to plot: ").strip()
-    if not f_idx.isdigit() or int(f_idx) >= len(files):
-        print("Invalid input.")
-        return
-
-    filename = files[int(f_idx)]
-    filepath = os.path.join(folder, filename)
-    code = filename.replace("_cleaned.csv", "")
-
-    df = pd.read_csv(filepath)
-    df["statDate"] = pd.to_datetime(df["statDate"], errors="coerce")
-    df = df.dropna(subset=["statDate"])
+    df = read_fundamentals(codes=[code], columns=[], store_dir=store_dir)
     if df.empty:
         print("No valid statDate found.")
         return
 
     start_date, end_date = get_time_range_from_user(df)
-    df = df[(df["statDate"] >= start_date) & (df["statDate"] <= end_date)].copy()
-
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    project_root = os.path.dirname(current_dir)
-    stock_name = code
-    try:
-        df_name = pd.read_csv(os.path.join(project_root, "output", "all_stocks.csv"))
-        match = df_name[df_name["code"] == code]
-        if not match.empty:
-            stock_name = match.iloc[0]["code_name"]
-    except:
-        pass
-
-    output_dir = os.path.join(project_root, "output", "figure", f"{stock_name}_{code}")
-    os.makedirs(output_dir, exist_ok=True)
-
-    def date_to_quarter(date_obj):
-        year = date_obj.year
-        quarter = (date_obj.month - 1) // 3 + 1
-        return f"{year}Q{quarter}"
-
-    start_str = date_to_quarter(start_date)
-    end_str = date_to_quarter(end_date)
-
-    print(f"\nGenerating charts and saving to: {output_dir}")
-
-    for category, fields in field_categories.items():
-        for field_key, (field_label, field_formula) in fields.items():
-            if field_key not in df.columns:
-                continue
-            df_plot = df[["statDate", field_key]].dropna().sort_values("statDate")
-            if df_plot.empty:
-                continue
+    print(f"\nGenerating charts and saving to: {FIGURE_DIR}")
+    render_stock_charts([code], start_date, end_date, store_dir=store_dir)
+    print("All charts generated successfully.")
 
-            plt.figure(figsize=(10, 5))
-            plt.plot(df_plot["statDate"], df_plot[field_key], marker='o', linestyle='-', label=code)
-            plt.xlabel("Quarter", fontsize=12)
-            plt.ylabel(field_label, fontsize=12)
-            plt.xticks(rotation=45)
-            plt.suptitle(f"{field_label}", fontsize=14, fontweight="bold", y=0.97)
-            plt.title(f"{field_key} · Formula: {field_formula}", fontsize=10, color="gray", pad=2)
-            plt.legend(title="Stock Code")
-            plt.grid(True)
-            plt.tight_layout(rect=[0.07, 0.07, 0.985, 0.92])
 
-            filename = f"{field_key}_{start_str}-{end_str}.png"
-            save_path = os.path.join(output_dir, filename)
-            plt.savefig(save_path, dpi=300, bbox_inches="tight")
-            plt.close()
+def function_plot_saved_stocks(saved_path="analysis/saved_stocks.txt", store_dir=FUNDAMENTALS_DIR):
+    """Render all categorized charts for every stock in saved_stocks.txt in one batch"""
+    if not os.path.exists(saved_path):
+        print("Error: saved_stocks.txt not found.")
+        return
+    with open(saved_path, "r", encoding="utf-8") as f:
+        stock_list = [line.strip() for line in f if line.strip()]
+    if not stock_list:
+        print("Warning: stock code file is empty.")
+        return
 
-            print(f"Saved: {filename}")
+    workers_input = input("Parallel rendering processes (default: all CPUs): ").strip()
+    workers = int(workers_input) if workers_input.isdigit() and int(workers_input) > 0 else None
+    force = input("Redraw charts whose data has not changed? (y/n): ").strip().lower() == "y"
 
-    print("All charts generated successfully.")
+    ensure_fundamentals_store(store_dir=store_dir)
+    print(f"\nGenerating charts for {len(stock_list)} stocks under: {FIGURE_DIR}")
+    render_stock_charts(stock_list, workers=workers, force=force, store_dir=store_dir)
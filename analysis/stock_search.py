@@ -1,160 +1,212 @@
 import os
+import numpy as np
 import pandas as pd
 
-def filter_limit_up(data_folder="daily_data_history", threshold=0.098):
-    days_input = input("Enter number of days to check (default 30): ").strip()
-    threshold_input = input("Enter limit-up threshold as decimal (default 0.098): ").strip()
-    threshold = float(threshold_input) if threshold_input else threshold
-    recent_days = int(days_input) if days_input.isdigit() else 30
+from crawler import metrics
+from crawler.jobs import atomic_write_csv
+from crawler.price_store import STORE_DIR
+from crawler.price_panel import load_price_panel
+from analysis.screening import threshold_screen, max_move_screen, range_change_screen, limit_streak_screen
 
-    results = []
 
-    for filename in os.listdir(data_folder):
-        if filename.endswith(".csv"):
-            filepath = os.path.join(data_folder, filename)
-            try:
-                df = pd.read_csv(filepath).sort_values("date").reset_index(drop=True)
-                if len(df) < recent_days:
-                    continue
-
-                df_recent = df[-recent_days:].copy()
-                df_recent["pct_chg"] = (df_recent["close"] - df_recent["open"]) / df_recent["open"]
-                df_recent["is_limit_up"] = df_recent["pct_chg"] >= threshold
-
-                limit_df = df_recent[df_recent["is_limit_up"]]
-                if len(limit_df) == 0:
-                    continue
-
-                stock_name = filename.replace(".csv", "")
-                limit_dates = limit_df["date"].tolist()
-                pct_list = [round(p * 100, 2) for p in limit_df["pct_chg"]]
-
-                results.append({
-                    "Stock Name": stock_name,
-                    "Limit-Up Count": len(limit_dates),
-                    "Limit-Up Dates": limit_dates,
-                    "Limit-Up Percentage List": pct_list
-                })
-
-            except Exception as e:
-                print(f"Failed to read {filename}, Error: {e}")
-                continue
-
-    df_result = pd.DataFrame(results)
-    df_result = df_result.sort_values("Limit-Up Count", ascending=False).reset_index(drop=True)
-
-    if not df_result.empty:
-        confirm = input("Save results to CSV file? (y/n): ").strip().lower()
-        if confirm == "y":
-            os.makedirs("output", exist_ok=True)
-            start_date = df_recent["date"].min()
-            end_date = df_recent["date"].max()
-            filename = f"limit_up_stats_{start_date}_{end_date}.csv"
-            save_path = os.path.join("output", filename)
-            df_result.to_csv(save_path, index=False, encoding="utf-8-sig")
-            print(f"Results saved to: {save_path}")
-        else:
-            print("Results not saved. Display only.")
-    else:
-        print("No limit-up stocks found. No file generated.")
+def _load_panel(panel, store_dir, data_folder):
+    """`panel` if given, else the shared panel of the store; None (with a message) when there is no price data"""
+    if panel is None:
+        panel = load_price_panel(store_dir, data_folder)
+    if panel is None:
+        print(f"No price data found in {store_dir} or {data_folder}.")
+    return panel
+
 
+def _limit_hits_table(panel, screen: dict, label: str) -> list:
+    """Result rows for the stocks with at least one hit, most hits first"""
+    counts = screen["counts"]
+    hit_cols = np.flatnonzero(counts)
+    hit_cols = hit_cols[np.argsort(-counts[hit_cols], kind="stable")]
+    dates = panel.dates[screen["rows"]]
+    labels = panel.labels()
+
+    results = []
+    for col in hit_cols:
+        hit_rows = np.flatnonzero(screen["hits"][:, col])
+        results.append({
+            "Stock Name": labels[col],
+            f"{label} Count": int(counts[col]),
+            f"{label} Dates": pd.DatetimeIndex(dates[hit_rows]).strftime("%Y-%m-%d").tolist(),
+            f"{label} Percentage List": [round(float(p) * 100, 2) for p in screen["move"][hit_rows, col]],
+        })
+    return results
+
+
+def _window_tag(df: pd.DataFrame) -> str:
+    return f"{df.attrs['window_start']}_{df.attrs['window_end']}"
+
+
+def _limit_filter(panel, recent_days: int, threshold: float, direction: str, label: str) -> pd.DataFrame:
+    with metrics.span(f"screen.limit_{direction}"):
+        screen = threshold_screen(panel, recent_days, threshold, direction=direction)
+    df_result = pd.DataFrame(_limit_hits_table(panel, screen, label))
+    # window bounds name the CSV file if the result is saved
+    for key in ("window_start", "window_end"):
+        value = screen[key]
+        df_result.attrs[key] = pd.Timestamp(value).strftime("%Y-%m-%d") if value is not None else ""
     return df_result
 
 
-def filter_limit_down(data_folder="daily_data_history", threshold=-0.098):
-    days_input = input("Enter number of days to check (default 30): ").strip()
-    threshold_input = input("Enter limit-down threshold (e.g. -0.098): ").strip()
-    threshold = float(threshold_input) if threshold_input else threshold
-    recent_days = int(days_input) if days_input.isdigit() else 30
+def save_limit_table(df_result: pd.DataFrame, kind: str, output_dir="output") -> str:
+    """
+    Save a filter_limit_up / filter_limit_down result
+    Parameters:
+        kind: 'limit_up' or 'limit_down'
+    Returns the path written, e.g. output/limit_up_stats_2025-06-12_2025-07-23.csv
+    """
+    save_path = os.path.join(output_dir, f"{kind}_stats_{_window_tag(df_result)}.csv")
+    atomic_write_csv(df_result, save_path)
+    print(f"Results saved to: {save_path}")
+    return save_path
+
+
+def filter_limit_up(data_folder="daily_data_history", threshold=0.098, store_dir=STORE_DIR,
+                    recent_days=30, save=False, panel=None):
+    """
+    Stocks with intraday moves >= threshold in their last `recent_days` bars, most hits first
+    save=True writes the table to output/ (see save_limit_table); pass `panel` to reuse a loaded one.
+    """
+    panel = _load_panel(panel, store_dir, data_folder)
+    if panel is None:
+        return pd.DataFrame()
+    df_result = _limit_filter(panel, recent_days, threshold, "up", "Limit-Up")
+
+    if df_result.empty:
+        print("No limit-up stocks found. No file generated.")
+    elif save:
+        save_limit_table(df_result, "limit_up")
+    return df_result
 
-    results = []
 
-    for filename in os.listdir(data_folder):
-        if filename.endswith(".csv"):
-            filepath = os.path.join(data_folder, filename)
-            try:
-                df = pd.read_csv(filepath).sort_values("date").reset_index(drop=True)
-                if len(df) < recent_days:
-                    continue
-
-                df_recent = df[-recent_days:].copy()
-                df_recent["pct_chg"] = (df_recent["close"] - df_recent["open"]) / df_recent["open"]
-                df_recent["is_limit_down"] = df_recent["pct_chg"] <= threshold
-
-                limit_df = df_recent[df_recent["is_limit_down"]]
-                if len(limit_df) == 0:
-                    continue
-
-                stock_name = filename.replace(".csv", "")
-                limit_dates = limit_df["date"].tolist()
-                pct_list = [round(p * 100, 2) for p in limit_df["pct_chg"]]
-
-                results.append({
-                    "Stock Name": stock_name,
-                    "Limit-Down Count": len(limit_dates),
-                    "Limit-Down Dates": limit_dates,
-                    "Limit-Down Percentage List": pct_list
-                })
-
-            except Exception as e:
-                print(f"Failed to read {filename}, Error: {e}")
-                continue
-
-    df_result = pd.DataFrame(results)
-    df_result = df_result.sort_values("Limit-Down Count", ascending=False).reset_index(drop=True)
-
-    if not df_result.empty:
-        confirm = input("Save results to CSV file? (y/n): ").strip().lower()
-        if confirm == "y":
-            os.makedirs("output", exist_ok=True)
-            start_date = df_recent["date"].min()
-            end_date = df_recent["date"].max()
-            filename = f"limit_down_stats_{start_date}_{end_date}.csv"
-            save_path = os.path.join("output", filename)
-            df_result.to_csv(save_path, index=False, encoding="utf-8-sig")
-            print(f"Results saved to: {save_path}")
-        else:
-            print("Results not saved. Display only.")
-    else:
-        print("No limit-down stocks found. No file generated.")
+def filter_limit_down(data_folder="daily_data_history", threshold=-0.098, store_dir=STORE_DIR,
+                      recent_days=30, save=False, panel=None):
+    """Stocks with intraday moves <= threshold in their last `recent_days` bars (as filter_limit_up)"""
+    panel = _load_panel(panel, store_dir, data_folder)
+    if panel is None:
+        return pd.DataFrame()
+    df_result = _limit_filter(panel, recent_days, threshold, "down", "Limit-Down")
 
+    if df_result.empty:
+        print("No limit-down stocks found. No file generated.")
+    elif save:
+        save_limit_table(df_result, "limit_down")
     return df_result
 
-def filter_top_gainers(data_folder="daily_data_history", recent_days=30, top_n=10):
+
+def save_top_gainers(df_top: pd.DataFrame, top_n: int, output_dir="output") -> str:
+    save_path = os.path.join(output_dir, f"top_single_day_gainers_{top_n}.csv")
+    atomic_write_csv(df_top, save_path)
+    print(f"Saved to: {save_path}")
+    return save_path
+
+
+def filter_top_gainers(data_folder="daily_data_history", recent_days=30, top_n=10, store_dir=STORE_DIR,
+                       save=False, panel=None):
+    """Top-N stocks by best single-day move in their last `recent_days` bars"""
+    panel = _load_panel(panel, store_dir, data_folder)
+    if panel is None:
+        return pd.DataFrame()
+    with metrics.span("screen.top_gainers"):
+        screen = max_move_screen(panel, recent_days, top_n)
+    labels = panel.labels()
+
     results = []
+    for rank, col in enumerate(screen["order"]):
+        row = screen["best_row"][col]
+        results.append({
+            "Stock": labels[col],
+            "Date": pd.Timestamp(panel.dates[row]).strftime("%Y-%m-%d"),
+            "Open": round(float(panel.open[row, col]), 2),
+            "Close": round(float(panel.close[row, col]), 2),
+            "Change %": round(screen["best_move"][col] * 100, 2),
+            "Rank": rank + 1
+        })
+
+    df_top = pd.DataFrame(results)
+    if save:
+        save_top_gainers(df_top, top_n)
+    return df_top
 
-    for filename in os.listdir(data_folder):
-        if filename.endswith(".csv"):
-            filepath = os.path.join(data_folder, filename)
-            try:
-                df = pd.read_csv(filepath).sort_values("date").reset_index(drop=True)
-                if len(df) < 1:
-                    continue
-                recent_df = df[-recent_days:].copy()
-                recent_df["change_pct"] = (recent_df["close"] - recent_df["open"]) / recent_df["open"] * 100
-
-                max_row = recent_df.loc[recent_df["change_pct"].idxmax()]
-                results.append({
-                    "Stock": filename.replace(".csv", ""),
-                    "Date": max_row["date"],
-                    "Open": round(max_row["open"], 2),
-                    "Close": round(max_row["close"], 2),
-                    "Change %": round(max_row["change_pct"], 2)
-                })
-            except Exception as e:
-                print(f"{filename} failed to read, Error: {e}")
-
-    sorted_results = sorted(results, key=lambda x: x["Change %"], reverse=True)
-    for i, item in enumerate(sorted_results[:top_n]):
-        item["Rank"] = i + 1
-
-    df_top = pd.DataFrame(sorted_results[:top_n])
-
-    confirm = input(f"Save Top {top_n} results as CSV? (y/n): ").strip().lower()
-    if confirm == "y":
-        os.makedirs("output", exist_ok=True)
-        save_path = os.path.join("output", f"top_single_day_gainers_{top_n}.csv")
-        df_top.to_csv(save_path, index=False, encoding="utf-8-sig")
-        print(f"Saved to: {save_path}")
 
+def save_range_gainers(df_top: pd.DataFrame, top_n: int, output_dir="output") -> str:
+    save_path = os.path.join(output_dir, f"top_range_gainers_{top_n}.csv")
+    atomic_write_csv(df_top, save_path)
+    print(f"Saved to: {save_path}")
+    return save_path
+
+
+def filter_range_gainers(data_folder="daily_data_history", recent_days=30, top_n=10, store_dir=STORE_DIR,
+                         save=False, panel=None):
+    """Top-N stocks by change from the first to the last close of their last `recent_days` bars"""
+    panel = _load_panel(panel, store_dir, data_folder)
+    if panel is None:
+        return pd.DataFrame()
+    with metrics.span("screen.range_gainers"):
+        screen = range_change_screen(panel, recent_days, top_n)
+    labels = panel.labels()
+
+    df_top = pd.DataFrame([{
+        "Stock": labels[col],
+        "Start Price": round(float(screen["start_price"][col]), 2),
+        "End Price": round(float(screen["end_price"][col]), 2),
+        "Change %": round(float(screen["change"][col]) * 100, 2)
+    } for col in screen["order"]])
+    if save:
+        save_range_gainers(df_top, top_n)
     return df_top
+
+
+def _row_date(panel, row: int) -> str:
+    return pd.Timestamp(panel.dates[row]).strftime("%Y-%m-%d") if row >= 0 else ""
+
+
+def filter_limit_streaks(data_folder="daily_data_history", direction="up", min_streak=2, store_dir=STORE_DIR,
+                         save=False, panel=None):
+    """
+    Stocks with consecutive limit-up (direction='up') or limit-down closes, over the whole history
+    A limit bar closes at the board limit from the previous close: ±20% for STAR / ChiNext,
+    ±5% for main-board ST, ±10% otherwise (see analysis.screening.limit_streak_screen).
+    Keeps stocks whose longest streak is at least `min_streak` bars; stocks on a streak right
+    now come first, then by longest streak.
+    """
+    panel = _load_panel(panel, store_dir, data_folder)
+    if panel is None:
+        return pd.DataFrame()
+    with metrics.span(f"screen.limit_{direction}_streaks"):
+        screen = limit_streak_screen(panel, direction)
+    labels = panel.labels()
+
+    cols = np.flatnonzero(screen["max"] >= min_streak)
+    cols = cols[np.lexsort((cols, -screen["max"][cols], -screen["current"][cols]))]
+    label = "Limit-Up" if direction == "up" else "Limit-Down"
+    df_result = pd.DataFrame([{
+        "Stock Name": labels[col],
+        "Board Limit %": round(screen["limits"][col] * 100),
+        f"Current {label} Streak": int(screen["current"][col]),
+        "Current Streak Start": _row_date(panel, screen["current_start"][col]),
+        f"Max {label} Streak": int(screen["max"][col]),
+        "Max Streak Start": _row_date(panel, screen["max_start"][col]),
+        "Max Streak End": _row_date(panel, screen["max_end"][col]),
+        "Last Date": _row_date(panel, screen["last_row"][col]),
+    } for col in cols])
+    df_result.attrs["last_date"] = _row_date(panel, len(panel.dates) - 1)
+
+    if df_result.empty:
+        print(f"No {label.lower()} streaks of {min_streak}+ days found.")
+    elif save:
+        save_streak_table(df_result, direction)
+    return df_result
+
+
+def save_streak_table(df_result: pd.DataFrame, direction: str, output_dir="output") -> str:
+    """Save a filter_limit_streaks result, e.g. output/limit_up_streaks_2025-07-23.csv"""
+    save_path = os.path.join(output_dir, f"limit_{direction}_streaks_{df_result.attrs['last_date']}.csv")
+    atomic_write_csv(df_result, save_path)
+    print(f"Results saved to: {save_path}")
+    return save_path
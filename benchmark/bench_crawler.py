@@ -0,0 +1,145 @@
+"""
+Crawler benchmark against the offline baostock stand-in (crawler/replay.py)
+
+Run from the project root:
+    python -m benchmark.bench_crawler [--stocks 500] [--years 2] [--quarters 8] [--workers 1]
+                                      [--latency 0.02] [--error-rate 0.01] [--queue-size 8]
+                                      [--json output/bench_crawler.json]
+
+Times the three remote paths on a synthetic universe, with no network and no login:
+    download   download_all_stock_data, full history up to five business days ago
+    update     update_existing_stock_data, the last five business days
+    financials run_financial_download (the engine of batch_download_financials), --quarters quarters
+For download and update, the busy share of the fetch / decode / write stages is shown as well
+(--queue-size 0 runs them one stock at a time, the sequential baseline to compare with).
+Everything runs in a throwaway working directory. Latency and errors are seeded (--seed), so
+runs with the same arguments see the same delays and the same failed calls.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import date
+
+import numpy as np
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from crawler.replay import ReplayBaostock, synthetic_codes  # noqa: E402
+
+
+def last_quarters(n: int, today: date) -> list:
+    """The n most recent quarters that ended before today, oldest first"""
+    y, q = today.year, (today.month - 1) // 3
+    quarters = []
+    while len(quarters) < n:
+        if q == 0:
+            y, q = y - 1, 4
+        quarters.append((y, q))
+        q -= 1
+    return quarters[::-1]
+
+
+def stage_busy() -> dict:
+    """Busy seconds per download stage since the last call (taken from the metrics counters)"""
+    from crawler import metrics
+    snapshot = metrics.drain()
+    return {name.split(".", 1)[1]: seconds for name, seconds in snapshot["counters"].items()
+            if name.startswith("stage_busy.")}
+
+
+def timed(func, *args, **kwargs):
+    """(seconds, result) with the function's own progress output swallowed"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stocks", type=int, default=500)
+    parser.add_argument("--years", type=int, default=2, help="Years of daily history per stock")
+    parser.add_argument("--quarters", type=int, default=8, help="Financial quarters per stock")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean seconds per call")
+    parser.add_argument("--row-latency", type=float, default=0.0, help="Extra seconds per returned row")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--timeout-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queue-size", type=int, default=None,
+                        help="Stocks held between download stages (0 = sequential; default crawler.stages.QUEUE_SIZE)")
+    parser.add_argument("--recording", help="Query cache database to replay before synthesizing")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    from crawler.stock_price import download_all_stock_data, update_existing_stock_data
+    from analysis.stock_analysis import run_financial_download
+    from crawler.downloader import close_session_pools
+    from crawler.stages import QUEUE_SIZE
+    from crawler import metrics
+
+    today = np.busday_offset(np.datetime64(date.today()), 0, roll="backward")
+    cutoff = np.busday_offset(today, -5)
+    start = str(np.busday_offset(cutoff, -250 * args.years, roll="forward"))
+    replay = ReplayBaostock(stocks=args.stocks, recording=args.recording and os.path.abspath(args.recording),
+                            latency=args.latency, row_latency=args.row_latency, error_rate=args.error_rate,
+                            timeout_rate=args.timeout_rate, seed=args.seed, today=str(today))
+    codes = synthetic_codes(args.stocks)
+    names = {code: f"合成{i:05d}" for i, code in enumerate(codes)}
+    quarters = last_quarters(args.quarters, date.fromisoformat(str(today)))
+    options = dict(workers=args.workers, requests_per_second=0, retries=2)
+    price_options = dict(options, queue_size=QUEUE_SIZE if args.queue_size is None else args.queue_size)
+    # stage busy times are read from the run's counters
+    metrics.enable()
+
+    results = {"params": vars(args), "stages": {}}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            seconds, failed = timed(download_all_stock_data, codes, names, start, str(cutoff),
+                                    query_func=replay.query_history_k_data_plus,
+                                    factor_func=replay.query_adjust_factor,
+                                    calendar_func=replay.query_trade_dates, **price_options)
+            results["stages"]["download"] = {"seconds": seconds, "calls": len(codes), "failed": len(failed),
+                                             "busy": stage_busy()}
+
+            seconds, failed = timed(update_existing_stock_data, codes, names, str(today),
+                                    query_func=replay.query_history_k_data_plus,
+                                    factor_func=replay.query_adjust_factor,
+                                    calendar_func=replay.query_trade_dates, **price_options)
+            results["stages"]["update"] = {"seconds": seconds, "calls": len(codes), "failed": len(failed or []),
+                                           "busy": stage_busy()}
+
+            seconds, _ = timed(run_financial_download, codes, quarters, queries=replay,
+                               workers=args.workers, requests_per_second=0, retries=2)
+            results["stages"]["financials"] = {"seconds": seconds,
+                                               "calls": len(codes) * len(quarters) * 6, "failed": None}
+        finally:
+            close_session_pools()
+            os.chdir(cwd)
+
+    print(f"{args.stocks} stocks, {args.years}y history, {len(quarters)} quarters, {args.workers} workers, "
+          f"latency {args.latency}s, errors {args.error_rate:.1%} + timeouts {args.timeout_rate:.1%}, "
+          f"queue {price_options['queue_size']}")
+    print(f"\n{'stage':<14}{'seconds':>10}{'calls':>10}{'calls/s':>10}{'failed':>8}  busy")
+    for name, stage in results["stages"].items():
+        rate = stage["calls"] / max(stage["seconds"], 1e-9)
+        failed = "-" if stage["failed"] is None else stage["failed"]
+        busy = " · ".join(f"{k} {v / max(stage['seconds'], 1e-9):.0%}" for k, v in stage.get("busy", {}).items())
+        print(f"{name:<14}{stage['seconds']:>10.2f}{stage['calls']:>10}{rate:>10.1f}{failed:>8}  {busy}")
+
+    if args.json:
+        os.makedirs(os.path.dirname(args.json) or ".", exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
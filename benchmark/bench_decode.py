@@ -0,0 +1,131 @@
+"""
+Result-set decoding benchmark: per-row lists + pd.to_numeric vs the bulk typed decoder
+
+Run from the project root:
+    python -m benchmark.bench_decode [--rows 10000,250000,1000000] [--repeat 3] [--json output/bench_decode.json]
+
+Rows are daily bars (date, code, open, high, low, close, volume as baostock sends them: all
+strings) or profit statements, served from memory, so only decoding is measured. Each
+(approach, query, size) runs in a fresh interpreter:
+    legacy  while rs.next(): append(rs.get_row_data()), DataFrame, then pd.to_numeric per column
+    bulk    crawler.decode.decode_result (page slices, one typed Arrow parse per 10,000 rows)
+Reported: best rows/s, and peak memory of the decode itself: Python/numpy allocations
+(tracemalloc) plus Arrow's memory pool.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+
+PRICE_FIELDS = "date,code,open,high,low,close,volume"
+
+
+def make_rows(query: str, rows: int):
+    """(query name, fields, rows) of at least `rows` synthetic answer rows"""
+    from crawler.replay import ReplayBaostock, synthetic_codes, STATEMENT_FIELDS
+
+    replay = ReplayBaostock(stocks=max(rows // 1000, 1) + 1, today="2025-07-23")
+    out = []
+    if query == "prices":
+        for code in synthetic_codes(10 ** 6):
+            fields, part = replay._prices(code, PRICE_FIELDS.split(","), "2000-01-01", "2025-07-23")
+            out.extend(part)
+            if len(out) >= rows:
+                return "query_history_k_data_plus", fields, out[:rows]
+    name = "query_profit_data"
+    fields = ["code", "pubDate", "statDate"] + STATEMENT_FIELDS[name]
+    i = 0
+    while len(out) < rows:
+        code = synthetic_codes(i + 1)[-1]
+        for year in range(2000, 2025):
+            for quarter in range(1, 5):
+                out.extend(replay._statement(name, code, year, quarter)[1])
+        i += 1
+    return name, fields, out[:rows]
+
+
+def legacy_decode(rs, fields: list):
+    import pandas as pd
+
+    data = []
+    while rs.next():
+        data.append(rs.get_row_data())
+    df = pd.DataFrame(data, columns=rs.fields)
+    for col in fields:
+        if col not in ("date", "code", "pubDate", "statDate"):
+            df[col] = pd.to_numeric(df[col], errors="coerce")
+    return df
+
+
+def run_case(approach: str, query: str, rows: int, repeat: int) -> dict:
+    import pyarrow as pa
+    from crawler.decode import decode_result
+    from crawler.query_cache import CachedResultSet
+
+    name, fields, data = make_rows(query, rows)
+
+    def decode():
+        rs = CachedResultSet(fields, data)
+        return legacy_decode(rs, fields) if approach == "legacy" else decode_result(rs, name)
+
+    # memory first: Arrow's pool only keeps a lifetime high-water mark
+    pool = pa.default_memory_pool()
+    arrow_before = pool.max_memory()
+    tracemalloc.start()
+    df = decode()
+    traced = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    arrow_peak = max(pool.max_memory() - arrow_before, 0)
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        decode()
+        times.append(time.perf_counter() - start)
+    return {"approach": approach, "query": query, "rows": len(df), "seconds": min(times),
+            "rows_per_s": len(df) / min(times), "peak_mb": (traced + arrow_peak) / 2**20,
+            "result_mb": df.memory_usage(deep=True).sum() / 2**20}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10000,250000,1000000")
+    parser.add_argument("--queries", default="prices,statements")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        approach, query, rows = args.case.split(":")
+        print(json.dumps(run_case(approach, query, int(rows), args.repeat)))
+        return
+
+    results = []
+    print(f"{'query':<12}{'rows':>10}{'approach':>10}{'rows/s':>14}{'peak_mb':>10}{'result_mb':>11}")
+    for query in args.queries.split(","):
+        for rows in (int(r) for r in args.rows.split(",")):
+            for approach in ("legacy", "bulk"):
+                out = subprocess.run([sys.executable, "-m", "benchmark.bench_decode", "--repeat", str(args.repeat),
+                                      "--case", f"{approach}:{query}:{rows}"],
+                                     cwd=PROJECT_ROOT, capture_output=True, text=True, check=True).stdout
+                r = json.loads(out.strip().splitlines()[-1])
+                results.append(r)
+                print(f"{query:<12}{r['rows']:>10}{approach:>10}{r['rows_per_s']:>14,.0f}{r['peak_mb']:>10.1f}"
+                      f"{r['result_mb']:>11.1f}")
+
+    if args.json:
+        os.makedirs(os.path.dirname(args.json) or ".", exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
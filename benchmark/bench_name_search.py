@@ -0,0 +1,60 @@
+"""
+Stock-name search: pandas str.contains over the list (the old menu search) vs the search index
+
+Run from the project root:
+    python -m benchmark.bench_name_search [--list-path output/all_stocks.csv] [--repeat 200]
+
+Index times are per query after the index is loaded; build and load are timed separately
+(build from scratch, load from all_stocks_index.json in a fresh state).
+"""
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from analysis import name_index
+
+
+QUERIES = ["银行", "中", "浦发银行", "st", "600", "sz.0000", "pfyh", "yinhang"]
+
+
+def _per_query(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--list-path", default=name_index.LIST_PATH)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    path = name_index.index_path(args.list_path)
+    if os.path.exists(path):
+        os.remove(path)
+    start = time.perf_counter()
+    index = name_index.load_name_index(args.list_path)
+    build = time.perf_counter() - start
+    name_index._INDEX_CACHE.clear()
+    start = time.perf_counter()
+    index = name_index.load_name_index(args.list_path)
+    load = time.perf_counter() - start
+    print(f"{len(index['entries'])} names, pinyin {'on' if index['pinyin'] else 'off (pypinyin not installed)'}")
+    print(f"Index build + save {build * 1000:.0f} ms, load {load * 1000:.0f} ms "
+          f"({os.path.getsize(path) / 1e6:.1f} MB)")
+
+    df = pd.read_csv(args.list_path)
+    print(f"{'query':<12}{'contains (us)':>15}{'hits':>7}{'index (us)':>13}{'hits':>7}")
+    for q in QUERIES:
+        contains = _per_query(lambda: df[df["code_name"].str.contains(q, regex=False)], args.repeat)
+        hits = int(df["code_name"].str.contains(q, regex=False).sum())
+        indexed = _per_query(lambda: name_index.search_names(index, q, limit=None), args.repeat)
+        found = len(name_index.search_names(index, q, limit=None))
+        print(f"{q:<12}{contains * 1e6:>15.0f}{hits:>7}{indexed * 1e6:>13.0f}{found:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Price panel memory footprint and the precision cost of the compact (float32) panel
+
+Run from the project root:
+    python -m benchmark.bench_panel_memory [--sizes 500x2,5000x20] [--json output/benchmarks/panel_memory.json]
+
+For each synthetic universe (benchmark/synth_universe.py) three in-memory forms of the same prices
+are measured, each in a fresh interpreter:
+    read_csv   every CSV through pd.read_csv and concatenated (float64, date and code as strings)
+    float64    load_price_panel(compact=False): float64 panel plus its cached fragments
+    compact    load_price_panel(): float32 prices, int64 volume, int32 day offsets, categorical codes
+Reported: bytes held (deep memory_usage / nbytes) and peak RSS of the process.
+
+The precision check then compares the compact panel with the float64 one and fails (exit
+status 1) if:
+    - any price differs by more than PRICE_RELATIVE_ERROR (2**-24) relative, or a bar or volume differs
+    - an intraday or range move differs by more than (1 + |move|) * 2 * 2**-24 / (1 - 2**-24)
+    - a limit-up / limit-down hit, a limit streak or a top-gainer rank changes, other than on a bar
+      whose float64 move is within that bound of the threshold or of the neighbouring rank
+
+The synthetic universe does not trade in cents, so the same checks also run on representative
+A-share prices (check_limit_precision): cent prices from 1.00 to 2500.00 on every board, closes
+at the exchange-rounded limit price and a few ticks either side of the LIMIT_TOLERANCE and
+threshold boundaries, unadjusted and forward-adjusted as load_price_panel adjusts them
+(float32 storage times a float64 factor, stored as float32 again). Prev-close returns must
+match the float64 panel within the same bound (far inside LIMIT_TOLERANCE), and limit hits and
+streaks must be identical except on bars whose float64 return sits within that bound of the
+tolerance boundary. --precision-only runs just this check (a second or so).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from benchmark.synth_universe import UNIVERSE_DIR, generate_universe  # noqa: E402
+
+
+FORMS = ["read_csv", "float64", "compact"]
+THRESHOLDS = {"up": 0.098, "down": -0.098}
+RECENT_DAYS = 30
+# representative prices: one column per (board, starting price), with and without an adjustment factor
+BOARD_CODES = {"sh.600000": "银行", "sz.300001": "创业", "sh.600001": "ST主板"}
+START_PRICES = [1.00, 1.23, 3.57, 9.99, 10.00, 27.45, 88.88, 150.00, 999.99, 1688.00, 2500.00]
+ADJUST_FACTORS = [1.0, 0.8731, 0.3517]
+
+
+def _store(folder: str) -> str:
+    from crawler.price_store import ensure_price_store
+    with contextlib.redirect_stdout(io.StringIO()):
+        return ensure_price_store(os.path.join(folder, "daily_data_history"), os.path.join(folder, "daily_data_store"))
+
+
+def measure_form(form: str, folder: str) -> dict:
+    """Child process: load one form and return the bytes it holds"""
+    import pandas as pd
+    from crawler.price_panel import load_price_panel, memory_footprint
+
+    data_folder = os.path.join(folder, "daily_data_history")
+    if form == "read_csv":
+        df = pd.concat([pd.read_csv(os.path.join(data_folder, f)) for f in sorted(os.listdir(data_folder))],
+                       ignore_index=True)
+        held, rows = int(df.memory_usage(deep=True).sum()), len(df)
+        detail = {}
+    else:
+        store_dir = _store(folder)
+        panel = load_price_panel(store_dir, data_folder, compact=(form == "compact"))
+        footprint = memory_footprint(panel)
+        held, rows = footprint["panel_total"] + footprint["fragments"], footprint["fragment_rows"]
+        detail = {"panel_bytes": footprint["panel_total"], "fragment_bytes": footprint["fragments"],
+                  "shape": [len(panel.dates), len(panel.codes)]}
+    return {"form": form, "bytes": held, "rows": rows, "rss_mb": _peak_rss_kb() / 1024, **detail}
+
+
+def _peak_rss_kb() -> int:
+    # ru_maxrss survives exec on Linux (the child would report the parent's peak); VmHWM does not
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _near(values, targets, bound) -> bool:
+    return bool((abs(values - targets) <= bound).all())
+
+
+def _move_bound(move, u):
+    """Largest change of a float64 move (a / b - 1) when a and b are each off by up to u relative"""
+    import numpy as np
+    return (1 + np.abs(move)) * 2 * u / (1 - u) + 1e-15
+
+
+def _streak_problems(full, compact, u) -> list:
+    """limit_streak_screen on both panels: hits may only flip on bars within rounding of the limit boundary"""
+    import numpy as np
+    from analysis.screening import limit_streak_screen, prev_close_returns, LIMIT_TOLERANCE
+
+    problems = []
+    ret, ret32 = prev_close_returns(full), prev_close_returns(compact)
+    valid = ~np.isnan(ret)
+    if not np.array_equal(valid, ~np.isnan(ret32)):
+        return ["prev-close returns: bars differ"]
+    worst = np.max(np.abs(ret32[valid] - ret[valid]), initial=0.0)
+    if not (np.abs(ret32[valid] - ret[valid]) <= _move_bound(ret[valid], u)).all() or worst >= LIMIT_TOLERANCE:
+        problems.append(f"prev-close returns differ by up to {worst:.3g}")
+    for direction in ("up", "down"):
+        a, b = limit_streak_screen(full, direction), limit_streak_screen(compact, direction)
+        boundary = a["limits"] - LIMIT_TOLERANCE
+        if direction == "down":
+            boundary = -boundary
+        flipped = a["hits"] != b["hits"]
+        if flipped.any() and not _near(a["ret"][flipped], np.broadcast_to(boundary, flipped.shape)[flipped],
+                                       _move_bound(a["ret"][flipped], u)):
+            problems.append(f"limit_{direction}_streaks: {np.count_nonzero(flipped)} hits changed away from the limit")
+        elif not flipped.any() and not (np.array_equal(a["current"], b["current"])
+                                        and np.array_equal(a["max"], b["max"])):
+            problems.append(f"limit_{direction}_streaks: streak lengths changed")
+    return problems
+
+
+def representative_prices(seed=0, days=250):
+    """
+    Cent-priced daily bars for every (board, starting price) of BOARD_CODES x START_PRICES
+    Closes land on the exchange-rounded limit price, a few ticks inside the LIMIT_TOLERANCE
+    boundary, either side of the screening thresholds, or anywhere in between.
+    Returns (codes, names, {field: float64 array (days x stocks)})
+    """
+    import numpy as np
+    from analysis.screening import board_limits, LIMIT_TOLERANCE
+
+    rng = np.random.default_rng(seed)
+    codes, names = [], {}
+    for code, name in BOARD_CODES.items():
+        for i, _ in enumerate(START_PRICES):
+            column = f"{code}{i:02d}"
+            codes.append(column)
+            names[column] = name
+    limits = board_limits([c[:9] for c in codes], {c: names[c] for c in codes})
+    start = np.tile(START_PRICES, len(BOARD_CODES))
+
+    close = np.empty((days, len(codes)))
+    open_ = np.empty_like(close)
+    prev = start.copy()
+    for row in range(days):
+        up, down = np.round(prev * (1 + limits), 2), np.round(prev * (1 - limits), 2)
+        ticks = rng.integers(-3, 4, len(codes)) * 0.01
+        kind = rng.integers(0, 6, len(codes))
+        target = np.select(
+            [kind == 0, kind == 1, kind == 2, kind == 3, kind == 4],
+            [up, down,
+             np.round(prev * (1 + limits - LIMIT_TOLERANCE), 2) + ticks,
+             np.round(prev * (1 + THRESHOLDS["up"]), 2) + ticks,
+             np.round(prev * (1 - limits + LIMIT_TOLERANCE), 2) + ticks],
+            np.round(prev * (1 + rng.uniform(-0.04, 0.04, len(codes))), 2))
+        close[row] = np.clip(np.round(target, 2), np.maximum(down, 0.01), up)
+        open_[row] = np.clip(np.round(prev * (1 + rng.uniform(-0.02, 0.02, len(codes))), 2), down, up)
+        # keep every column inside its price range
+        prev = np.where((close[row] < start / 4) | (close[row] > start * 4), start, close[row])
+        close[row] = prev
+    high, low = np.maximum(open_, close), np.minimum(open_, close)
+    return codes, names, {"open": open_, "high": high, "low": low, "close": close}
+
+
+def check_limit_precision(seed=0) -> list:
+    """
+    Compare float32 and float64 panels of representative A-share prices (see representative_prices)
+    Returns a list of violations (empty if none)
+    """
+    import numpy as np
+    from crawler.price_panel import PricePanel, PRICE_FIELDS, PRICE_RELATIVE_ERROR
+    from analysis.screening import threshold_screen
+
+    codes, names, prices = representative_prices(seed)
+    n_days = len(prices["close"])
+    days = np.arange(n_days, dtype=np.int32) + np.int32(20000)
+    volume = np.ones((n_days, len(codes)))
+    problems = []
+    for factor in ADJUST_FACTORS:
+        # as load_price_panel: float32 storage, times a float64 factor, stored as float32 again
+        full = {f: prices[f] * factor for f in PRICE_FIELDS}
+        compact = {f: (prices[f].astype(np.float32) * factor).astype(np.float32) for f in PRICE_FIELDS}
+        u = PRICE_RELATIVE_ERROR if factor == 1.0 else 2 * PRICE_RELATIVE_ERROR
+        a = PricePanel(days, np.array(codes, dtype=object), {**full, "volume": volume}, names)
+        b = PricePanel(days, np.array(codes, dtype=object), {**compact, "volume": volume.astype(np.int64)}, names)
+        found = _streak_problems(a, b, u)
+        for direction, threshold in THRESHOLDS.items():
+            x = threshold_screen(a, n_days, threshold, direction)
+            y = threshold_screen(b, n_days, threshold, direction)
+            flipped = x["hits"] != y["hits"]
+            if flipped.any() and not _near(x["move"][flipped], threshold, _move_bound(x["move"][flipped], u)):
+                found.append(f"limit_{direction}: {np.count_nonzero(flipped)} hits changed away from the threshold")
+        problems.extend(f"factor {factor}: {p}" for p in found)
+    return problems
+
+
+def check_precision(folder: str) -> list:
+    """Compare the compact panel with the float64 one; returns a list of violations (empty if none)"""
+    import numpy as np
+    from crawler.price_panel import load_price_panel, PRICE_FIELDS, PRICE_RELATIVE_ERROR
+    from analysis.screening import intraday_move, threshold_screen, max_move_screen, range_change_screen
+
+    store_dir = _store(folder)
+    data_folder = os.path.join(folder, "daily_data_history")
+    full = load_price_panel(store_dir, data_folder, compact=False)
+    compact = load_price_panel(store_dir, data_folder)
+    u = PRICE_RELATIVE_ERROR
+    problems = []
+
+    if not (np.array_equal(full.days, compact.days) and np.array_equal(full.codes, compact.codes)):
+        return ["dates or codes differ"]
+    has_bar = ~np.isnan(full.close)
+    if not np.array_equal(has_bar, ~np.isnan(compact.close)):
+        problems.append("bars differ")
+    if not np.array_equal(np.nan_to_num(full.volume).astype(np.int64), compact.volume):
+        problems.append("volume differs")
+    for field in PRICE_FIELDS:
+        ref = getattr(full, field)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rel = np.nanmax(np.abs(getattr(compact, field) - ref) / np.abs(ref))
+        if rel > u:
+            problems.append(f"{field}: relative error {rel:.3g} > {u:.3g}")
+
+    def bound(move):
+        return _move_bound(move, u)
+
+    move, move32 = intraday_move(full), intraday_move(compact)
+    ok = np.isnan(move) | (np.abs(move32 - move) <= bound(move))
+    if not ok.all():
+        problems.append(f"intraday move beyond bound on {np.count_nonzero(~ok)} bars")
+
+    for direction, threshold in THRESHOLDS.items():
+        a = threshold_screen(full, RECENT_DAYS, threshold, direction)
+        b = threshold_screen(compact, RECENT_DAYS, threshold, direction)
+        flipped = a["hits"] != b["hits"]
+        if flipped.any() and not _near(a["move"][flipped], threshold, bound(a["move"][flipped])):
+            problems.append(f"limit_{direction}: {np.count_nonzero(flipped)} hits changed away from the threshold")
+
+    problems.extend(_streak_problems(full, compact, u))
+
+    a, b = max_move_screen(full, RECENT_DAYS, 10), max_move_screen(compact, RECENT_DAYS, 10)
+    if not np.array_equal(a["order"], b["order"]):
+        # a swap is only allowed between stocks whose float64 best moves are within rounding of each other
+        picked, swapped = a["best_move"][a["order"]], a["best_move"][b["order"]]
+        if len(picked) != len(swapped) or not _near(swapped, picked, 2 * bound(picked)):
+            problems.append("top_gainers: ranking changed without a near tie")
+
+    a, b = range_change_screen(full, RECENT_DAYS, 10), range_change_screen(compact, RECENT_DAYS, 10)
+    valid = ~np.isnan(a["change"])
+    if not (np.abs(b["change"][valid] - a["change"][valid]) <= bound(a["change"][valid])).all():
+        problems.append("range change beyond bound")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="500x2", help="Comma separated <stocks>x<years> universes")
+    parser.add_argument("--universe-dir", default=UNIVERSE_DIR)
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    parser.add_argument("--precision-only", action="store_true",
+                        help="Only check float32 precision on representative prices")
+    parser.add_argument("--form", help=argparse.SUPPRESS)
+    parser.add_argument("--folder", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.form:
+        print(json.dumps(measure_form(args.form, args.folder)))
+        return
+
+    problems = check_limit_precision()
+    results = [{"representative_prices": True, "precision_problems": problems}]
+    failed = bool(problems)
+    print("representative prices precision: " + ("ok" if not problems else "; ".join(problems)))
+    if args.precision_only:
+        sys.exit(1 if failed else 0)
+
+    print(f"{'universe':<12}{'form':<10}{'rows':>12}{'held_mb':>10}{'vs csv':>8}{'panel_mb':>10}{'frags_mb':>10}"
+          f"{'rss_mb':>10}")
+    for size in args.sizes.split(","):
+        stocks, years = (int(x) for x in size.split("x"))
+        print(f"Preparing {stocks} stocks x {years} years ...", file=sys.stderr)
+        folder = os.path.abspath(generate_universe(stocks, years, args.universe_dir))
+        _store(folder)
+        baseline = None
+        for form in FORMS:
+            out = subprocess.run([sys.executable, "-m", "benchmark.bench_panel_memory", "--form", form,
+                                  "--folder", folder], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True)
+            r = {"stocks": stocks, "years": years, **json.loads(out.stdout.strip().splitlines()[-1])}
+            baseline = baseline or r["bytes"]
+            results.append(r)
+            split = "".join(f"{r[k] / 2**20:>10.1f}" if k in r else f"{'-':>10}" for k in ("panel_bytes", "fragment_bytes"))
+            print(f"{size:<12}{form:<10}{r['rows']:>12}{r['bytes'] / 2**20:>10.1f}{r['bytes'] / baseline:>8.2f}{split}"
+                  f"{r['rss_mb']:>10.1f}")
+        problems = check_precision(folder)
+        results.append({"stocks": stocks, "years": years, "precision_problems": problems})
+        print(f"{size:<12}precision: " + ("ok" if not problems else "; ".join(problems)))
+        failed = failed or bool(problems)
+
+    if args.json:
+        os.makedirs(os.path.dirname(args.json) or ".", exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Cold-read benchmark: legacy per-stock CSV folder vs the columnar price store
+
+Run from the project root:
+    python -m benchmark.bench_price_store [--data-folder daily_data_history] [--store-dir daily_data_store]
+
+Each case runs in a fresh interpreter, so imports and in-process caches are not shared
+between measurements (the OS page cache is, so numbers are "cold process", warm disk).
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+CASES = ["csv_all", "store_all", "store_recent_30"]
+
+
+def folder_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for f in files:
+            total += os.path.getsize(os.path.join(root, f))
+    return total
+
+
+def run_case(case: str, data_folder: str, store_dir: str):
+    import pandas as pd
+    from crawler.price_store import read_prices, read_recent_prices
+
+    start = time.perf_counter()
+    if case == "csv_all":
+        rows = 0
+        for filename in os.listdir(data_folder):
+            if filename.endswith(".csv"):
+                df = pd.read_csv(os.path.join(data_folder, filename)).sort_values("date")
+                rows += len(df)
+    elif case == "store_all":
+        rows = len(read_prices(store_dir=store_dir))
+    elif case == "store_recent_30":
+        rows = len(read_recent_prices(30, columns=["open", "close"], store_dir=store_dir))
+    else:
+        raise ValueError(f"Unknown case: {case}")
+    elapsed = time.perf_counter() - start
+    print(f"{case},{rows},{elapsed:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data-folder", default="daily_data_history")
+    parser.add_argument("--store-dir", default="daily_data_store")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        run_case(args.case, args.data_folder, args.store_dir)
+        return
+
+    from crawler.price_store import ensure_price_store
+    ensure_price_store(args.data_folder, args.store_dir)
+
+    print(f"CSV folder : {folder_size(args.data_folder) / 1e6:.1f} MB")
+    print(f"Store      : {folder_size(args.store_dir) / 1e6:.1f} MB")
+    print(f"{'case':<18}{'rows':>10}{'best (s)':>12}{'mean (s)':>12}")
+
+    for case in CASES:
+        timings = []
+        rows = 0
+        for _ in range(args.repeat):
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmark.bench_price_store", "--case", case,
+                 "--data-folder", args.data_folder, "--store-dir", args.store_dir],
+                capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+            _, rows, elapsed = out.split(",")
+            timings.append(float(elapsed))
+        print(f"{case:<18}{int(rows):>10}{min(timings):>12.3f}{sum(timings) / len(timings):>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
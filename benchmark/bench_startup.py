@@ -0,0 +1,96 @@
+"""
+Startup benchmark: time to first menu and import cost per module
+
+Run from the project root:
+    python -m benchmark.bench_startup [--repeat 5] [--budget 1.0] [--json output/startup.json]
+
+Every measurement is a fresh interpreter. "first menu" starts `python Main.py`, answers 0 at
+the main menu and times the whole process, so it includes interpreter start-up and exit.
+Module costs come from `python -X importtime`; the per-module table shows the cumulative
+import time of each module imported on its own. Exits with status 1 if the best time to
+first menu is over --budget seconds.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+MODULES = [
+    "Main",
+    "crawler.session",
+    "crawler.jobs",
+    "crawler.price_store",
+    "crawler.price_panel",
+    "crawler.stock_price",
+    "analysis.screening",
+    "analysis.stock_search",
+    "analysis.stock_analysis",
+    "analysis.chart_render",
+    "pandas",
+    "pyarrow.parquet",
+    "matplotlib.pyplot",
+    "baostock",
+    "tqdm",
+]
+
+
+def time_first_menu() -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "Main.py"], input="0\n", capture_output=True, text=True, check=True)
+    return time.perf_counter() - start
+
+
+def import_times(module: str) -> dict:
+    """Cumulative import time (seconds) of every module loaded by `import module`, by name"""
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         capture_output=True, text=True, check=True).stderr
+    times = {}
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.0, help="Seconds allowed to reach the first menu")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    menu = [time_first_menu() for _ in range(args.repeat)]
+    print(f"Time to first menu: best {min(menu):.3f}s, mean {sum(menu) / len(menu):.3f}s")
+
+    main_loads = import_times("Main")
+    heavy = [m for m in ("pandas", "pyarrow", "matplotlib", "baostock", "tqdm", "numpy") if m in main_loads]
+    print(f"Heavy modules loaded by `import Main`: {', '.join(heavy) if heavy else 'none'}")
+
+    print(f"\n{'module':<28}{'import (s)':>12}")
+    modules = {}
+    for module in MODULES:
+        best = min(import_times(module).get(module, 0.0) for _ in range(args.repeat))
+        modules[module] = best
+        print(f"{module:<28}{best:>12.3f}")
+
+    if args.json:
+        os.makedirs(os.path.dirname(args.json) or ".", exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "first_menu_best": min(menu),
+                "first_menu_mean": sum(menu) / len(menu),
+                "heavy_modules_at_startup": heavy,
+                "import_seconds": modules,
+            }, f, indent=2)
+
+    if min(menu) > args.budget:
+        print(f"\nOver budget: {min(menu):.3f}s > {args.budget:.3f}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
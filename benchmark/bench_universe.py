@@ -0,0 +1,219 @@
+"""
+Loader / screener / financial-path benchmark on synthetic universes
+
+Run from the project root:
+    python -m benchmark.bench_universe                          # 500 stocks x 2 years
+    python -m benchmark.bench_universe --sizes 500x2,5000x10,10000x20 --cases load_panel,limit_up
+    python -m benchmark.bench_universe --full --compare output/benchmarks/last.json
+
+Universes come from benchmark/synth_universe.py (generated on first use, then reused; --full
+is the whole 500/5,000/10,000 stocks × 2/10/20 years grid). The financial cases merge and read
+8 quarters of synthetic reports for the first --fin-stocks stocks, on the first universe only.
+Every case runs in a fresh
+interpreter. It is timed --repeat times, then run once more under tracemalloc.
+Reported per case:
+    seconds     best wall time of the measured call (set-up such as loading the panel excluded)
+    peak_mb     peak Python/numpy allocation during the call (tracemalloc; Arrow buffers excluded)
+    rss_mb      peak resident size of the whole process, set-up included
+    rows        rows read / produced, as a sanity check between runs
+Results go to --json (default output/benchmarks/bench_universe.json). With --compare, the
+seconds and peak_mb of a previous results file are shown next to the new ones.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from benchmark.synth_universe import UNIVERSE_DIR, generate_universe  # noqa: E402
+
+
+FULL_GRID = [(s, y) for s in (500, 5000, 10000) for y in (2, 10, 20)]
+CASES = [
+    "csv_import", "read_all", "read_recent_30", "load_panel",
+    "limit_up", "limit_down", "top_gainers", "range_gainers", "limit_streaks",
+    "financial_merge", "financial_read",
+]
+# the financial cases use the first FIN_STOCKS stocks × FIN_QUARTERS quarters of synthetic reports
+# (the per-quarter merge is slow enough that the full universe would dominate the whole run);
+# being capped, they are measured on the first universe only
+FIN_STOCKS = 100
+FIN_QUARTERS = 8
+
+
+def _store(folder: str) -> str:
+    """The universe's price store, imported from its CSVs once"""
+    from crawler.price_store import ensure_price_store
+    with contextlib.redirect_stdout(io.StringIO()):
+        return ensure_price_store(os.path.join(folder, "daily_data_history"), os.path.join(folder, "daily_data_store"))
+
+
+def _financial_tables(folder: str, fin_stocks: int) -> list:
+    """Six raw statement tables per (stock, quarter), as the fetch step hands them over"""
+    import pandas as pd
+    from crawler.price_store import parse_history_filename
+    from crawler.replay import ReplayBaostock, STATEMENT_FIELDS
+    from analysis.financial_fetch import FINANCIAL_QUERIES
+
+    replay = ReplayBaostock(today="2025-07-23")
+    codes = sorted(parse_history_filename(f)[0] for f in os.listdir(os.path.join(folder, "daily_data_history")))
+    codes = codes[:fin_stocks]
+    quarters = [(2023 + i // 4, i % 4 + 1) for i in range(FIN_QUARTERS)]
+    units = []
+    for code in codes:
+        for y, q in quarters:
+            tables = {}
+            for prefix, query_name, _ in FINANCIAL_QUERIES:
+                fields, rows = replay._statement(query_name, code, y, q)
+                tables[prefix] = pd.DataFrame(rows, columns=fields)
+            units.append((code, y, q, tables))
+    assert set(STATEMENT_FIELDS) == {q for _, q, _ in FINANCIAL_QUERIES}
+    return units
+
+
+def prepare(case: str, folder: str, tmp: str, fin_stocks: int = FIN_STOCKS):
+    """Set-up outside the measurement; returns the measured callable (returning a row count)"""
+    from crawler.price_store import import_csv_folder, read_prices, read_recent_prices
+    from crawler.price_panel import load_price_panel, clear_panel_cache
+
+    data_folder = os.path.join(folder, "daily_data_history")
+    if case == "csv_import":
+        return lambda: import_csv_folder(data_folder, os.path.join(tmp, "store"))
+    store_dir = _store(folder)
+    # every repetition loads from disk, not from the previous repetition's in-process cache
+    clear_panel_cache()
+    if case == "read_all":
+        return lambda: len(read_prices(store_dir=store_dir))
+    if case == "read_recent_30":
+        return lambda: len(read_recent_prices(30, columns=["open", "close"], store_dir=store_dir))
+    if case == "load_panel":
+        return lambda: len(load_price_panel(store_dir, data_folder).dates)
+
+    if case in ("limit_up", "limit_down", "top_gainers", "range_gainers", "limit_streaks"):
+        from analysis.stock_search import filter_limit_up, filter_limit_down, filter_top_gainers, filter_limit_streaks
+        from crawler.stock_price import find_top_gainers
+        panel = load_price_panel(store_dir, data_folder)
+        screen = {
+            "limit_up": lambda: filter_limit_up(recent_days=30, panel=panel),
+            "limit_down": lambda: filter_limit_down(recent_days=30, panel=panel),
+            "top_gainers": lambda: filter_top_gainers(recent_days=30, top_n=10, panel=panel),
+            # writes output/top_gainers.xlsx relative to the (temporary) working directory
+            "range_gainers": lambda: find_top_gainers(recent_days=30, top_n=10, panel=panel),
+            # whole history, as recomputed after every update
+            "limit_streaks": lambda: filter_limit_streaks(min_streak=2, panel=panel),
+        }[case]
+        return lambda: len(screen())
+
+    if case in ("financial_merge", "financial_read"):
+        import pandas as pd
+        from analysis.financial_fetch import assemble_quarter
+        from analysis.fundamentals_store import normalize_quarter, upsert_fundamentals, read_fundamentals
+        units = _financial_tables(folder, fin_stocks)
+        fund_dir = os.path.join(tmp, "fundamentals")
+
+        def merge():
+            rows = [normalize_quarter(assemble_quarter(tables, y, q), code, y, q) for code, y, q, tables in units]
+            df = pd.concat(rows, ignore_index=True)
+            upsert_fundamentals(df, fund_dir)
+            return len(df)
+
+        if case == "financial_merge":
+            return merge
+        merge()
+        return lambda: len(read_fundamentals(store_dir=fund_dir))
+    raise ValueError(f"Unknown case: {case}")
+
+
+def run_case(case: str, folder: str, repeat: int, fin_stocks: int = FIN_STOCKS) -> dict:
+    """Child process: measure one case and return its result dict"""
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        times = []
+        rows = None
+        for _ in range(repeat):
+            func = prepare(case, folder, tempfile.mkdtemp(dir=tmp), fin_stocks)
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                rows = func()
+                times.append(time.perf_counter() - start)
+
+        func = prepare(case, folder, tempfile.mkdtemp(dir=tmp), fin_stocks)
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {"seconds": min(times), "peak_mb": peak / 2**20, "rss_mb": rss_kb / 1024, "rows": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="500x2", help="Comma separated <stocks>x<years> universes")
+    parser.add_argument("--full", action="store_true", help="The full 500/5000/10000 x 2/10/20 grid")
+    parser.add_argument("--cases", default=",".join(CASES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--fin-stocks", type=int, default=FIN_STOCKS, help="Stocks in the financial cases")
+    parser.add_argument("--universe-dir", default=UNIVERSE_DIR)
+    parser.add_argument("--json", default="output/benchmarks/bench_universe.json")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--folder", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(args.case, args.folder, args.repeat, args.fin_stocks)))
+        return
+
+    sizes = FULL_GRID if args.full else [tuple(int(x) for x in s.split("x")) for s in args.sizes.split(",")]
+    cases = args.cases.split(",")
+    previous = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = {(r["stocks"], r["years"], r["case"]): r for r in json.load(f)["results"]}
+
+    results = []
+    print(f"{'universe':<12}{'case':<18}{'seconds':>10}{'peak_mb':>10}{'rss_mb':>10}{'rows':>12}"
+          + (f"{'was s':>10}{'was mb':>10}" if previous else ""))
+    for stocks, years in sizes:
+        print(f"Preparing {stocks} stocks x {years} years ...", file=sys.stderr)
+        folder = os.path.abspath(generate_universe(stocks, years, args.universe_dir))
+        for case in cases:
+            if case.startswith("financial") and (stocks, years) != sizes[0]:
+                continue
+            proc = subprocess.run([sys.executable, "-m", "benchmark.bench_universe", "--case", case,
+                                   "--folder", folder, "--repeat", str(args.repeat), "--fin-stocks", str(args.fin_stocks)],
+                                  cwd=PROJECT_ROOT, capture_output=True, text=True)
+            if proc.returncode != 0:
+                error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"
+                result = {"stocks": stocks, "years": years, "case": case, "error": error}
+                print(f"{f'{stocks}x{years}y':<12}{case:<18}  failed: {error}")
+            else:
+                result = {"stocks": stocks, "years": years, "case": case,
+                          **json.loads(proc.stdout.strip().splitlines()[-1])}
+                line = (f"{f'{stocks}x{years}y':<12}{case:<18}{result['seconds']:>10.3f}{result['peak_mb']:>10.1f}"
+                        f"{result['rss_mb']:>10.1f}{result['rows']:>12}")
+                old = previous.get((stocks, years, case))
+                if old and "seconds" in old:
+                    line += f"{old['seconds']:>10.3f}{old['peak_mb']:>10.1f}"
+                print(line)
+            results.append(result)
+
+    os.makedirs(os.path.dirname(args.json) or ".", exist_ok=True)
+    with open(args.json, "w", encoding="utf-8") as f:
+        json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+                   "repeat": args.repeat, "fin_stocks": args.fin_stocks, "results": results}, f, indent=2)
+    print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
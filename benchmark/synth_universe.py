@@ -0,0 +1,119 @@
+"""
+Synthetic market generator: daily_data_history-shaped CSV folders of any size
+
+    python -m benchmark.synth_universe --stocks 5000 --years 10 [--out output/bench_universe]
+
+Writes <out>/<stocks>x<years>y/daily_data_history/<name>_<exchange>_<number>.csv (UTF-8 with BOM,
+columns date, stock_code, open, high, low, close, volume, like the downloaded files) and a
+universe.json with the parameters. The same arguments always give the same files. A folder that
+already holds a complete universe with those parameters is reused as it is.
+
+The market is meant to exercise the screeners like real data: fat-tailed daily returns capped
+at each board's price limit (STAR 688 / ChiNext 300 ±20%, ST ±5%, others ±10%), so limit-up
+and limit-down days occur. Some stocks list after the start, and about 1% of days are suspensions.
+"""
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from crawler.replay import synthetic_codes  # noqa: E402
+
+
+UNIVERSE_DIR = "output/bench_universe"
+END_DATE = "2025-07-23"
+TRADING_DAYS_PER_YEAR = 244
+
+
+def synthetic_name(i: int) -> str:
+    # every 50th stock is under special treatment
+    return f"ST合成{i:05d}" if i % 50 == 7 else f"合成{i:05d}"
+
+
+def price_limit(code: str, name: str) -> float:
+    if "ST" in name:
+        return 0.05
+    if code[3:6] == "688" or code[3:6] == "300":
+        return 0.2
+    return 0.1
+
+
+def stock_history(code: str, name: str, days: np.ndarray, rng: np.random.Generator) -> pd.DataFrame:
+    """One stock's forward-adjusted daily bars over (a listed, unsuspended subset of) days"""
+    n = len(days)
+    listed = rng.integers(0, n // 2) if rng.random() < 0.1 else 0
+    keep = rng.random(n - listed) > 0.01
+    limit = price_limit(code, name)
+
+    returns = np.clip(0.0004 + 0.022 * rng.standard_t(3, n - listed), -limit, limit)[keep]
+    close = rng.uniform(3, 80) * np.exp(np.cumsum(np.log1p(returns)))
+    preclose = np.concatenate([[close[0] / (1 + returns[0])], close[:-1]])
+    gap = np.clip(0.006 * rng.standard_normal(len(close)), -limit, limit)
+    open_ = preclose * (1 + gap)
+    high = np.minimum(np.maximum(open_, close) * (1 + np.abs(0.01 * rng.standard_normal(len(close)))),
+                      preclose * (1 + limit))
+    low = np.maximum(np.minimum(open_, close) * (1 - np.abs(0.01 * rng.standard_normal(len(close)))),
+                     preclose * (1 - limit))
+    volume = (rng.lognormal(16, 0.8, len(close)) * (1 + 5 * np.abs(returns))).astype(np.int64)
+
+    return pd.DataFrame({
+        "date": days[listed:][keep].astype(str),
+        "stock_code": code,
+        "open": open_, "high": high, "low": low, "close": close,
+        "volume": volume,
+    })
+
+
+def generate_universe(stocks: int, years: int, out_dir=UNIVERSE_DIR, end_date=END_DATE, seed=0) -> str:
+    """
+    Write (or reuse) one synthetic universe
+    Returns the universe folder; its daily_data_history/ subfolder holds the CSVs.
+    """
+    folder = os.path.join(out_dir, f"{stocks}x{years}y")
+    data_folder = os.path.join(folder, "daily_data_history")
+    params = {"stocks": stocks, "years": years, "end_date": end_date, "seed": seed}
+    meta_path = os.path.join(folder, "universe.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            if json.load(f) == params:
+                return folder
+
+    os.makedirs(data_folder, exist_ok=True)
+    end = np.busday_offset(np.datetime64(end_date), 0, roll="backward")
+    days = np.busday_offset(end, np.arange(-TRADING_DAYS_PER_YEAR * years + 1, 1))
+
+    for i, code in enumerate(synthetic_codes(stocks)):
+        name = synthetic_name(i)
+        rng = np.random.default_rng([seed, i])
+        df = stock_history(code, name, days, rng)
+        path = os.path.join(data_folder, f"{name}_{code.replace('.', '_')}.csv")
+        df.to_csv(path, index=False, encoding="utf-8-sig", float_format="%.8f")
+        if (i + 1) % 500 == 0:
+            print(f"  {i + 1}/{stocks} stocks written")
+
+    # written last, so an interrupted generation is redone rather than reused
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(params, f)
+    return folder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stocks", type=int, default=500)
+    parser.add_argument("--years", type=int, default=2)
+    parser.add_argument("--out", default=UNIVERSE_DIR)
+    parser.add_argument("--end-date", default=END_DATE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    folder = generate_universe(args.stocks, args.years, args.out, args.end_date, args.seed)
+    print(f"Universe ready: {folder}")
+
+
+if __name__ == "__main__":
+    main()
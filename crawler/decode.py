@@ -0,0 +1,118 @@
+import io
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+
+from crawler import metrics
+
+
+# column type per query: "str", "float", "int" or "date"; fields not listed get the query's default
+PRICE_SCHEMA = {
+    "date": "date", "code": "str", "open": "float", "high": "float", "low": "float", "close": "float",
+    "preclose": "float", "volume": "int", "amount": "float", "adjustflag": "str", "turn": "float",
+    "tradestatus": "int", "pctChg": "float", "isST": "int",
+}
+STATEMENT_SCHEMA = {"code": "str", "pubDate": "date", "statDate": "date"}
+ADJUST_FACTOR_SCHEMA = {"code": "str", "dividOperateDate": "date"}
+CALENDAR_SCHEMA = {"calendar_date": "date", "is_trading_day": "int"}
+
+SCHEMAS = {
+    "query_history_k_data_plus": (PRICE_SCHEMA, "float"),
+    "query_profit_data": (STATEMENT_SCHEMA, "float"),
+    "query_operation_data": (STATEMENT_SCHEMA, "float"),
+    "query_growth_data": (STATEMENT_SCHEMA, "float"),
+    "query_balance_data": (STATEMENT_SCHEMA, "float"),
+    "query_cash_flow_data": (STATEMENT_SCHEMA, "float"),
+    "query_dupont_data": (STATEMENT_SCHEMA, "float"),
+    "query_adjust_factor": (ADJUST_FACTOR_SCHEMA, "float"),
+    "query_trade_dates": (CALENDAR_SCHEMA, "str"),
+    # lists are written back to CSV as they came, so they stay text
+    "query_zz500_stocks": ({}, "str"),
+    "query_all_stock": ({}, "str"),
+}
+
+# rows parsed per step (a baostock page holds 10,000)
+CHUNK_ROWS = 10000
+
+_ARROW_TYPES = {"str": pa.string(), "float": pa.float64(), "int": pa.int64(), "date": pa.date32()}
+
+
+def iter_pages(rs):
+    """
+    Yield the rows of a result set a page at a time (lists of string lists)
+    Takes each page baostock has already received in one slice instead of one get_row_data() per
+    row; rs.next() then fetches the following page. Result sets without a row cursor are read
+    row by row.
+    """
+    if not hasattr(rs, "cur_row_num"):
+        page = []
+        while rs.next():
+            page.append(rs.get_row_data())
+        yield page
+        return
+    while rs.next():
+        page = rs.data[rs.cur_row_num:]
+        rs.cur_row_num = len(rs.data)
+        yield page
+
+
+def fetch_rows(rs) -> list:
+    """Every row of a result set, as strings"""
+    rows = []
+    for page in iter_pages(rs):
+        rows.extend(page)
+    return rows
+
+
+def column_types(query_name: str, fields: list) -> dict:
+    schema, default = SCHEMAS.get(query_name, ({}, "str"))
+    return {field: schema.get(field, default) for field in fields}
+
+
+def _parse_chunk(rows: list, fields: list, types: dict) -> pa.Table:
+    # baostock strips all whitespace from answers, so tabs and newlines cannot occur inside values
+    text = "\n".join(map("\t".join, rows)).encode("utf-8")
+    metrics.count("bytes.decoded", len(text))
+    return pacsv.read_csv(
+        io.BytesIO(text),
+        read_options=pacsv.ReadOptions(column_names=fields),
+        parse_options=pacsv.ParseOptions(delimiter="\t", quote_char=False),
+        convert_options=pacsv.ConvertOptions(
+            column_types={f: _ARROW_TYPES[types[f]] for f in fields},
+            null_values=[""], strings_can_be_null=False,
+        ),
+    )
+
+
+def decode_pages(pages, fields: list, types: dict) -> pd.DataFrame:
+    """
+    Convert pages of string rows to a DataFrame with one typed column per field
+    Every chunk of up to CHUNK_ROWS rows is parsed in one go, so the temporary text stays small.
+    Empty strings become NaN / NaT in numeric and date columns (ints with gaps become float).
+    """
+    tables = []
+    for page in pages:
+        for i in range(0, len(page), CHUNK_ROWS):
+            tables.append(_parse_chunk(page[i:i + CHUNK_ROWS], fields, types))
+    if not tables:
+        return pd.DataFrame({f: pd.Series(dtype=_empty_dtype(types[f])) for f in fields})
+    return pa.concat_tables(tables).to_pandas(date_as_object=False, self_destruct=True)
+
+
+def decode_rows(rows: list, fields: list, types: dict) -> pd.DataFrame:
+    """decode_pages for rows already in memory"""
+    return decode_pages([rows], fields, types)
+
+
+def _empty_dtype(kind: str) -> str:
+    return {"str": "object", "float": "float64", "int": "int64", "date": "datetime64[ms]"}[kind]
+
+
+def decode_result(rs, query_name: str) -> pd.DataFrame:
+    """
+    Read a whole baostock result set into a typed DataFrame, using the schema of query_name
+    (see SCHEMAS; unknown queries decode as text). Columns follow rs.fields.
+    """
+    fields = list(rs.fields)
+    return decode_pages(iter_pages(rs), fields, column_types(query_name, fields))
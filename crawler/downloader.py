@@ -0,0 +1,242 @@
+import atexit
+import multiprocessing as mp
+import random
+import time
+from functools import partial
+
+from crawler import metrics
+from crawler.session import ensure_login, reset_after_fork, set_offline
+from crawler.stages import QUEUE_SIZE, StagedRun
+
+
+class TokenBucket:
+    """
+    Requests-per-second limiter shared by every worker process of a download run
+    Parameters:
+        rate: Tokens added per second (sustained requests per second)
+        capacity: Maximum burst size; defaults to one second worth of tokens
+    The rate lives in shared memory, so a long-lived pool can be re-limited between runs.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self._lock = mp.Lock()
+        self._rate = mp.Value("d", 0.0, lock=False)
+        self._capacity = mp.Value("d", 1.0, lock=False)
+        self._tokens = mp.Value("d", 0.0, lock=False)
+        self._last = mp.Value("d", time.monotonic(), lock=False)
+        self.set_rate(rate, capacity)
+
+    @property
+    def rate(self) -> float:
+        return self._rate.value
+
+    @property
+    def capacity(self) -> float:
+        return self._capacity.value
+
+    def set_rate(self, rate: float, capacity: float = None):
+        with self._lock:
+            self._rate.value = float(rate)
+            self._capacity.value = float(capacity if capacity is not None else max(rate, 1.0))
+            self._tokens.value = self._capacity.value
+            self._last.value = time.monotonic()
+
+    def acquire(self):
+        """Block until one token is available, then take it"""
+        while True:
+            with self._lock:
+                rate = self._rate.value
+                if rate <= 0:
+                    return
+                now = time.monotonic()
+                tokens = min(self._capacity.value, self._tokens.value + (now - self._last.value) * rate)
+                self._last.value = now
+                if tokens >= 1:
+                    self._tokens.value = tokens - 1
+                    return
+                self._tokens.value = tokens
+                wait = (1 - tokens) / rate
+            time.sleep(wait)
+
+
+# per-process state: the rate limiter of the pool (or of the in-process run)
+_worker = {}
+
+
+def _init_worker(bucket: TokenBucket, login: bool):
+    """Pool initializer: every worker process opens its own baostock session and keeps it"""
+    _worker["bucket"] = bucket
+    reset_after_fork()
+    set_offline(not login)
+    if login:
+        if not ensure_login():
+            print("❌ Worker login failed")
+
+
+def _run_one(item: tuple):
+    """
+    Run one task with rate limiting and retry
+    item: (task_func, task, retries, backoff, profile)
+    Returns (task, result or None, error message or None, attempts used, metrics)
+    profile is True/False in pool workers (following the parent's profiling switch) and None when
+    running in the parent itself. With True, metrics holds what the task recorded, for the parent
+    to merge; otherwise it is None.
+    """
+    task_func, task, retries, backoff, profile = item
+    if profile is not None:
+        metrics.set_enabled(profile)
+    outcome = None
+    error = None
+    for attempt in range(retries + 1):
+        with metrics.span("rate_limit.wait"):
+            _worker["bucket"].acquire()
+        try:
+            outcome = (task, task_func(*task), None, attempt + 1)
+            break
+        except Exception as e:
+            error = str(e)
+            metrics.count("tasks.retried" if attempt < retries else "tasks.failed")
+            if attempt < retries:
+                # exponential backoff with jitter so retries from many workers do not line up
+                with metrics.span("retry.backoff"):
+                    time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+    if outcome is None:
+        outcome = (task, None, error, retries + 1)
+    return outcome + ((metrics.drain() if profile else None),)
+
+
+class SessionPool:
+    """
+    Worker processes that each log in to baostock once and keep that session for their whole life
+    Reused by every run_tasks call with the same size, so back-to-back stages (price update,
+    financial download, ...) do not pay the login cost again. Sessions that expire are
+    re-opened inside the worker by crawler.session.call.
+    """
+
+    def __init__(self, workers: int, login: bool = True):
+        self.workers = workers
+        self.login = login
+        self.bucket = TokenBucket(0)
+        self._pool = mp.Pool(workers, initializer=_init_worker, initargs=(self.bucket, login))
+
+    def imap(self, task_func, tasks: list, requests_per_second: float, retries: int, backoff: float):
+        self.bucket.set_rate(requests_per_second)
+        profile = metrics.enabled()
+        items = ((task_func, task, retries, backoff, profile) for task in tasks)
+        return self._pool.imap_unordered(_run_one, items)
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+
+# (workers, login) -> SessionPool kept alive for the rest of the program
+_pools = {}
+
+
+def get_session_pool(workers: int, login: bool = True) -> SessionPool:
+    key = (workers, login)
+    if key not in _pools:
+        if not _pools:
+            atexit.register(close_session_pools)
+        _pools[key] = SessionPool(workers, login)
+    return _pools[key]
+
+
+def close_session_pools():
+    """Stop all pooled workers (and with them their baostock sessions)"""
+    for pool in _pools.values():
+        pool.close()
+    _pools.clear()
+
+
+def run_tasks(task_func, tasks: list, workers=1, requests_per_second=10.0, retries=3, backoff=0.5, login=True):
+    """
+    Run remote calls across a pool of baostock sessions, yielding results as they complete
+    Parameters:
+        task_func: Module-level function called as task_func(*task); raises on a failed request
+        tasks: List of argument tuples
+        workers: Number of worker processes; 1 runs in this process on the current baostock session
+            (opened by the first query the query cache cannot answer). Pools are kept between calls.
+        requests_per_second: Shared limit across all workers (0 disables limiting)
+        retries: Extra attempts per task after a failure, with exponential backoff
+        login: Log every worker in to baostock (off for local stand-ins)
+    Yields:
+        (task, result or None, error message or None, attempts used)
+    """
+    if workers <= 1:
+        # no login here: the first query the cache cannot answer opens the session (crawler.session.call)
+        _worker["bucket"] = TokenBucket(requests_per_second)
+        was_offline = set_offline(not login)
+        try:
+            for task in tasks:
+                yield _run_one((task_func, task, retries, backoff, None))[:4]
+        finally:
+            set_offline(was_offline)
+        return
+
+    pool = get_session_pool(workers, login)
+    remaining = len(tasks)
+    try:
+        for result in pool.imap(task_func, tasks, requests_per_second, retries, backoff):
+            remaining -= 1
+            metrics.merge(result[4])
+            yield result[:4]
+    finally:
+        if remaining:
+            # abandoned mid-run: stop the queued tasks rather than let them run in the background
+            pool.close()
+            _pools.pop((workers, login), None)
+
+
+def _fetch_and_decode(fetch_func, decode_func, code: str, start_date: str, end_date: str, query_func=None):
+    """Pool task: both halves of one download in the worker"""
+    return decode_func(code, fetch_func(code, start_date, end_date, query_func=query_func))
+
+
+def _decode_stage(decode_func):
+    def decode(result):
+        task, raw, error, attempts = result
+        if error is not None:
+            return task[0], None, error, attempts
+        try:
+            return task[0], decode_func(task[0], raw), None, attempts
+        except Exception as e:
+            metrics.count("tasks.failed")
+            return task[0], None, f"decode failed: {e}", attempts
+    return decode
+
+
+def download_prices(fetch_func, tasks: list, workers=1, requests_per_second=10.0, retries=3, backoff=0.5,
+                    query_func=None, decode_func=None, queue_size=QUEUE_SIZE) -> StagedRun:
+    """
+    Download daily bars for many stocks, yielding results as they complete
+    Fetching, decoding and whatever the caller does with each result (writing it) overlap: they
+    run as stages connected by bounded queues (see crawler.stages), so with a single session
+    the network is kept busy while earlier stocks are decoded and written.
+    Parameters:
+        fetch_func: fetch_func(code, start_date, end_date, query_func=...), raising on a failed
+            request; returns the DataFrame, or the raw answer when decode_func is given
+        tasks: List of (code, start_date, end_date)
+        query_func: Replacement for bs.query_history_k_data_plus (e.g. a local fake result set);
+            must be a module-level function when workers > 1. No login is made when it is given.
+        decode_func: decode_func(code, raw) -> DataFrame (e.g. decode_price_rows, with fetch_price_rows
+            as fetch_func). With one worker it runs on its own thread; pool workers decode what
+            they fetched.
+        queue_size: Results held between two stages (0 runs fetch, decode and the caller in turn)
+        Other parameters as in run_tasks
+    Returns:
+        StagedRun yielding (code, DataFrame or None, error message or None, attempts used);
+        its stats give each stage's busy / starved / blocked time (format_utilization)
+    """
+    stages = []
+    if decode_func is not None and workers > 1:
+        fetch_func = partial(_fetch_and_decode, fetch_func, decode_func)
+    elif decode_func is not None:
+        stages.append(("decode", _decode_stage(decode_func)))
+    task_func = partial(fetch_func, query_func=query_func) if query_func is not None else fetch_func
+    results = run_tasks(task_func, tasks, workers=workers, requests_per_second=requests_per_second,
+                        retries=retries, backoff=backoff, login=query_func is None)
+    if not stages:
+        results = ((task[0], df, error, attempts) for task, df, error, attempts in results)
+    return StagedRun(results, stages, queue_size=queue_size)
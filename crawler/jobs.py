@@ -0,0 +1,123 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+JOBS_DIR = "output/jobs"
+
+
+@contextmanager
+def atomic_path(path: str):
+    """
+    Yield a temporary path next to `path`; it replaces `path` only if the block finishes
+    A crash or Ctrl-C mid-write leaves the previous file (or no file) instead of a truncated one.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def atomic_write_csv(df, path: str, **kwargs):
+    """df.to_csv through a temp file + rename (UTF-8 with BOM unless told otherwise)"""
+    kwargs.setdefault("index", False)
+    kwargs.setdefault("encoding", "utf-8-sig")
+    with atomic_path(path) as tmp_path:
+        df.to_csv(tmp_path, **kwargs)
+
+
+def atomic_write_json(obj, path: str):
+    with atomic_path(path) as tmp_path:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            # dumps, unlike dump, goes through the C encoder
+            f.write(json.dumps(obj, ensure_ascii=False))
+
+
+def _journal_path(job_id: str, jobs_dir: str) -> str:
+    return os.path.join(jobs_dir, f"{job_id}.jsonl")
+
+
+def _append(path: str, record: dict):
+    # one line per event, flushed to disk before the unit counts as recorded
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def create_job(kind: str, params: dict, units: list, jobs_dir: str = JOBS_DIR) -> str:
+    """
+    Start a journal for a bulk download
+    Parameters:
+        kind: Job type, e.g. 'prices' or 'financials'
+        params: Everything needed to rerun the job (date range, options, ...)
+        units: Unit keys that make up the job, e.g. 'sh.600000|2023-01-01|2025-07-01'
+    Returns the job id
+    """
+    os.makedirs(jobs_dir, exist_ok=True)
+    job_id = f"{kind}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{time.time_ns() % 1000000:06d}"
+    _append(_journal_path(job_id, jobs_dir), {
+        "event": "job", "kind": kind, "params": params, "units": list(units),
+        "created": datetime.now().isoformat(timespec="seconds"),
+    })
+    return job_id
+
+
+def record_units(job_id: str, units: list, status: str = "done", error: str = None, jobs_dir: str = JOBS_DIR):
+    """Mark units as 'done' or 'failed' (a later record for the same unit wins)"""
+    record = {"event": status, "units": list(units)}
+    if error:
+        record["error"] = error
+    _append(_journal_path(job_id, jobs_dir), record)
+
+
+def load_job(job_id: str, jobs_dir: str = JOBS_DIR) -> dict:
+    """
+    Replay a journal
+    Returns dict with kind, params, units, done (set), failed (unit → error), pending (list in job order)
+    A torn last line from a crash mid-append is ignored.
+    """
+    job = None
+    status = {}
+    with open(_journal_path(job_id, jobs_dir), "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record["event"] == "job":
+                job = {"id": job_id, "kind": record["kind"], "params": record["params"],
+                       "units": record["units"], "created": record.get("created")}
+            else:
+                for unit in record["units"]:
+                    status[unit] = (record["event"], record.get("error"))
+
+    job["done"] = {u for u, (s, _) in status.items() if s == "done"}
+    job["failed"] = {u: e for u, (s, e) in status.items() if s == "failed"}
+    job["pending"] = [u for u in job["units"] if u not in job["done"]]
+    return job
+
+
+def list_jobs(kind: str = None, unfinished_only: bool = True, jobs_dir: str = JOBS_DIR) -> list:
+    """Jobs in the journal folder, newest first"""
+    if not os.path.isdir(jobs_dir):
+        return []
+    jobs = []
+    for filename in sorted(os.listdir(jobs_dir), reverse=True):
+        if not filename.endswith(".jsonl"):
+            continue
+        job = load_job(filename[:-len(".jsonl")], jobs_dir)
+        if kind is not None and job["kind"] != kind:
+            continue
+        if unfinished_only and not job["pending"]:
+            continue
+        jobs.append(job)
+    return jobs
@@ -0,0 +1,189 @@
+"""
+Opt-in run profile: timing spans, counters and latency histograms
+
+    with span("fetch.prices"):
+        rs = query(...)
+    count("rows.prices", len(df))
+    observe("latency.prices", seconds, label=code)
+
+Everything is a no-op until enable() is called (or the CSI500_PROFILE environment variable
+names a report file), so the calls can stay in hot paths: a disabled span() is one flag check
+returning a shared do-nothing context manager. When enabled, write_report() (run automatically
+at exit if a path was given) dumps a JSON report: per span count / total / mean / max seconds,
+counters, and per histogram count, percentiles, log-scale buckets and the slowest labels.
+Pool workers send their numbers back with each task result (see crawler.downloader).
+"""
+import atexit
+import bisect
+import json
+import os
+import time
+
+
+PROFILE_ENV = "CSI500_PROFILE"
+# histogram bucket upper bounds in seconds (log scale); the last bucket is open-ended
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+# slowest labelled samples kept per histogram in the report
+SLOWEST = 10
+
+_state = {"enabled": False, "path": None, "started": None}
+# name -> [count, total seconds, max seconds]
+_spans = {}
+# name -> number
+_counters = {}
+# name -> list of (value, label)
+_samples = {}
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        entry = _spans.get(self.name)
+        if entry is None:
+            _spans[self.name] = [1, elapsed, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+            if elapsed > entry[2]:
+                entry[2] = elapsed
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def enabled() -> bool:
+    return _state["enabled"]
+
+
+def enable(path: str = None):
+    """Start collecting; with a path, the report is written there when the program exits"""
+    if not _state["enabled"]:
+        _state.update(enabled=True, started=time.time())
+    if path and not _state["path"]:
+        # absolute now, so a later chdir (e.g. into a benchmark's scratch folder) does not move it
+        _state["path"] = os.path.abspath(path)
+        atexit.register(write_report)
+
+
+def disable():
+    _state["enabled"] = False
+
+
+def set_enabled(flag: bool):
+    """Switch collection on/off without a report file (pool workers follow the parent this way)"""
+    _state["enabled"] = flag
+
+
+def span(name: str):
+    """Context manager timing one stage occurrence under `name`"""
+    return _Span(name) if _state["enabled"] else _NULL_SPAN
+
+
+def count(name: str, n=1):
+    if _state["enabled"]:
+        _counters[name] = _counters.get(name, 0) + n
+
+
+def observe(name: str, value: float, label: str = None):
+    """Add one sample (e.g. one stock's fetch latency in seconds) to histogram `name`"""
+    if _state["enabled"]:
+        _samples.setdefault(name, []).append((value, label))
+
+
+def drain() -> dict:
+    """Take everything recorded so far in this process and reset (to ship it to another process)"""
+    snapshot = {"spans": dict(_spans), "counters": dict(_counters), "samples": dict(_samples)}
+    _spans.clear()
+    _counters.clear()
+    _samples.clear()
+    return snapshot
+
+
+def merge(snapshot: dict):
+    """Add a drained snapshot from another process"""
+    if not snapshot:
+        return
+    for name, (n, total, peak) in snapshot["spans"].items():
+        entry = _spans.setdefault(name, [0, 0.0, 0.0])
+        entry[0] += n
+        entry[1] += total
+        entry[2] = max(entry[2], peak)
+    for name, n in snapshot["counters"].items():
+        _counters[name] = _counters.get(name, 0) + n
+    for name, samples in snapshot["samples"].items():
+        _samples.setdefault(name, []).extend(samples)
+
+
+def _histogram(samples: list) -> dict:
+    values = sorted(v for v, _ in samples)
+    buckets = [0] * (len(BUCKETS) + 1)
+    for v in values:
+        buckets[bisect.bisect_left(BUCKETS, v)] += 1
+    labels = [f"<={b:g}s" for b in BUCKETS] + [f">{BUCKETS[-1]:g}s"]
+
+    def pct(p):
+        return values[min(int(p * len(values)), len(values) - 1)]
+
+    slowest = sorted(samples, key=lambda s: s[0], reverse=True)[:SLOWEST]
+    return {
+        "count": len(values), "mean": sum(values) / len(values),
+        "p50": pct(0.5), "p90": pct(0.9), "p99": pct(0.99), "max": values[-1],
+        "buckets": {label: n for label, n in zip(labels, buckets) if n},
+        "slowest": [[label, value] for value, label in slowest if label is not None],
+    }
+
+
+def report() -> dict:
+    return {
+        "started": _state["started"] and time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(_state["started"])),
+        "wall_seconds": _state["started"] and time.time() - _state["started"],
+        "spans": {name: {"count": n, "total": total, "mean": total / n, "max": peak}
+                  for name, (n, total, peak) in sorted(_spans.items())},
+        "counters": dict(sorted(_counters.items())),
+        "histograms": {name: _histogram(samples) for name, samples in sorted(_samples.items()) if samples},
+    }
+
+
+def write_report(path: str = None) -> str:
+    """Write the JSON report (to the enable() path by default); returns the path or None"""
+    path = path or _state["path"]
+    if not path or not _state["started"]:
+        return None
+    from crawler.jobs import atomic_write_json
+    atomic_write_json(report(), path)
+    print(f"Profile written to {path}")
+    return path
+
+
+def print_summary(top: int = 15):
+    """Spans by total time, for a quick look in the terminal"""
+    rows = sorted(_spans.items(), key=lambda item: item[1][1], reverse=True)[:top]
+    if not rows:
+        return
+    print(f"\n{'span':<32}{'count':>8}{'total s':>10}{'mean ms':>10}")
+    for name, (n, total, _) in rows:
+        print(f"{name:<32}{n:>8}{total:>10.2f}{total / n * 1000:>10.2f}")
+
+
+if os.environ.get(PROFILE_ENV):
+    enable(os.environ[PROFILE_ENV])
@@ -0,0 +1,201 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from crawler import metrics
+from crawler.price_store import (
+    STORE_DIR,
+    PRICE_COLUMNS,
+    NAMES_FILE,
+    ADJUST_FILE,
+    ADJUST_MODES,
+    BASIS_FILE,
+    ensure_price_store,
+    load_price_basis,
+    load_adjust_factors,
+    adjustment_multipliers,
+    load_stock_names,
+    stock_label,
+    fragment_paths,
+)
+
+
+PANEL_FIELDS = ["open", "high", "low", "close", "volume"]
+PRICE_FIELDS = ["open", "high", "low", "close"]
+# day offsets count from here (the Parquet date32 epoch)
+DAY_EPOCH = np.datetime64("1970-01-01", "D")
+# float32 keeps 24 significant bits: any stored price is off by at most this relative amount
+PRICE_RELATIVE_ERROR = 2.0 ** -24
+
+# (path, compact) -> ((mtime_ns, size), DataFrame), shared by every panel built in this process
+_FILE_CACHE = {}
+# (store_dir, compact, adjust) -> (signature of all fragments, names and factors, PricePanel)
+_PANEL_CACHE = {}
+
+
+class PricePanel:
+    """
+    Date × stock price arrays aligned on one trading-date index
+    Attributes:
+        days: np.ndarray of int32 day offsets from DAY_EPOCH, ascending (union of all stocks' trading dates)
+        dates: the same dates as datetime64[D]
+        codes: np.ndarray of stock codes, ascending
+        names: Code → company name mapping
+        open / high / low / close: arrays of shape (len(dates), len(codes)), NaN where a stock
+            has no bar on that date; float32 in a compact panel, float64 otherwise
+        volume: same shape; int64 with 0 where there is no bar in a compact panel, float64 with NaN otherwise
+    """
+
+    def __init__(self, days, codes, arrays: dict, names: dict):
+        self.days = days
+        self.dates = DAY_EPOCH + days
+        self.codes = codes
+        self.names = names
+        for field in PANEL_FIELDS:
+            setattr(self, field, arrays[field])
+
+    def __len__(self):
+        return len(self.dates)
+
+    def labels(self) -> list:
+        """Display labels in column order, e.g. '万丰奥威_sz_002085'"""
+        return [stock_label(code, self.names) for code in self.codes]
+
+    def frame(self, field: str) -> pd.DataFrame:
+        """One field as a DataFrame indexed by date with one column per stock"""
+        return pd.DataFrame(getattr(self, field), index=pd.DatetimeIndex(self.dates), columns=self.codes)
+
+    def memory_usage(self) -> dict:
+        """Bytes held per array (index arrays included)"""
+        usage = {field: getattr(self, field).nbytes for field in PANEL_FIELDS}
+        usage["days"] = self.days.nbytes + self.dates.nbytes
+        usage["codes"] = int(pd.Series(self.codes).memory_usage(deep=True, index=False))
+        return usage
+
+
+def _signature(path: str):
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def _read_fragment(path: str, compact: bool = True) -> pd.DataFrame:
+    """
+    One store fragment in long form: day (int32 offset), code (categorical), prices, volume
+    Compact fragments hold float32 prices and int64 volume (missing volume as 0); otherwise
+    prices and volume are float64 as stored.
+    """
+    signature = _signature(path)
+    cached = _FILE_CACHE.get((path, compact))
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with metrics.span("load.fragment"):
+        table = pq.read_table(path, columns=PRICE_COLUMNS)
+        price_dtype = np.float32 if compact else np.float64
+        df = pd.DataFrame({
+            "day": table.column("date").cast(pa.int32()).to_numpy(),
+            # the store keeps codes dictionary-encoded, so they arrive as a categorical
+            "code": table.column("stock_code").to_pandas(),
+            **{field: table.column(field).to_numpy().astype(price_dtype, copy=False) for field in PRICE_FIELDS},
+            "volume": (pc.fill_null(table.column("volume"), 0).to_numpy() if compact
+                       else table.column("volume").to_numpy().astype(np.float64)),
+        })
+    metrics.count("bytes.read", signature[1])
+    _FILE_CACHE[(path, compact)] = (signature, df)
+    return df
+
+
+def _build_panel(frames: list, names: dict, compact: bool = True, adjust=None) -> PricePanel:
+    """
+    Scatter long-form fragments into the date × stock arrays
+    adjust: None, or (mode, factor table, basis) to adjust prices on the way in (see price_store.adjust_prices)
+    """
+    categories = [np.asarray(df["code"].cat.categories, dtype=object) for df in frames]
+    codes = np.unique(np.concatenate(categories))
+    days = np.unique(np.concatenate([df["day"].to_numpy() for df in frames]))
+
+    shape = (len(days), len(codes))
+    price_dtype = np.float32 if compact else np.float64
+    arrays = {field: np.full(shape, np.nan, dtype=price_dtype) for field in PRICE_FIELDS}
+    arrays["volume"] = np.zeros(shape, dtype=np.int64) if compact else np.full(shape, np.nan)
+    # later fragments supersede earlier ones for the same (stock_code, date): they are written last
+    for df, cats in zip(frames, categories):
+        row = np.searchsorted(days, df["day"].to_numpy())
+        col = np.searchsorted(codes, cats)[df["code"].cat.codes.to_numpy()]
+        mult = adjustment_multipliers(df["code"], DAY_EPOCH + df["day"].to_numpy(), *adjust) if adjust else None
+        for field in PANEL_FIELDS:
+            values = df[field].to_numpy()
+            if mult is not None and field != "volume":
+                values = values * mult
+            arrays[field][row, col] = values
+    return PricePanel(days, codes, arrays, names)
+
+
+def memory_footprint(panel: PricePanel = None) -> dict:
+    """
+    Memory report: the cached long-form fragments behind the panels, and bytes per panel array
+    Returns dict with fragments (bytes), fragment_rows and, given a panel, panel (per array) and panel_total
+    """
+    cached = [df for _, df in _FILE_CACHE.values()]
+    out = {
+        "fragments": int(sum(df.memory_usage(deep=True, index=False).sum() for df in cached)),
+        "fragment_rows": sum(len(df) for df in cached),
+    }
+    if panel is not None:
+        usage = panel.memory_usage()
+        out.update(panel=usage, panel_total=sum(usage.values()))
+    return out
+
+
+def panel_signature(store_dir=STORE_DIR, paths=None) -> tuple:
+    """(mtime, size) of every fragment and side file the panel is built from; stat calls only"""
+    paths = fragment_paths(store_dir) if paths is None else paths
+    side_files = [os.path.join(store_dir, name) for name in (NAMES_FILE, ADJUST_FILE, BASIS_FILE)]
+    return (tuple((path, _signature(path)) for path in paths),
+            tuple(_signature(path) if os.path.exists(path) else None for path in side_files))
+
+
+def load_price_panel(store_dir=STORE_DIR, data_folder="daily_data_history", compact=True,
+                     adjust="forward") -> PricePanel:
+    """
+    Return the process-wide price panel for a store, rebuilding it only when fragment files changed
+    Fragments whose (mtime, size) are unchanged are served from memory; only new or modified
+    files are re-read from disk. Returns None if there is no price data at all.
+    compact=True (default) holds prices as float32 and volume as int64, about half the memory;
+    compact=False gives the full float64 panel.
+    adjust: 'forward' (default), 'backward' or 'none', applied to unadjusted stocks as the panel is built
+    """
+    if adjust not in ADJUST_MODES:
+        raise ValueError(f"adjust must be one of {', '.join(ADJUST_MODES)}")
+    ensure_price_store(data_folder, store_dir)
+    paths = fragment_paths(store_dir)
+    if not paths:
+        return None
+
+    signature = panel_signature(store_dir, paths)
+    cached = _PANEL_CACHE.get((store_dir, compact, adjust))
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    # drop fragments that were compacted away so the file cache does not grow without bound
+    live = set(paths)
+    prefix = os.path.join(store_dir, "")
+    for key in [k for k in _FILE_CACHE if k[0].startswith(prefix) and k[0] not in live]:
+        del _FILE_CACHE[key]
+
+    basis = load_price_basis(store_dir) if adjust != "none" else {}
+    factors = (adjust, load_adjust_factors(store_dir=store_dir), basis) if basis else None
+    with metrics.span("load.panel"):
+        frames = [_read_fragment(path, compact) for path in paths]
+        panel = _build_panel(frames, load_stock_names(store_dir), compact, factors)
+    _PANEL_CACHE[(store_dir, compact, adjust)] = (signature, panel)
+    return panel
+
+
+def clear_panel_cache():
+    """Forget all cached fragments and panels (next load reads everything from disk)"""
+    _FILE_CACHE.clear()
+    _PANEL_CACHE.clear()
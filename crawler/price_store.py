@@ -0,0 +1,597 @@
+import json
+import os
+import time
+import zlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from crawler import metrics
+from crawler.jobs import atomic_path, atomic_write_csv, atomic_write_json
+
+
+STORE_DIR = "daily_data_store"
+PRICE_COLUMNS = ["date", "stock_code", "open", "high", "low", "close", "volume"]
+NAMES_FILE = "stock_names.json"
+MANIFEST_FILE = "manifest.json"
+# compact a year partition once it holds this many append fragments
+COMPACT_FRAGMENTS = 20
+# corporate-action adjustment factors of the stocks whose prices are stored unadjusted
+ADJUST_FILE = "adjust_factors.parquet"
+# code → date its factors were last refreshed ("" = not yet); listed stocks hold unadjusted prices
+BASIS_FILE = "price_basis.json"
+# code → trading days a fetch covered but that had no bar (suspensions), never asked for again
+SUSPENDED_FILE = "suspended_days.json"
+# read-time adjustment: forward (前复权, the latest price is real), backward (后复权) or none
+ADJUST_MODES = ("forward", "backward", "none")
+
+PRICE_SCHEMA = pa.schema([
+    ("date", pa.date32()),
+    ("stock_code", pa.dictionary(pa.int32(), pa.string())),
+    ("open", pa.float64()),
+    ("high", pa.float64()),
+    ("low", pa.float64()),
+    ("close", pa.float64()),
+    ("volume", pa.int64()),
+])
+
+
+ADJUST_SCHEMA = pa.schema([
+    ("stock_code", pa.dictionary(pa.int32(), pa.string())),
+    ("date", pa.date32()),
+    ("fore", pa.float64()),
+    ("back", pa.float64()),
+])
+
+
+def _partition_dir(store_dir: str, year: int) -> str:
+    return os.path.join(store_dir, f"year={year}")
+
+
+def _to_table(df: pd.DataFrame) -> pa.Table:
+    """
+    Convert a price DataFrame (string or datetime dates) to a typed Arrow table
+    sorted by (stock_code, date), so row-group statistics stay selective
+    """
+    out = pd.DataFrame({
+        "date": pd.to_datetime(df["date"]).dt.date,
+        "stock_code": df["stock_code"].astype(str),
+        "open": pd.to_numeric(df["open"], errors="coerce").astype("float64"),
+        "high": pd.to_numeric(df["high"], errors="coerce").astype("float64"),
+        "low": pd.to_numeric(df["low"], errors="coerce").astype("float64"),
+        "close": pd.to_numeric(df["close"], errors="coerce").astype("float64"),
+        "volume": pd.to_numeric(df["volume"], errors="coerce").fillna(0).astype("int64"),
+    })
+    out = out.sort_values(["stock_code", "date"]).reset_index(drop=True)
+    return pa.Table.from_pandas(out, schema=PRICE_SCHEMA, preserve_index=False)
+
+
+def load_stock_names(store_dir: str = STORE_DIR) -> dict:
+    """Code → company name mapping kept next to the price partitions"""
+    path = os.path.join(store_dir, NAMES_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_stock_names(stock_dic: dict, store_dir: str = STORE_DIR):
+    names = load_stock_names(store_dir)
+    names.update({code: name for code, name in stock_dic.items() if name})
+    atomic_write_json(names, os.path.join(store_dir, NAMES_FILE))
+
+
+def write_price_data(df: pd.DataFrame, store_dir: str = STORE_DIR) -> list:
+    """
+    Append price rows to the columnar store (one new Parquet fragment per year touched)
+    Parameters:
+        df: DataFrame with columns date, stock_code, open, high, low, close, volume
+            (may hold many stocks at once)
+        store_dir: Root of the year-partitioned store
+    Returns:
+        List of fragment paths written
+    Rows for an existing (stock_code, date) are superseded by the newer fragment on read,
+    and compact_price_store() folds fragments back into one file per year.
+    """
+    if df.empty:
+        return []
+
+    manifest = load_manifest(store_dir)
+    years = pd.to_datetime(df["date"]).dt.year.to_numpy()
+    stamp = time.time_ns()
+    written = []
+    for year in sorted(set(years.tolist())):
+        part = _to_table(df[years == year])
+        part_dir = _partition_dir(store_dir, year)
+        os.makedirs(part_dir, exist_ok=True)
+        path = os.path.join(part_dir, f"part-{stamp}.parquet")
+        with metrics.span("write.prices"), atomic_path(path) as tmp_path:
+            pq.write_table(part, tmp_path, compression="zstd")
+        metrics.count("bytes.written", os.path.getsize(path))
+        written.append(path)
+
+    if not _append_to_manifest(manifest, df, written, store_dir):
+        # rows overlapped stored history, so counts and checksums must come from the data
+        manifest = rebuild_manifest(store_dir)
+    save_manifest(manifest, store_dir)
+    return written
+
+
+_CHECKSUM_DTYPE = np.dtype([
+    ("date", "<i4"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"), ("volume", "<i8"),
+])
+
+
+def _row_checksums(df: pd.DataFrame, prev: dict = None) -> dict:
+    """
+    CRC32 of each stock's rows in date order (fixed-width binary records), chained from `prev`
+    Appending rows later in time gives the same value as hashing the full history at once.
+    """
+    prev = prev or {}
+    out = df.sort_values(["stock_code", "date"])
+    records = np.empty(len(out), dtype=_CHECKSUM_DTYPE)
+    records["date"] = (pd.to_datetime(out["date"]).to_numpy(dtype="datetime64[D]")
+                       - np.datetime64("1970-01-01", "D")).astype("int32")
+    for field in ("open", "high", "low", "close"):
+        records[field] = pd.to_numeric(out[field], errors="coerce").to_numpy(dtype="float64")
+    records["volume"] = pd.to_numeric(out["volume"], errors="coerce").fillna(0).to_numpy(dtype="int64")
+
+    codes = out["stock_code"].astype(str).to_numpy()
+    bounds = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    starts = np.concatenate([[0], bounds])
+    ends = np.concatenate([bounds, [len(codes)]])
+    raw = memoryview(records.tobytes())
+    size = _CHECKSUM_DTYPE.itemsize
+    return {
+        codes[a]: zlib.crc32(raw[a * size:b * size], prev.get(codes[a], 0))
+        for a, b in zip(starts, ends) if b > a
+    }
+
+
+def load_manifest(store_dir: str = STORE_DIR) -> dict:
+    """
+    Per-stock manifest: code → {files, first_date, last_date, rows, checksum}
+    Rebuilt from the data if the store exists but has no manifest yet.
+    """
+    path = os.path.join(store_dir, MANIFEST_FILE)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    if fragment_paths(store_dir):
+        manifest = rebuild_manifest(store_dir)
+        save_manifest(manifest, store_dir)
+        return manifest
+    return {}
+
+
+def save_manifest(manifest: dict, store_dir: str = STORE_DIR):
+    atomic_write_json(manifest, os.path.join(store_dir, MANIFEST_FILE))
+
+
+def _relative(path: str, store_dir: str) -> str:
+    return os.path.relpath(path, store_dir).replace(os.sep, "/")
+
+
+def _append_to_manifest(manifest: dict, df: pd.DataFrame, written: list, store_dir: str) -> bool:
+    """
+    Extend manifest entries with newly appended rows
+    Returns False if any stock received rows on or before its recorded last date.
+    """
+    dates = pd.to_datetime(df["date"])
+    codes = df["stock_code"].astype(str)
+    bounds = pd.DataFrame({"code": codes, "date": dates}).groupby("code")["date"].agg(["min", "max", "size"])
+    for code, row in bounds.iterrows():
+        entry = manifest.get(code)
+        if entry is not None and row["min"].strftime("%Y-%m-%d") <= entry["last_date"]:
+            return False
+
+    written_years = {int(_relative(p, store_dir).split("/", 1)[0].split("=", 1)[1]): _relative(p, store_dir)
+                     for p in written}
+    code_years = pd.DataFrame({"code": codes, "year": dates.dt.year}).drop_duplicates()
+    years_by_code = code_years.groupby("code")["year"].agg(list)
+    checksums = _row_checksums(df, {code: e["checksum"] for code, e in manifest.items()})
+
+    for code, row in bounds.iterrows():
+        entry = manifest.setdefault(code, {
+            "files": [], "first_date": row["min"].strftime("%Y-%m-%d"), "rows": 0, "checksum": 0,
+        })
+        for year in years_by_code[code]:
+            rel = written_years[year]
+            if rel not in entry["files"]:
+                entry["files"].append(rel)
+        entry["last_date"] = row["max"].strftime("%Y-%m-%d")
+        entry["rows"] += int(row["size"])
+        entry["checksum"] = checksums[code]
+    return True
+
+
+def rebuild_manifest(store_dir: str = STORE_DIR) -> dict:
+    """Recompute the manifest from the stored rows (after overwrites, or to check integrity)"""
+    manifest = {}
+    for path in fragment_paths(store_dir):
+        rel = _relative(path, store_dir)
+        codes = pq.read_table(path, columns=["stock_code"]).column("stock_code").unique()
+        for code in codes.to_pylist():
+            manifest.setdefault(code, {"files": []})["files"].append(rel)
+
+    df = read_prices(store_dir=store_dir, adjust="none")
+    checksums = _row_checksums(df)
+    bounds = df.groupby("stock_code")["date"].agg(["min", "max", "size"])
+    for code, row in bounds.iterrows():
+        entry = manifest.setdefault(code, {"files": []})
+        entry.update({
+            "first_date": row["min"].strftime("%Y-%m-%d"),
+            "last_date": row["max"].strftime("%Y-%m-%d"),
+            "rows": int(row["size"]),
+            "checksum": checksums[code],
+        })
+    return manifest
+
+
+def verify_manifest(store_dir: str = STORE_DIR) -> list:
+    """Codes whose stored rows no longer match the manifest's row count or checksum"""
+    recorded = load_manifest(store_dir)
+    actual = rebuild_manifest(store_dir)
+    return sorted(
+        code for code in set(recorded) | set(actual)
+        if {k: recorded.get(code, {}).get(k) for k in ("rows", "checksum", "last_date")}
+        != {k: actual.get(code, {}).get(k) for k in ("rows", "checksum", "last_date")}
+    )
+
+
+def fragment_paths(store_dir: str, start_date=None, end_date=None) -> list:
+    """Parquet fragments whose year partition overlaps [start_date, end_date], in write order"""
+    if not os.path.isdir(store_dir):
+        return []
+    start_year = pd.to_datetime(start_date).year if start_date is not None else None
+    end_year = pd.to_datetime(end_date).year if end_date is not None else None
+
+    paths = []
+    for entry in sorted(os.listdir(store_dir)):
+        if not entry.startswith("year="):
+            continue
+        year = int(entry.split("=", 1)[1])
+        if start_year is not None and year < start_year:
+            continue
+        if end_year is not None and year > end_year:
+            continue
+        part_dir = os.path.join(store_dir, entry)
+        paths.extend(
+            os.path.join(part_dir, f) for f in sorted(os.listdir(part_dir)) if f.endswith(".parquet")
+        )
+    return paths
+
+
+def read_prices(start_date=None, end_date=None, columns=None, codes=None, store_dir: str = STORE_DIR,
+                adjust="forward") -> pd.DataFrame:
+    """
+    Read a date range from the columnar store
+    Parameters:
+        start_date / end_date: Inclusive bounds ('2024-01-01'), None for open-ended
+        columns: Price columns to load; date and stock_code are always included
+        codes: Optional list of stock codes to keep
+        adjust: 'forward', 'backward' or 'none' (as stored); see adjust_prices
+    Returns:
+        pd.DataFrame sorted by stock_code, date, with date as datetime64
+    """
+    wanted = ["date", "stock_code"] + [c for c in (PRICE_COLUMNS if columns is None else columns)
+                                   if c not in ("date", "stock_code")]
+    paths = fragment_paths(store_dir, start_date, end_date)
+    if not paths:
+        return pd.DataFrame(columns=wanted)
+
+    dataset = ds.dataset(paths, schema=PRICE_SCHEMA, format="parquet")
+    expr = None
+    if start_date is not None:
+        expr = ds.field("date") >= pa.scalar(pd.to_datetime(start_date).date(), pa.date32())
+    if end_date is not None:
+        cond = ds.field("date") <= pa.scalar(pd.to_datetime(end_date).date(), pa.date32())
+        expr = cond if expr is None else expr & cond
+    if codes is not None:
+        cond = ds.field("stock_code").isin(list(codes))
+        expr = cond if expr is None else expr & cond
+
+    with metrics.span("load.prices"):
+        table = dataset.to_table(columns=wanted, filter=expr)
+    metrics.count("rows.loaded", table.num_rows)
+    df = table.to_pandas(date_as_object=False)
+    # before the astype(str) below, so the factor join uses the category codes as read
+    adjust_prices(df, adjust, store_dir)
+    df["stock_code"] = df["stock_code"].astype(str)
+
+    # later fragments supersede earlier ones for the same (stock_code, date)
+    if len(paths) > 1:
+        df = df.drop_duplicates(subset=["stock_code", "date"], keep="last")
+    return df.sort_values(["stock_code", "date"]).reset_index(drop=True)
+
+
+def read_recent_prices(recent_days: int, columns=None, store_dir: str = STORE_DIR, adjust="forward") -> pd.DataFrame:
+    """
+    Read only the tail of the store: the last `recent_days` rows of every stock
+    A calendar-day margin is read so that short suspensions do not shorten the window.
+    """
+    last = latest_date(store_dir)
+    if last is None:
+        return pd.DataFrame(columns=["date", "stock_code"] + list(columns or []))
+    start = last - pd.Timedelta(days=recent_days * 2 + 30)
+    df = read_prices(start_date=start, columns=columns, store_dir=store_dir, adjust=adjust)
+    return df.groupby("stock_code", sort=False).tail(recent_days).reset_index(drop=True)
+
+
+def load_price_basis(store_dir: str = STORE_DIR) -> dict:
+    """
+    Code → date (YYYY-MM-DD) its adjustment factors were last refreshed, "" if never
+    Stocks listed here are stored unadjusted; the others hold legacy forward-adjusted prices.
+    """
+    path = os.path.join(store_dir, BASIS_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def mark_unadjusted(codes, store_dir: str = STORE_DIR):
+    """Record that these stocks' stored history is unadjusted and their factors need a refresh"""
+    basis = load_price_basis(store_dir)
+    basis.update({code: "" for code in codes})
+    atomic_write_json(basis, os.path.join(store_dir, BASIS_FILE))
+
+
+def load_suspended_days(store_dir: str = STORE_DIR) -> dict:
+    """Code → sorted list of trading days (YYYY-MM-DD) known to have no bar"""
+    path = os.path.join(store_dir, SUSPENDED_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def record_suspended_days(days: dict, store_dir: str = STORE_DIR):
+    """Add code → iterable of YYYY-MM-DD days to the suspended-day record"""
+    days = {code: set(d) for code, d in days.items() if d}
+    if not days:
+        return
+    suspended = load_suspended_days(store_dir)
+    for code, new in days.items():
+        suspended[code] = sorted(new.union(suspended.get(code, [])))
+    atomic_write_json(suspended, os.path.join(store_dir, SUSPENDED_FILE))
+
+
+def load_adjust_factors(codes=None, store_dir: str = STORE_DIR) -> pd.DataFrame:
+    """
+    Adjustment factor table: one row per corporate action (stock_code, date, fore, back)
+    sorted by stock_code, date. back is the cumulative factor since listing (1.0 before the
+    first action); fore is baostock's forward factor as of the last refresh.
+    """
+    path = os.path.join(store_dir, ADJUST_FILE)
+    if not os.path.exists(path):
+        return pd.DataFrame({"stock_code": pd.Series(dtype=str), "date": pd.Series(dtype="datetime64[ms]"),
+                             "fore": pd.Series(dtype="float64"), "back": pd.Series(dtype="float64")})
+    filters = [("stock_code", "in", list(codes))] if codes is not None else None
+    df = pq.read_table(path, filters=filters).to_pandas(date_as_object=False)
+    df["stock_code"] = df["stock_code"].astype(str)
+    return df.sort_values(["stock_code", "date"]).reset_index(drop=True)
+
+
+def save_adjust_factors(df: pd.DataFrame, codes, store_dir: str = STORE_DIR, as_of: str = None):
+    """
+    Replace the factors of `codes` with the rows of df (stock_code, date, fore, back; may be None)
+    Stocks in `codes` without rows in df have had no corporate action. Their refresh date in
+    the basis map becomes `as_of` (default today).
+    """
+    codes = set(codes)
+    if not codes:
+        return
+    table = load_adjust_factors(store_dir=store_dir)
+    table = table[~table["stock_code"].isin(codes)]
+    if df is not None and len(df):
+        table = pd.concat([table, df[["stock_code", "date", "fore", "back"]]], ignore_index=True)
+    table = table.assign(date=pd.to_datetime(table["date"]).dt.date, stock_code=table["stock_code"].astype(str))
+    table = table.sort_values(["stock_code", "date"]).reset_index(drop=True)
+    path = os.path.join(store_dir, ADJUST_FILE)
+    os.makedirs(store_dir, exist_ok=True)
+    with atomic_path(path) as tmp_path:
+        pq.write_table(pa.Table.from_pandas(table, schema=ADJUST_SCHEMA, preserve_index=False), tmp_path)
+
+    basis = load_price_basis(store_dir)
+    as_of = as_of or time.strftime("%Y-%m-%d")
+    basis.update({code: as_of for code in codes})
+    atomic_write_json(basis, os.path.join(store_dir, BASIS_FILE))
+
+
+def adjustment_multipliers(codes, dates, adjust: str, factors: pd.DataFrame, basis: dict) -> np.ndarray:
+    """
+    Price multiplier of every (code, date) row under `adjust`
+    backward: the cumulative factor of the last action on or before the date (1.0 before any)
+    forward: the same divided by the stock's latest factor, so the newest prices are unchanged
+    Stocks not in `basis` (legacy forward-adjusted history) get 1.0 whatever the mode.
+    codes may be a Categorical (as read from the store), which avoids re-encoding the strings.
+    """
+    if adjust not in ADJUST_MODES:
+        raise ValueError(f"adjust must be one of {', '.join(ADJUST_MODES)}")
+    cat = pd.Categorical(codes)
+    out = np.ones(len(cat))
+    if adjust == "none" or factors.empty or not len(cat):
+        return out
+    universe = cat.categories
+    row_ids = cat.codes.astype(np.int64)
+    days = np.asarray(dates, dtype="datetime64[D]").astype(np.int64)
+
+    # factor rows of the stocks present, as (code id, day) keys: one sorted search finds each row's latest action
+    f_ids = pd.Categorical(factors["stock_code"], categories=universe).codes.astype(np.int64)
+    keep = f_ids >= 0
+    f_ids = f_ids[keep]
+    f_days = factors["date"].to_numpy(dtype="datetime64[D]").astype(np.int64)[keep]
+    f_back = factors["back"].to_numpy(dtype=np.float64)[keep]
+    order = np.lexsort((f_days, f_ids))
+    f_ids, f_days, f_back = f_ids[order], f_days[order], f_back[order]
+    if not len(f_ids):
+        return out
+    pos = np.searchsorted((f_ids << 32) + f_days, (row_ids << 32) + days, side="right") - 1
+    hit = (pos >= 0) & (f_ids[np.maximum(pos, 0)] == row_ids)
+    back = np.where(hit, f_back[np.maximum(pos, 0)], 1.0)
+    if adjust == "forward":
+        latest = np.ones(len(universe))
+        last = np.flatnonzero(np.append(f_ids[1:] != f_ids[:-1], True))
+        latest[f_ids[last]] = f_back[last]
+        back = back / latest[row_ids]
+    unadjusted = np.array([code in basis for code in universe], dtype=bool)
+    return np.where(unadjusted[row_ids], back, 1.0)
+
+
+def adjust_prices(df: pd.DataFrame, adjust: str = "forward", store_dir: str = STORE_DIR) -> pd.DataFrame:
+    """
+    Apply forward / backward adjustment to stored (unadjusted) open, high, low, close, in place
+    Volume is left as traded. Legacy forward-adjusted stocks are returned as stored.
+    """
+    if adjust not in ADJUST_MODES:
+        raise ValueError(f"adjust must be one of {', '.join(ADJUST_MODES)}")
+    if adjust == "none" or df.empty:
+        return df
+    basis = load_price_basis(store_dir)
+    if not basis:
+        return df
+    factors = load_adjust_factors(store_dir=store_dir)
+    # .array keeps a categorical column as a Categorical (to_numpy would rebuild an object array)
+    mult = adjustment_multipliers(df["stock_code"].array, df["date"].to_numpy(), adjust, factors, basis)
+    for field in ("open", "high", "low", "close"):
+        if field in df.columns:
+            df[field] = df[field].to_numpy(dtype=np.float64) * mult
+    return df
+
+
+def latest_date(store_dir: str = STORE_DIR):
+    """Most recent date in the store (from Parquet statistics of the newest year), or None"""
+    paths = fragment_paths(store_dir)
+    if not paths:
+        return None
+    newest_year = os.path.basename(os.path.dirname(paths[-1]))
+    last = None
+    for path in paths:
+        if os.path.basename(os.path.dirname(path)) != newest_year:
+            continue
+        meta = pq.ParquetFile(path).metadata
+        col = meta.schema.names.index("date")
+        for rg in range(meta.num_row_groups):
+            stats = meta.row_group(rg).column(col).statistics
+            if stats is not None and stats.has_min_max:
+                last = stats.max if last is None else max(last, stats.max)
+    return pd.Timestamp(last) if last is not None else None
+
+
+def compact_price_store(store_dir: str = STORE_DIR, min_fragments: int = 2):
+    """
+    Fold year partitions holding at least `min_fragments` files into a single deduplicated, sorted file
+    Use min_fragments=COMPACT_FRAGMENTS after small appends so compaction cost is amortized.
+    """
+    if not os.path.isdir(store_dir):
+        return
+    manifest = load_manifest(store_dir)
+    renamed = {}
+    for entry in sorted(os.listdir(store_dir)):
+        if not entry.startswith("year="):
+            continue
+        part_dir = os.path.join(store_dir, entry)
+        files = sorted(f for f in os.listdir(part_dir) if f.endswith(".parquet"))
+        if len(files) < max(min_fragments, 2):
+            continue
+        paths = [os.path.join(part_dir, f) for f in files]
+        df = ds.dataset(paths, schema=PRICE_SCHEMA, format="parquet").to_table().to_pandas(date_as_object=False)
+        df["stock_code"] = df["stock_code"].astype(str)
+        df = df.drop_duplicates(subset=["stock_code", "date"], keep="last")
+
+        final_path = os.path.join(part_dir, f"part-{time.time_ns()}.parquet")
+        with metrics.span("write.compact"), atomic_path(final_path) as tmp_path:
+            pq.write_table(_to_table(df), tmp_path, compression="zstd")
+        for p in paths:
+            os.remove(p)
+            renamed[_relative(p, store_dir)] = _relative(final_path, store_dir)
+
+    if renamed:
+        for stock in manifest.values():
+            stock["files"] = list(dict.fromkeys(renamed.get(f, f) for f in stock["files"]))
+        save_manifest(manifest, store_dir)
+
+
+def parse_history_filename(filename: str):
+    """'万丰奥威_sz_002085.csv' → ('sz.002085', '万丰奥威'); returns (None, None) if not a price file"""
+    if not filename.endswith(".csv"):
+        return None, None
+    parts = filename[:-4].rsplit("_", 2)
+    if len(parts) == 3:
+        name, market, number = parts
+    elif len(parts) == 2:
+        name, (market, number) = "", parts
+    else:
+        return None, None
+    return f"{market}.{number}", name
+
+
+def import_csv_folder(data_folder="daily_data_history", store_dir: str = STORE_DIR) -> int:
+    """
+    Migrate the legacy per-stock CSV layout into the columnar store
+    Returns the number of stocks imported
+    """
+    frames = []
+    names = {}
+    for filename in sorted(os.listdir(data_folder)):
+        code, name = parse_history_filename(filename)
+        if code is None:
+            continue
+        try:
+            df = pd.read_csv(os.path.join(data_folder, filename))
+        except Exception as e:
+            print(f"❌ Failed to read: {filename}, Error: {e}")
+            continue
+        if df.empty:
+            continue
+        df["stock_code"] = code
+        frames.append(df[PRICE_COLUMNS])
+        if name:
+            names[code] = name
+
+    if not frames:
+        return 0
+    write_price_data(pd.concat(frames, ignore_index=True), store_dir)
+    compact_price_store(store_dir)
+    save_stock_names(names, store_dir)
+    print(f"✅ Imported {len(frames)} stocks from {data_folder} into {store_dir}")
+    return len(frames)
+
+
+def ensure_price_store(data_folder="daily_data_history", store_dir: str = STORE_DIR) -> str:
+    """Build the store from the legacy CSV folder on first use"""
+    if not fragment_paths(store_dir) and os.path.isdir(data_folder):
+        print(f"⚠️ Price store not found, importing {data_folder}......")
+        import_csv_folder(data_folder, store_dir)
+    return store_dir
+
+
+def stock_label(code: str, names: dict) -> str:
+    """Display label matching the legacy file stem, e.g. '万丰奥威_sz_002085'"""
+    name = names.get(code, "Unknown").replace("/", "_").replace("\\", "_")
+    return f"{name}_{code.replace('.', '_')}"
+
+
+def export_store_to_csv(output_dir="daily_data_history", codes=None, store_dir: str = STORE_DIR) -> int:
+    """
+    Export the store back to one UTF-8-BOM CSV per stock (legacy layout, CompanyName_Code.csv)
+    Returns the number of files written
+    """
+    df = read_prices(codes=codes, store_dir=store_dir)
+    if df.empty:
+        return 0
+    names = load_stock_names(store_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    df["date"] = df["date"].dt.strftime("%Y-%m-%d")
+
+    count = 0
+    for code, group in df.groupby("stock_code", sort=True):
+        file_path = os.path.join(output_dir, f"{stock_label(code, names)}.csv")
+        atomic_write_csv(group[PRICE_COLUMNS], file_path)
+        count += 1
+    print(f"✅ Exported {count} stocks to {output_dir}")
+    return count
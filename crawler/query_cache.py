@@ -0,0 +1,233 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta
+
+from crawler import metrics
+
+
+CACHE_PATH = "output/cache/baostock.sqlite"
+# least recently used entries are evicted once the payloads pass this size
+MAX_CACHE_BYTES = 512 * 1024 * 1024
+
+_settings = {"enabled": True, "path": CACHE_PATH, "max_bytes": MAX_CACHE_BYTES}
+# (pid, thread) -> sqlite connection (every worker process and thread opens its own)
+_connections = {}
+# query function name -> rule(args, kwargs, now) returning an expiry timestamp, None for never,
+# or NOT_CACHED
+_ttl_rules = {}
+# query function name -> complete(args, kwargs, fields, rows), False if the answer must not be stored
+_complete_rules = {}
+# returned by a TTL rule: answer this query from the server every time
+NOT_CACHED = "not cached"
+
+
+class CachedResultSet:
+    """
+    Replays a stored baostock answer through the ResultSet interface
+    (error_code, error_msg, fields, data, next(), get_row_data(), get_data())
+    """
+
+    def __init__(self, fields: list, rows: list, error_code: str = "0", error_msg: str = "success"):
+        self.fields = fields
+        self.data = rows
+        self.error_code = error_code
+        self.error_msg = error_msg
+        # same cursor as baostock's: next() checks, get_row_data() advances
+        self.cur_row_num = 0
+
+    def next(self) -> bool:
+        return self.cur_row_num < len(self.data)
+
+    def get_row_data(self) -> list:
+        row = self.data[self.cur_row_num]
+        self.cur_row_num += 1
+        return row
+
+    def get_data(self):
+        import pandas as pd
+        return pd.DataFrame(self.data, columns=self.fields)
+
+
+def end_of_day(now: float) -> float:
+    """Next local midnight: lists, constituents and anything touching today expire daily"""
+    tomorrow = datetime.fromtimestamp(now).date() + timedelta(days=1)
+    return datetime.combine(tomorrow, datetime.min.time()).timestamp()
+
+
+def register_ttl(query_name: str, rule, complete=None):
+    """
+    Set the expiry rule of one baostock query
+    rule(args, kwargs, now) returns the expiry as a timestamp, None if the answer never changes,
+    or NOT_CACHED. Queries without a rule expire at the end of the day.
+    complete(args, kwargs, fields, rows) returning False keeps a single answer out of the cache.
+    """
+    _ttl_rules[query_name] = rule
+    if complete is not None:
+        _complete_rules[query_name] = complete
+
+
+def _price_end_date(args, kwargs) -> str:
+    return kwargs.get("end_date") or (args[3] if len(args) > 3 else "")
+
+
+def _price_ttl(args, kwargs, now):
+    # unadjusted bars of past days never change; adjusted series are rewritten after each
+    # dividend or split. A range reaching today is not stored at all: before today's bar is
+    # published the answer is short, and a second update the same day must see the new bar.
+    end_date = _price_end_date(args, kwargs)
+    today = datetime.fromtimestamp(now).date()
+    if not end_date or date.fromisoformat(end_date) >= today:
+        return NOT_CACHED
+    if str(kwargs.get("adjustflag", "3")) == "3":
+        return None
+    return end_of_day(now)
+
+
+def _price_complete(args, kwargs, fields, rows) -> bool:
+    # only answers holding the requested end date are stored; a range ending on a holiday or in
+    # a halt is simply asked again (the updater only requests ranges ending on trading days)
+    if not rows or "date" not in fields:
+        return False
+    return rows[-1][fields.index("date")] == _price_end_date(args, kwargs)
+
+
+register_ttl("query_history_k_data_plus", _price_ttl, _price_complete)
+
+
+def configure_cache(enabled: bool = None, path: str = None, max_bytes: int = None):
+    """Turn the cache on/off or move/resize it (for example a throwaway path in benchmarks)"""
+    if enabled is not None:
+        _settings["enabled"] = enabled
+    if path is not None and path != _settings["path"]:
+        _settings["path"] = path
+        for key in [key for key in _connections if key[0] == os.getpid()]:
+            del _connections[key]
+    if max_bytes is not None:
+        _settings["max_bytes"] = max_bytes
+
+
+def _connect() -> sqlite3.Connection:
+    conn = _connections.get((os.getpid(), threading.get_ident()))
+    if conn is not None:
+        return conn
+    path = _settings["path"]
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+        key TEXT PRIMARY KEY, query TEXT, expires REAL, last_access REAL, size INTEGER, payload BLOB)""")
+    conn.execute("CREATE INDEX IF NOT EXISTS entries_lru ON entries (last_access)")
+    conn.execute("CREATE TABLE IF NOT EXISTS stats (query TEXT PRIMARY KEY, hits INTEGER, misses INTEGER)")
+    _connections[(os.getpid(), threading.get_ident())] = conn
+    return conn
+
+
+def cache_key(query_name: str, args, kwargs) -> str:
+    """Identity of one query: its name and arguments, as passed"""
+    return json.dumps([query_name, list(args), sorted(kwargs.items())], ensure_ascii=False, default=str)
+
+
+def _count(conn, query_name: str, hit: bool):
+    conn.execute(
+        "INSERT INTO stats VALUES (?, ?, ?) ON CONFLICT(query) DO UPDATE SET "
+        "hits = hits + excluded.hits, misses = misses + excluded.misses",
+        (query_name, int(hit), int(not hit)),
+    )
+
+
+def lookup(query, args: tuple, kwargs: dict):
+    """Cached answer of query(*args, **kwargs) as a CachedResultSet, or None (counted as a miss)"""
+    if not _settings["enabled"]:
+        return None
+    name = query.__name__
+    conn = _connect()
+    now = time.time()
+    row = conn.execute("SELECT expires, payload FROM entries WHERE key = ?", (cache_key(name, args, kwargs),)).fetchone()
+    if row is None or (row[0] is not None and row[0] <= now):
+        _count(conn, name, hit=False)
+        metrics.count("cache.misses")
+        return None
+    conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, cache_key(name, args, kwargs)))
+    _count(conn, name, hit=True)
+    metrics.count("cache.hits")
+    fields, rows = json.loads(zlib.decompress(row[1]))
+    return CachedResultSet(fields, rows)
+
+
+def store(query, args: tuple, kwargs: dict, rs):
+    """
+    Save a successful answer and return a CachedResultSet over it (the original is consumed)
+    Failed answers are returned untouched and never cached; answers a rule marks NOT_CACHED or
+    incomplete are returned without being stored.
+    """
+    if not _settings["enabled"] or rs.error_code != "0":
+        return rs
+    # crawler.decode pulls in pandas and pyarrow; the menu must start without them (see bench_startup)
+    from crawler.decode import fetch_rows
+    rows = fetch_rows(rs)
+    if rs.error_code != "0":
+        # a later page failed: hand back what was read, but do not remember a partial answer
+        return CachedResultSet(list(rs.fields), rows, rs.error_code, rs.error_msg)
+
+    name = query.__name__
+    now = time.time()
+    rule = _ttl_rules.get(name)
+    expires = rule(args, kwargs, now) if rule is not None else end_of_day(now)
+    complete = _complete_rules.get(name)
+    if expires == NOT_CACHED or (complete is not None and not complete(args, kwargs, list(rs.fields), rows)):
+        return CachedResultSet(list(rs.fields), rows)
+    payload = zlib.compress(json.dumps([list(rs.fields), rows], ensure_ascii=False).encode("utf-8"))
+
+    conn = _connect()
+    conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                 (cache_key(name, args, kwargs), name, expires, now, len(payload), payload))
+    _evict(conn)
+    return CachedResultSet(list(rs.fields), rows)
+
+
+def _evict(conn):
+    """Drop expired entries, then least recently used ones, until under 90% of the size limit"""
+    limit = _settings["max_bytes"]
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    if total <= limit:
+        return
+    conn.execute("DELETE FROM entries WHERE expires IS NOT NULL AND expires <= ?", (time.time(),))
+    total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+    target = limit * 0.9
+    for key, size in conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+        if total <= target:
+            break
+        conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        total -= size
+
+
+def cache_stats() -> dict:
+    """Per query: hits, misses, hit rate, cached entries and their bytes (all processes, all runs)"""
+    if not os.path.exists(_settings["path"]):
+        return {}
+    conn = _connect()
+    out = {}
+    for query, hits, misses in conn.execute("SELECT query, hits, misses FROM stats"):
+        out[query] = {"hits": hits, "misses": misses, "hit_rate": hits / max(hits + misses, 1),
+                      "entries": 0, "bytes": 0}
+    for query, entries, size in conn.execute("SELECT query, COUNT(*), SUM(size) FROM entries GROUP BY query"):
+        out.setdefault(query, {"hits": 0, "misses": 0, "hit_rate": 0.0})
+        out[query].update(entries=entries, bytes=size)
+    return out
+
+
+def clear_cache(stats: bool = False):
+    """Delete every cached answer (and the hit/miss counters with stats=True)"""
+    if not os.path.exists(_settings["path"]):
+        return
+    conn = _connect()
+    conn.execute("DELETE FROM entries")
+    if stats:
+        conn.execute("DELETE FROM stats")
+    conn.execute("VACUUM")
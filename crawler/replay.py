@@ -0,0 +1,319 @@
+"""
+Offline stand-in for the baostock query functions, for benchmarks and regression runs
+
+    replay = ReplayBaostock(stocks=500, latency=0.05, error_rate=0.01)
+    download_all_stock_data(codes, names, "2020-01-01", "2024-12-31",
+                            query_func=replay.query_history_k_data_plus,
+                            factor_func=replay.query_adjust_factor, calendar_func=replay.query_trade_dates)
+    run_financial_download(codes, quarters, queries=replay)
+
+Answers come from a recording (a query cache database: every successful live answer is
+recorded there, see crawler.query_cache) or are synthesized. Synthetic answers are a pure
+function of (seed, query, arguments): a price on a given day is the same whatever range asks
+for it, so downloads and later incremental updates line up. Every synthetic stock pays a
+yearly cash dividend, so unadjusted and adjusted prices differ as they do on the real service
+(adjustflag, preclose on ex-dates, query_adjust_factor), and now and then stops trading for
+a few days (no bars, as for a suspension). Business days are the trading calendar. Latency and error injection are
+seeded per query as well, so two runs with the same settings see the same delays and failures.
+"""
+import json
+import os
+import random
+import sqlite3
+import time
+import zlib
+from datetime import date
+
+import numpy as np
+
+from crawler.query_cache import CachedResultSet, cache_key
+
+
+# local error codes, outside the ranges baostock uses
+INJECTED_ERROR = "99999901"
+MISSING_ERROR = "99999902"
+
+# synthetic price history starts here; every series is generated forward from this day
+EPOCH = np.datetime64("2000-01-03")
+# yearly events (dividends, halts) are drawn up to this year whatever `today` is
+LAST_YEAR = 2100
+
+# board of the i-th synthetic stock cycles through these (exchange, first number)
+BOARDS = [("sh", 600000), ("sz", 1), ("sh", 603000), ("sz", 2001), ("sz", 300001), ("sh", 688001)]
+
+PRICE_FIELDS = ["date", "code", "open", "high", "low", "close", "preclose", "volume", "amount", "pctChg"]
+
+STATEMENT_FIELDS = {
+    "query_profit_data": ["roeAvg", "npMargin", "gpMargin", "netProfit", "epsTTM", "MBRevenue", "totalShare", "liqaShare"],
+    "query_operation_data": ["NRTurnRatio", "NRTurnDays", "INVTurnRatio", "INVTurnDays", "CATurnRatio", "AssetTurnRatio"],
+    "query_growth_data": ["YOYEquity", "YOYAsset", "YOYNI", "YOYEPSBasic", "YOYPNI"],
+    "query_balance_data": ["currentRatio", "quickRatio", "cashRatio", "YOYLiability", "liabilityToAsset", "assetToEquity"],
+    "query_cash_flow_data": ["CAToAsset", "NCAToAsset", "tangibleAssetToAsset", "ebitToInterest", "CFOToOR", "CFOToNP", "CFOToGr"],
+    "query_dupont_data": ["dupontROE", "dupontAssetStoEquity", "dupontAssetTurn", "dupontPnitoni", "dupontNitogr",
+                          "dupontTaxBurden", "dupontIntburden", "dupontEbittogr"],
+}
+
+
+def synthetic_codes(stocks: int) -> list:
+    """Codes of a synthetic universe, spread over the main, ChiNext and STAR boards"""
+    codes = []
+    for i in range(stocks):
+        exchange, first = BOARDS[i % len(BOARDS)]
+        codes.append(f"{exchange}.{first + i // len(BOARDS):06d}")
+    return codes
+
+
+def _seed(*parts) -> int:
+    # stable across processes and runs, unlike hash()
+    return zlib.crc32("|".join(str(p) for p in parts).encode("utf-8"))
+
+
+class ReplayBaostock:
+    """
+    Baostock look-alike: the query functions return result sets with the real interface
+    (error_code, error_msg, fields, next(), get_row_data())
+    Parameters:
+        stocks: Size of the synthetic universe (stock lists, CSI 500 constituents)
+        recording: Query cache database to replay; queries it does not hold are synthesized,
+            or answered with MISSING_ERROR if synthetic=False
+        latency: Mean seconds per call, spread uniformly by ±jitter (a fraction of latency)
+        row_latency: Extra seconds per returned row (large answers come in several pages)
+        error_rate: Share of calls answered with INJECTED_ERROR
+        timeout_rate: Share of calls that raise ConnectionError, like a dropped socket
+        today: Last trading day of the synthetic market and the cut-off for published reports
+    Picklable, so its methods can be handed to pool workers as query_func / queries.
+    """
+
+    def __init__(self, stocks=500, recording=None, synthetic=True, latency=0.0, jitter=0.5, row_latency=0.0,
+                 error_rate=0.0, timeout_rate=0.0, seed=0, today=None):
+        self.stocks = stocks
+        self.recording = recording
+        self.synthetic = synthetic
+        self.latency = latency
+        self.jitter = jitter
+        self.row_latency = row_latency
+        self.error_rate = error_rate
+        self.timeout_rate = timeout_rate
+        self.seed = seed
+        self.today = today or date.today().isoformat()
+        self._conn = None
+        self._attempts = {}
+        self.calls = 0
+        self.errors = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        return state
+
+    # ---- baostock API ----
+
+    def login(self, *args, **kwargs):
+        return CachedResultSet([], [])
+
+    def logout(self, *args, **kwargs):
+        return CachedResultSet([], [])
+
+    def query_history_k_data_plus(self, code, fields, start_date=None, end_date=None, frequency="d", adjustflag="3"):
+        return self._answer("query_history_k_data_plus", (code, fields),
+                            {"start_date": start_date, "end_date": end_date, "frequency": frequency,
+                             "adjustflag": adjustflag})
+
+    def query_adjust_factor(self, code, start_date=None, end_date=None):
+        return self._answer("query_adjust_factor", (code,), {"start_date": start_date, "end_date": end_date})
+
+    def query_zz500_stocks(self, date=None):
+        return self._answer("query_zz500_stocks", (), {} if date is None else {"date": date})
+
+    def query_all_stock(self, day=None):
+        return self._answer("query_all_stock", (), {} if day is None else {"day": day})
+
+    def query_trade_dates(self, start_date=None, end_date=None):
+        return self._answer("query_trade_dates", (), {"start_date": start_date, "end_date": end_date})
+
+    def query_profit_data(self, code, year, quarter):
+        return self._answer("query_profit_data", (), {"code": code, "year": year, "quarter": quarter})
+
+    def query_operation_data(self, code, year, quarter):
+        return self._answer("query_operation_data", (), {"code": code, "year": year, "quarter": quarter})
+
+    def query_growth_data(self, code, year, quarter):
+        return self._answer("query_growth_data", (), {"code": code, "year": year, "quarter": quarter})
+
+    def query_balance_data(self, code, year, quarter):
+        return self._answer("query_balance_data", (), {"code": code, "year": year, "quarter": quarter})
+
+    def query_cash_flow_data(self, code, year, quarter):
+        return self._answer("query_cash_flow_data", (), {"code": code, "year": year, "quarter": quarter})
+
+    def query_dupont_data(self, code, year, quarter):
+        return self._answer("query_dupont_data", (), {"code": code, "year": year, "quarter": quarter})
+
+    # ---- replay machinery ----
+
+    def _answer(self, name: str, args: tuple, kwargs: dict):
+        # keyed on the arguments as the caller passed them, like the query cache
+        passed = {k: v for k, v in kwargs.items() if v is not None}
+        key = cache_key(name, args, passed)
+        attempt = self._attempts.get(key, 0)
+        self._attempts[key] = attempt + 1
+        self.calls += 1
+        rng = random.Random(_seed(self.seed, key, attempt))
+
+        answer = self._recorded(key)
+        if answer is None:
+            answer = self._synthesize(name, args, kwargs) if self.synthetic else None
+        fields, rows = answer if answer is not None else ([], [])
+
+        delay = self.latency * (1 + self.jitter * (2 * rng.random() - 1)) + self.row_latency * len(rows)
+        if delay > 0:
+            time.sleep(delay)
+        roll = rng.random()
+        if roll < self.timeout_rate:
+            self.errors += 1
+            raise ConnectionError(f"replayed timeout: {name}")
+        if roll < self.timeout_rate + self.error_rate:
+            self.errors += 1
+            return CachedResultSet(fields, [], INJECTED_ERROR, "injected error")
+        if answer is None:
+            return CachedResultSet([], [], MISSING_ERROR, f"no recorded answer for {key}")
+        return CachedResultSet(fields, rows)
+
+    def _recorded(self, key: str):
+        if not self.recording or not os.path.exists(self.recording):
+            return None
+        if self._conn is None:
+            self._conn = sqlite3.connect(f"file:{self.recording}?mode=ro", uri=True)
+        row = self._conn.execute("SELECT payload FROM entries WHERE key = ?", (key,)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row else None
+
+    def _synthesize(self, name: str, args: tuple, kwargs: dict):
+        if name == "query_history_k_data_plus":
+            return self._prices(args[0], args[1].split(","), kwargs["start_date"], kwargs["end_date"],
+                                str(kwargs.get("adjustflag", "3")))
+        if name == "query_adjust_factor":
+            return self._factors(args[0], kwargs["start_date"], kwargs["end_date"])
+        if name in STATEMENT_FIELDS:
+            return self._statement(name, kwargs["code"], int(kwargs["year"]), int(kwargs["quarter"]))
+        if name == "query_zz500_stocks":
+            day = kwargs.get("date") or self.today
+            return ["updateDate", "code", "code_name"], [[day, code, f"合成{i:05d}"]
+                                                          for i, code in enumerate(synthetic_codes(self.stocks))]
+        if name == "query_all_stock":
+            return ["code", "tradeStatus", "code_name"], [[code, "1", f"合成{i:05d}"]
+                                                           for i, code in enumerate(synthetic_codes(self.stocks))]
+        if name == "query_trade_dates":
+            days = np.arange(np.datetime64(kwargs["start_date"]), np.datetime64(kwargs["end_date"]) + 1)
+            return ["calendar_date", "is_trading_day"], [[str(d), str(int(np.is_busday(d)))] for d in days]
+        return None
+
+    def _trading_days(self):
+        days = np.arange(EPOCH, np.datetime64(self.today) + 1)
+        return days[np.is_busday(days)]
+
+    def _dividends(self, code: str, days: np.ndarray):
+        """
+        Ex-date rows (indexes into days) and price ratios of the stock's yearly cash dividends
+        Returns (rows, back) where back is the cumulative backward factor from each ex-date on.
+        """
+        rng = np.random.default_rng(_seed(self.seed, code, "dividends"))
+        # drawn for a fixed span of years, so a later `today` does not move earlier dividends
+        years = np.arange(2001, LAST_YEAR + 1)
+        # one ex-date per year, somewhere in June or July, paying 0.5% to 4% of the price
+        ex_dates = (years - 1970).astype("datetime64[Y]").astype("datetime64[D]") + 151 + rng.integers(0, 61, len(years))
+        ratios = 1 + rng.uniform(0.005, 0.04, len(years))
+        rows = np.searchsorted(days, ex_dates)
+        keep = rows < len(days)
+        rows, ratios = rows[keep], ratios[keep]
+        return rows, np.cumprod(ratios)
+
+    def _halted(self, code: str, days: np.ndarray) -> np.ndarray:
+        """Mask of suspended days: in about one year out of three, a 1 to 10 day halt"""
+        rng = np.random.default_rng(_seed(self.seed, code, "halts"))
+        years = np.arange(EPOCH.astype("datetime64[Y]").astype(int) + 1970, LAST_YEAR + 1)
+        starts = (years - 1970).astype("datetime64[Y]").astype("datetime64[D]") + rng.integers(0, 365, len(years))
+        lengths = rng.integers(1, 11, len(years))
+        hits = rng.random(len(years)) < 0.3
+        halted = np.zeros(len(days), dtype=bool)
+        for start, length in zip(starts[hits], lengths[hits]):
+            row = np.searchsorted(days, start)
+            halted[row:row + length] = True
+        return halted
+
+    def _prices(self, code: str, fields: list, start_date: str, end_date: str, adjustflag: str = "3"):
+        """
+        Daily bars of a seeded random walk over business days from EPOCH
+        The walk is the backward-adjusted series; unadjusted prices divide it by the dividend
+        factor in force, forward-adjusted ones by the latest factor (as of `today`).
+        """
+        end = min(np.datetime64(end_date or self.today), np.datetime64(self.today))
+        days = self._trading_days()
+        n = len(days)
+        if n == 0 or end < EPOCH:
+            return fields, []
+        # one row of draws per day, so a day's bar does not depend on how long the range is
+        draws = np.random.default_rng(_seed(self.seed, code)).standard_normal((n, 4))
+        returns = np.clip(0.0003 + 0.02 * draws[:, 0], -0.1, 0.1)
+        # the price stands still while trading is halted, so preclose after a halt is the last close
+        halted = self._halted(code, days)
+        returns[halted] = 0
+        close = (5 + _seed(code) % 95) * np.exp(np.cumsum(returns))
+        preclose = np.concatenate([[close[0] / (1 + returns[0])], close[:-1]])
+        open_ = preclose * (1 + 0.005 * draws[:, 1])
+        high = np.maximum(open_, close) * (1 + np.abs(0.008 * draws[:, 2]))
+        low = np.minimum(open_, close) * (1 - np.abs(0.008 * draws[:, 3]))
+        volume = (1e6 * (1 + np.abs(draws[:, 1] + draws[:, 2]))).astype(np.int64)
+
+        rows, back = self._dividends(code, days)
+        factor = np.ones(n)
+        for row, value in zip(rows, back):
+            factor[row:] = value
+        scale = {"1": np.ones(n), "2": np.full(n, 1 / back[-1] if len(back) else 1.0)}.get(adjustflag, 1 / factor)
+        open_, high, low, close, preclose = (x * scale for x in (open_, high, low, close, preclose))
+
+        mask = (days <= end) & ~halted
+        if start_date:
+            mask &= days >= np.datetime64(start_date)
+        columns = {
+            "date": days.astype(str), "code": np.full(n, code), "open": open_, "high": high, "low": low,
+            "close": close, "preclose": preclose, "volume": volume, "amount": volume * close * factor * scale,
+            "pctChg": returns * 100, "adjustflag": np.full(n, adjustflag),
+        }
+        out = []
+        for f in fields:
+            values = columns.get(f, np.full(n, ""))[mask]
+            out.append([f"{v:.8f}" for v in values] if values.dtype.kind == "f" else values.astype(str).tolist())
+        return fields, [list(row) for row in zip(*out)]
+
+    def _factors(self, code: str, start_date: str, end_date: str):
+        """query_adjust_factor rows of the stock's synthetic dividends within [start_date, end_date]"""
+        fields = ["code", "dividOperateDate", "foreAdjustFactor", "backAdjustFactor", "adjustFactor"]
+        days = self._trading_days()
+        if not len(days):
+            return fields, []
+        rows, back = self._dividends(code, days)
+        start = np.datetime64(start_date or str(EPOCH))
+        end = min(np.datetime64(end_date or self.today), np.datetime64(self.today))
+        out = []
+        for row, value in zip(rows, back):
+            if start <= days[row] <= end:
+                out.append([code, str(days[row]), f"{value / back[-1]:.6f}", f"{value:.6f}", f"{value:.6f}"])
+        return fields, out
+
+    def _statement(self, name: str, code: str, year: int, quarter: int):
+        """One report row, or none if it would not be published by `today`"""
+        fields = ["code", "pubDate", "statDate"] + STATEMENT_FIELDS[name]
+        rng = random.Random(_seed(self.seed, code, year, quarter))
+        stat_month = quarter * 3
+        stat_date = date(year, stat_month, 30 if stat_month in (6, 9) else 31)
+        # published some time before the legal deadline (Apr 30, Aug 31, Oct 31, next Apr 30)
+        pub_date = date.fromordinal(stat_date.toordinal() + rng.randint(15, {1: 30, 2: 62, 3: 31, 4: 120}[quarter]))
+        if pub_date.isoformat() > self.today:
+            return fields, []
+        metrics = random.Random(_seed(self.seed, code, year, quarter, name))
+        values = [f"{metrics.uniform(-1, 5):.6f}" for _ in STATEMENT_FIELDS[name]]
+        return fields, [[code, pub_date.isoformat(), stat_date.isoformat()] + values]
+
+    def stats(self) -> dict:
+        """Calls and injected failures answered by this process"""
+        return {"calls": self.calls, "errors": self.errors}
@@ -0,0 +1,126 @@
+import time
+
+from crawler import query_cache
+
+
+# not logged in / socket errors: the session is gone and a fresh login fixes the call
+SESSION_ERRORS = {
+    "10001001",
+    "10002001", "10002002", "10002003", "10002004", "10002005", "10002006", "10002007", "10002008",
+}
+# a session idle for longer than this is health-checked before it is handed out again
+MAX_IDLE_SECONDS = 300
+
+# per-process session state (every worker process has its own)
+_state = {"logged_in": False, "last_used": 0.0, "logins": 0, "reconnects": 0, "offline": False}
+
+
+def ensure_login() -> bool:
+    """
+    Hand out a live baostock session, logging in the first time a remote call needs it
+    Reuse is free; after MAX_IDLE_SECONDS without calls the session is health-checked and
+    re-opened if the server dropped it. baostock itself is only imported here, so local-only
+    code paths never load it. Returns False if the login failed.
+    """
+    if _state["logged_in"]:
+        if time.monotonic() - _state["last_used"] > MAX_IDLE_SECONDS and not _healthy():
+            return reconnect()
+        return True
+    import baostock as bs
+
+    lg = bs.login()
+    if lg.error_code != "0":
+        print(f"❌ Baostock login failed: {lg.error_msg}")
+        return False
+    _state["logged_in"] = True
+    _state["logins"] += 1
+    _state["last_used"] = time.monotonic()
+    return True
+
+
+def _healthy() -> bool:
+    """Cheapest round trip baostock offers: the trading calendar for a single day"""
+    import baostock as bs
+
+    day = time.strftime("%Y-%m-%d")
+    try:
+        rs = bs.query_trade_dates(start_date=day, end_date=day)
+    except Exception:
+        return False
+    _state["last_used"] = time.monotonic()
+    return rs.error_code not in SESSION_ERRORS
+
+
+def reconnect() -> bool:
+    """Drop the current session (without waiting on a dead socket) and log in again"""
+    import baostock as bs
+
+    if _state["logged_in"]:
+        try:
+            bs.logout()
+        except Exception:
+            pass
+    _state["logged_in"] = False
+    _state["reconnects"] += 1
+    return ensure_login()
+
+
+def call(query, *args, **kwargs):
+    """
+    Run a baostock query on the live session, e.g. call(bs.query_profit_data, code=..., year=...)
+    Answers are served from the on-disk query cache while they are fresh (see crawler.query_cache),
+    in which case no login happens at all.
+    If the answer says the session expired or the socket broke (SESSION_ERRORS), or the call
+    raises, the session is re-opened once and the query repeated. Other errors are returned
+    as they are, for the caller's own retry logic.
+    """
+    if _state["offline"]:
+        return query(*args, **kwargs)
+    cached = query_cache.lookup(query, args, kwargs)
+    if cached is not None:
+        return cached
+    ensure_login()
+    try:
+        rs = query(*args, **kwargs)
+    except Exception:
+        if not reconnect():
+            raise
+        rs = query(*args, **kwargs)
+    else:
+        if rs.error_code in SESSION_ERRORS and reconnect():
+            rs = query(*args, **kwargs)
+    _state["last_used"] = time.monotonic()
+    return query_cache.store(query, args, kwargs, rs)
+
+
+def set_offline(offline: bool = True) -> bool:
+    """
+    With offline=True, call() runs queries without logging in or reconnecting
+    (for local stand-ins of the baostock query functions). Returns the previous setting.
+    """
+    previous = _state["offline"]
+    _state["offline"] = offline
+    return previous
+
+
+def reset_after_fork():
+    """
+    Forget a session inherited from the parent process (its socket belongs to the parent),
+    so the next ensure_login() in this worker opens its own
+    """
+    _state.update(logged_in=False, last_used=0.0, logins=0, reconnects=0, offline=False)
+
+
+def session_stats() -> dict:
+    """Logins and reconnects made by this process so far"""
+    return {"logged_in": _state["logged_in"], "logins": _state["logins"], "reconnects": _state["reconnects"]}
+
+
+def logout():
+    """Close the session if one was opened"""
+    if not _state["logged_in"]:
+        return
+    import baostock as bs
+
+    bs.logout()
+    _state["logged_in"] = False
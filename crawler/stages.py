@@ -0,0 +1,225 @@
+"""
+Overlapped producer / consumer stages connected by bounded queues
+
+    run = StagedRun(fetch_results, [("decode", decode_one)], queue_size=8)
+    for item in run:
+        persist(item)
+    print(format_utilization(run))
+
+The source iterator is consumed on its own thread (for downloads: the fetch loop, which owns the
+baostock session), every stage function runs on its own thread, and the caller's loop body is the
+last stage. Network waits, Arrow parsing and Parquet writes all release the GIL, so while one
+stock is written the next is decoded and a third is on the wire. A full queue blocks the stage
+feeding it (backpressure): at most queue_size items are held between two stages, whatever the
+speed difference. With queue_size 0 everything runs one item at a time on the caller's thread
+(the sequential baseline, with the same stats).
+"""
+import queue
+import threading
+import time
+
+from crawler import metrics
+
+
+# items held between two stages
+QUEUE_SIZE = 8
+# how often a blocked thread looks whether the run was abandoned
+_POLL_SECONDS = 0.1
+
+_DONE = object()
+
+
+class _Failure:
+    """An exception raised inside a stage thread, handed to the consumer to re-raise"""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+class StageStats:
+    """
+    Time split of one stage over a run
+        busy: seconds spent working (fetching, decoding, the caller's loop body)
+        starved: seconds waiting for input
+        blocked: seconds waiting for room in the next queue (backpressure)
+    """
+    __slots__ = ("name", "items", "busy", "starved", "blocked")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.starved = 0.0
+        self.blocked = 0.0
+
+    def utilization(self, wall: float) -> float:
+        return self.busy / wall if wall > 0 else 0.0
+
+    def as_dict(self, wall: float) -> dict:
+        return {"items": self.items, "busy": self.busy, "starved": self.starved, "blocked": self.blocked,
+                "utilization": self.utilization(wall)}
+
+
+class StagedRun:
+    """
+    Iterate over source → stage functions, each on its own thread, yielding the last stage's items
+    Parameters:
+        source: Iterable producing the items (consumed on a thread of its own)
+        stages: List of (name, func); func(item) returns the item handed to the next stage
+        queue_size: Items held between two stages (0: no threads, one item at a time)
+        source_name / sink_name: Stage names of the source and of the caller's loop in the stats
+    An exception in any stage stops the run and is raised from the caller's loop. Leaving the
+    loop early stops the threads, and the source is closed on its own thread.
+    """
+
+    def __init__(self, source, stages: list, queue_size: int = QUEUE_SIZE, source_name: str = "fetch",
+                 sink_name: str = "write"):
+        self.source = source
+        self.stages = stages
+        self.queue_size = queue_size
+        self.stats = [StageStats(source_name)] + [StageStats(name) for name, _ in stages] + [StageStats(sink_name)]
+        self.wall = 0.0
+        self._stop = threading.Event()
+
+    def _put(self, q: queue.Queue, item, stats: StageStats) -> bool:
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    q.put(item, timeout=_POLL_SECONDS)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        finally:
+            stats.blocked += time.perf_counter() - start
+
+    def _get(self, q: queue.Queue, stats: StageStats):
+        start = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    return q.get(timeout=_POLL_SECONDS)
+                except queue.Empty:
+                    pass
+            return _DONE
+        finally:
+            stats.starved += time.perf_counter() - start
+
+    def _produce(self, out: queue.Queue, stats: StageStats):
+        iterator = iter(self.source)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    stats.busy += time.perf_counter() - start
+                stats.items += 1
+                if not self._put(out, item, stats):
+                    break
+        except BaseException as e:
+            self._put(out, _Failure(e), stats)
+            return
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+        self._put(out, _DONE, stats)
+
+    def _work(self, func, inbox: queue.Queue, out: queue.Queue, stats: StageStats):
+        while True:
+            item = self._get(inbox, stats)
+            if item is _DONE or isinstance(item, _Failure):
+                self._put(out, item, stats)
+                return
+            start = time.perf_counter()
+            try:
+                result = func(item)
+            except BaseException as e:
+                self._put(out, _Failure(e), stats)
+                return
+            finally:
+                stats.busy += time.perf_counter() - start
+            stats.items += 1
+            if not self._put(out, result, stats):
+                return
+
+    def __iter__(self):
+        if self.queue_size <= 0:
+            return self._inline()
+        return self._threaded()
+
+    def _inline(self):
+        started = time.perf_counter()
+        iterator = iter(self.source)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    self.stats[0].busy += time.perf_counter() - start
+                self.stats[0].items += 1
+                for (_, func), stats in zip(self.stages, self.stats[1:]):
+                    start = time.perf_counter()
+                    item = func(item)
+                    stats.busy += time.perf_counter() - start
+                    stats.items += 1
+                self.stats[-1].items += 1
+                start = time.perf_counter()
+                yield item
+                self.stats[-1].busy += time.perf_counter() - start
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            self._finish(started)
+
+    def _finish(self, started: float):
+        self.wall = time.perf_counter() - started
+        for stats in self.stats:
+            metrics.count(f"stage_busy.{stats.name}", stats.busy)
+            metrics.count(f"stage_blocked.{stats.name}", stats.blocked)
+
+    def _threaded(self):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._produce, args=(queues[0], self.stats[0]),
+                                    name=f"stage-{self.stats[0].name}", daemon=True)]
+        for i, (name, func) in enumerate(self.stages):
+            threads.append(threading.Thread(target=self._work, args=(func, queues[i], queues[i + 1], self.stats[i + 1]),
+                                            name=f"stage-{name}", daemon=True))
+        sink = self.stats[-1]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                item = self._get(queues[-1], sink)
+                if item is _DONE:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.error
+                sink.items += 1
+                start = time.perf_counter()
+                yield item
+                sink.busy += time.perf_counter() - start
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            self._finish(started)
+
+    def report(self) -> dict:
+        """Per stage: items, busy / starved / blocked seconds and utilization (busy / wall time)"""
+        return {"wall": self.wall, "stages": {s.name: s.as_dict(self.wall) for s in self.stats}}
+
+
+def format_utilization(run: StagedRun) -> str:
+    """One line such as 'fetch 97% · decode 12% · write 9% busy (4.20s)'"""
+    parts = [f"{s.name} {s.utilization(run.wall):.0%}" for s in run.stats]
+    return " · ".join(parts) + f" busy ({run.wall:.2f}s)"
@@ -1,57 +1,171 @@
 import baostock as bs
+import numpy as np
 import pandas as pd
 import os
 import time
-import matplotlib.pyplot as plt
-import matplotlib
+from functools import partial
 
+from crawler.price_store import (
+    STORE_DIR,
+    ensure_price_store,
+    write_price_data,
+    compact_price_store,
+    load_manifest,
+    COMPACT_FRAGMENTS,
+    save_stock_names,
+    load_stock_names,
+    read_prices,
+    load_price_basis,
+    mark_unadjusted,
+    save_adjust_factors,
+    load_suspended_days,
+    record_suspended_days,
+)
+from crawler.jobs import create_job, load_job, record_units, atomic_write_csv
+from crawler.price_panel import load_price_panel
+from crawler.downloader import download_prices, run_tasks
+from crawler.stages import QUEUE_SIZE, format_utilization
+from crawler.session import call
+from crawler.trade_calendar import update_trade_calendar, trading_days, missing_ranges
+from crawler.decode import decode_result, decode_rows, column_types, fetch_rows
+from crawler import metrics
+from analysis.screening import range_change_screen
 
 
 
 
 
 
-matplotlib.rcParams['font.sans-serif'] = ['Microsoft YaHei']  
-matplotlib.rcParams['axes.unicode_minus'] = False  
 
 
-def get_price_data_baostock(stock_code: str, start_date: str, end_date: str) -> pd.DataFrame:
+
+# fields of every daily-bar request (preclose reveals corporate actions)
+PRICE_QUERY_FIELDS = "date,code,open,high,low,close,preclose,volume"
+# factor tables are asked for from before the first A-share listing
+FACTOR_START = "1990-01-01"
+
+
+def get_price_data_baostock(stock_code: str, start_date: str, end_date: str, query_func=None,
+                            adjustflag="3") -> pd.DataFrame:
     """
-    Use Baostock to get A-share daily market data (forward adjusted)
+    Use Baostock to get A-share daily market data (unadjusted by default)
     Parameters:
         stock_code: Stock code (format like 'sh.600000')
         start_date: Start date (format '2023-07-01')
         end_date: End date (format '2025-07-14')
+        query_func: Stand-in for bs.query_history_k_data_plus (e.g. a local fake result set)
+        adjustflag: '3' unadjusted (what the store keeps), '2' forward, '1' backward adjusted
     Returns:
-        pd.DataFrame with fields: date, open, close, high, low, volume, code
+        pd.DataFrame with fields: date, stock_code, open, high, low, close, preclose, volume
+        (preclose is the previous close adjusted for an action on that day, so it reveals dividends)
+    Raises RuntimeError if Baostock reports an error for the request.
     """
+    return decode_price_rows(stock_code, fetch_price_rows(stock_code, start_date, end_date, query_func, adjustflag))
 
-    rs = bs.query_history_k_data_plus(
-        stock_code,
-        "date,code,open,high,low,close,volume",
-        start_date=start_date,
-        end_date=end_date,
-        frequency="d",
-        adjustflag="2"  
-    )
-
-    data_list = []
-    while rs.next():
-        data_list.append(rs.get_row_data())
-
-    df = pd.DataFrame(data_list, columns=rs.fields)
 
-    
-    df["open"] = pd.to_numeric(df["open"], errors='coerce')
-    df["high"] = pd.to_numeric(df["high"], errors='coerce')
-    df["low"] = pd.to_numeric(df["low"], errors='coerce')
-    df["close"] = pd.to_numeric(df["close"], errors='coerce')
-    df["volume"] = pd.to_numeric(df["volume"], errors='coerce')
+def fetch_price_rows(stock_code: str, start_date: str, end_date: str, query_func=None, adjustflag="3") -> tuple:
+    """
+    Network half of get_price_data_baostock: the whole answer as (fields, rows of strings)
+    Every page is received here, so decoding (decode_price_rows) can run while the next stock
+    is fetched. Raises RuntimeError if Baostock reports an error for the request.
+    """
+    query = query_func or partial(call, bs.query_history_k_data_plus)
+    start = time.perf_counter()
+    with metrics.span("fetch.prices"):
+        rs = query(
+            stock_code,
+            PRICE_QUERY_FIELDS,
+            start_date=start_date,
+            end_date=end_date,
+            frequency="d",
+            adjustflag=adjustflag
+        )
+        if rs.error_code != "0":
+            raise RuntimeError(f"{stock_code} query failed: {rs.error_msg}")
+        rows = fetch_rows(rs)
+        if rs.error_code != "0":
+            raise RuntimeError(f"{stock_code} query failed on a later page: {rs.error_msg}")
+    metrics.observe("latency.prices", time.perf_counter() - start, label=stock_code)
+    return list(rs.fields), rows
+
+
+def decode_price_rows(stock_code: str, raw: tuple) -> pd.DataFrame:
+    """CPU half of get_price_data_baostock: typed DataFrame from fetch_price_rows' answer"""
+    fields, rows = raw
+    # typed straight from the answer: dates as datetime64, prices float64, volume int64
+    with metrics.span("decode.prices"):
+        df = decode_rows(rows, fields, column_types("query_history_k_data_plus", fields))
+    metrics.count("rows.prices", len(df))
 
     df = df.rename(columns={"code": "stock_code"})
     return df.sort_values(by="date").reset_index(drop=True)
 
 
+def get_adjust_factors(stock_code: str, start_date: str = FACTOR_START, end_date: str = None,
+                       query_func=None) -> pd.DataFrame:
+    """
+    Corporate-action adjustment factors of one stock (one row per ex-date)
+    Parameters:
+        query_func: Stand-in for bs.query_adjust_factor
+    Returns:
+        pd.DataFrame with fields: stock_code, date, fore, back (empty if the stock never had an action)
+    Raises RuntimeError if Baostock reports an error for the request.
+    """
+    query = query_func or partial(call, bs.query_adjust_factor)
+    with metrics.span("fetch.factors"):
+        rs = query(stock_code, start_date=start_date, end_date=end_date or time.strftime("%Y-%m-%d"))
+    if rs.error_code != "0":
+        raise RuntimeError(f"{stock_code} adjust factor query failed: {rs.error_msg}")
+    df = decode_result(rs, "query_adjust_factor").rename(columns={
+        "code": "stock_code", "dividOperateDate": "date", "foreAdjustFactor": "fore", "backAdjustFactor": "back",
+    })
+    return df[["stock_code", "date", "fore", "back"]]
+
+
+def refresh_adjust_factors(codes: list, store_dir=STORE_DIR, workers=1, requests_per_second=10.0, retries=3,
+                           factor_func=None) -> list:
+    """
+    Re-fetch the whole factor table of each stock (a few rows each) and store it
+    Returns the codes that failed; they stay marked for refresh and are asked for again next update.
+    """
+    if not codes:
+        return []
+    task_func = partial(get_adjust_factors, query_func=factor_func) if factor_func is not None else get_adjust_factors
+    frames, done, failed = [], [], []
+    for (code,), df, error, _ in run_tasks(task_func, [(code,) for code in codes], workers=workers,
+                                           requests_per_second=requests_per_second, retries=retries,
+                                           login=factor_func is None):
+        if error is not None:
+            print(f"\n❌ Adjust factors failed: {code}, Error: {error}")
+            failed.append(code)
+        else:
+            done.append(code)
+            if not df.empty:
+                frames.append(df)
+    save_adjust_factors(pd.concat(frames, ignore_index=True) if frames else None, done, store_dir)
+    print(f"\n✅ Adjust factors refreshed for {len(done)} stocks")
+    return failed
+
+
+def find_corporate_actions(new_df: pd.DataFrame, last_close: dict) -> set:
+    """
+    Codes with a dividend, split or rights issue among the new bars
+    On an ex-date baostock's unadjusted preclose is the previous close adjusted for the action,
+    so it differs from the close actually stored (or fetched) for the bar before.
+    Parameters:
+        new_df: Fetched bars with stock_code, date, close, preclose
+        last_close: code → stored close of the bar just before new_df's first bar
+    """
+    if new_df.empty or "preclose" not in new_df.columns:
+        return set()
+    df = new_df.sort_values(["stock_code", "date"])
+    prev = df.groupby("stock_code", sort=False)["close"].shift(1)
+    prev = prev.fillna(df["stock_code"].map(last_close))
+    known = prev.notna() & df["preclose"].notna()
+    moved = ~np.isclose(df["preclose"][known], prev[known], rtol=1e-6, atol=1e-4)
+    return set(df["stock_code"][known][moved])
+
+
 def save_price_data_to_csv(df: pd.DataFrame, stock_code: str) -> str:
     """
     Save DataFrame as a CSV file (Path: daily_data/{stock_code}.csv)
@@ -61,7 +175,7 @@ def save_price_data_to_csv(df: pd.DataFrame, stock_code: str) -> str:
 
     file_path = os.path.join(output_dir, f"{stock_code.replace('.', '_')}.csv")
     
-    df.to_csv(file_path, index=False, encoding="utf-8-sig")
+    atomic_write_csv(df, file_path)
     print(f"✅ {stock_code} data has been saved to {file_path}")
     return file_path
 
@@ -72,31 +186,19 @@ def get_zz500_stocks() -> pd.DataFrame:
     Returns DataFrame with fields:
         code (e.g., 'sh.600519'), code_name, ...
     """
-    lg = bs.login()
-    if lg.error_code != "0":
-        print("Login failed:", lg.error_msg)
-        return pd.DataFrame()
-
-    rs = bs.query_zz500_stocks()
+    # runs on the program's shared session instead of logging in and out on its own
+    rs = call(bs.query_zz500_stocks)
     if rs.error_code != "0":
         print("Request failed:", rs.error_msg)
-        bs.logout()
         return pd.DataFrame()
 
-    data = []
-    while rs.next():
-        data.append(rs.get_row_data())
-
-    bs.logout()
-    df = pd.DataFrame(data, columns=rs.fields)
-    return df
+    return decode_result(rs, "query_zz500_stocks")
 
 
 def fetch_and_save_zz500_list(output_path="output/zz500_list.csv") -> pd.DataFrame:
     """Fetch CSI 500 list and save as CSV"""
     df = get_zz500_stocks()
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    df.to_csv(output_path, index=False, encoding="utf-8-sig")
+    atomic_write_csv(df, output_path)
     print(f"✅ Fetched {len(df)} CSI 500 stocks and saved to: {output_path}")
     return df
 
@@ -139,76 +241,138 @@ def save_price_data_with_name(df: pd.DataFrame, stock_code: str, stock_dic: dict
     file_path = os.path.join(output_dir, filename)
 
     
-    df.to_csv(file_path, index=False, encoding="utf-8-sig")
+    atomic_write_csv(df, file_path)
     print(f"✅ {stock_code} ({stock_name}) data has been saved to {file_path}")
     return file_path
 
 
-def download_all_stock_data(stock_code_list: list, stock_dic: dict, start_date: str, end_date: str):
+def price_unit(code: str, start_date: str, end_date: str) -> str:
+    """Job journal key of one stock download"""
+    return f"{code}|{start_date}|{end_date}"
+
+
+def download_all_stock_data(stock_code_list: list, stock_dic: dict, start_date: str, end_date: str,
+                            store_dir=STORE_DIR, flush_every=50, workers=1, requests_per_second=10.0,
+                            retries=3, query_func=None, job_id=None, factor_func=None, calendar_func=None,
+                            queue_size=QUEUE_SIZE):
     """
-    Batch download all stock daily data and save locally (with progress bar and company name)
+    Batch download all stock daily data into the columnar price store (with progress bar)
+    Parameters:
+        workers: Parallel worker processes, each with its own Baostock session (1 = current session)
+        requests_per_second: Shared request rate limit across workers
+        retries: Retries per stock with exponential backoff before it is reported as failed
+        query_func: Stand-in for bs.query_history_k_data_plus, for offline testing
+        job_id: Resume this journaled job, fetching only its unfinished stocks
+        factor_func / calendar_func: Stand-ins for bs.query_adjust_factor / bs.query_trade_dates
+        queue_size: Stocks held between the fetch, decode and write stages (0 = one at a time)
+    Every run is journaled under output/jobs/. Downloaded stocks are buffered and flushed to the
+    store every `flush_every` stocks; a stock is marked done only once its rows are on disk.
+    Fetching, decoding and writing overlap (see download_prices).
+    Prices are stored unadjusted; the adjustment factors of the downloaded stocks are fetched
+    at the end (see refresh_adjust_factors) and applied when the store is read. Trading days
+    inside a stock's fetched range without a bar are recorded as suspended, so later updates do
+    not ask for them again.
+    Returns the list of codes that still failed after all retries.
     """
+    if job_id is None:
+        units = [price_unit(code, start_date, end_date) for code in stock_code_list]
+        job_id = create_job("prices", {"start_date": start_date, "end_date": end_date, "store_dir": store_dir}, units)
+        print(f"📝 Download job journal: {job_id}")
+    else:
+        pending = set(load_job(job_id)["pending"])
+        stock_code_list = [code for code in stock_code_list if price_unit(code, start_date, end_date) in pending]
+
     total = len(stock_code_list)
     bar_length = 30
-
-    for idx, code in enumerate(stock_code_list):
-        try:
-            df = get_price_data_baostock(code, start_date, end_date)
-            if df.empty:
-                print(f"⚠️ {code} has no data, skipping")
-                continue
-            save_price_data_with_name(df, code, stock_dic)
-        except Exception as e:
-            print(f"❌ Download failed: {code}, Error: {e}")
-            continue
-
-        
-        progress = (idx + 1) / total
-        filled = int(bar_length * progress)
-        bar = "█" * filled + "-" * (bar_length - filled)
-        print(f"\r📊 Download progress: [{bar}] {idx + 1}/{total}", end="")
-
-        time.sleep(0.1)  
-
-    print("\n✅ All stock data download completed")
-
-
-def find_top_gainers(data_folder="daily_data_history", recent_days=30, top_n=10):
-    results = []
-
-    for filename in os.listdir(data_folder):
-        if filename.endswith(".csv"):
-            filepath = os.path.join(data_folder, filename)
-            try:
-                df = pd.read_csv(filepath)
-                df = df.sort_values("date")  
-
-                if len(df) < recent_days + 1:
-                    continue  
-
-                
-                recent_df = df[-(recent_days+1):].reset_index(drop=True)
-                start_price = recent_df.loc[0, "close"]
-                end_price = recent_df.loc[recent_days, "close"]
-
-                if pd.isna(start_price) or pd.isna(end_price) or start_price == 0:
-                    continue
-
-                change = (end_price - start_price) / start_price
-
-                results.append({
-                    "Stock": filename.replace(".csv", ""),
-                    "Start Price": round(start_price, 2),
-                    "End Price": round(end_price, 2),
-                    "Change %": round(change * 100, 2)
-                })
-
-            except Exception as e:
-                print(f"❌ Failed to read: {filename}, Error: {e}")
-
-    
-    sorted_results = sorted(results, key=lambda x: x["Change %"], reverse=True)
-    top_gainers = sorted_results[:top_n]
+    buffer = []
+    failed = []
+
+    save_stock_names(stock_dic, store_dir)
+    days = _trading_days_through(end_date, calendar_func)
+
+    downloaded = []
+
+    def flush():
+        if buffer:
+            write_price_data(pd.concat(buffer, ignore_index=True), store_dir)
+            codes = [df["stock_code"].iloc[0] for df in buffer]
+            mark_unadjusted(codes, store_dir)
+            if days is not None:
+                record_suspended_days({code: _days_without_bar(df, days) for code, df in zip(codes, buffer)},
+                                      store_dir)
+            record_units(job_id, [price_unit(code, start_date, end_date) for code in codes])
+            downloaded.extend(codes)
+            buffer.clear()
+
+    tasks = [(code, start_date, end_date) for code in stock_code_list]
+    results = download_prices(fetch_price_rows, tasks, workers=workers, requests_per_second=requests_per_second,
+                              retries=retries, query_func=query_func, decode_func=decode_price_rows,
+                              queue_size=queue_size)
+    try:
+        for idx, (code, df, error, attempts) in enumerate(results):
+            if error is not None:
+                print(f"\n❌ Download failed: {code} after {attempts} attempts, Error: {error}")
+                record_units(job_id, [price_unit(code, start_date, end_date)], "failed", error)
+                failed.append(code)
+            elif df.empty:
+                print(f"\n⚠️ {code} has no data, skipping")
+                record_units(job_id, [price_unit(code, start_date, end_date)])
+            else:
+                buffer.append(df)
+
+            if len(buffer) >= flush_every:
+                flush()
+
+            
+            progress = (idx + 1) / total
+            filled = int(bar_length * progress)
+            bar = "█" * filled + "-" * (bar_length - filled)
+            print(f"\r📊 Download progress: [{bar}] {idx + 1}/{total}", end="")
+    finally:
+        # keep whatever finished before a crash or Ctrl-C, so a resume does not refetch it
+        flush()
+    print(f"\n⏱ Stage utilization: {format_utilization(results)}")
+
+    compact_price_store(store_dir)
+    refresh_adjust_factors(downloaded, store_dir, workers=workers, requests_per_second=requests_per_second,
+                           retries=retries, factor_func=factor_func)
+    print(f"\n✅ All stock data download completed, saved to {store_dir}")
+    if failed:
+        print(f"⚠️ {len(failed)} stocks failed: {', '.join(failed)}")
+        print(f"   Resume job {job_id} to retry them")
+    return failed
+
+
+def resume_download_job(job_id: str, workers=1, requests_per_second=10.0, retries=3, query_func=None,
+                        factor_func=None, calendar_func=None):
+    """Rerun only the unfinished stocks of a journaled price download"""
+    job = load_job(job_id)
+    params = job["params"]
+    codes = [unit.split("|", 1)[0] for unit in job["pending"]]
+    if not codes:
+        print(f"✅ Job {job_id} is already complete")
+        return []
+    print(f"🔁 Resuming {job_id}: {len(codes)} of {len(job['units'])} stocks left")
+    store_dir = params.get("store_dir", STORE_DIR)
+    return download_all_stock_data(codes, load_stock_names(store_dir), params["start_date"], params["end_date"],
+                                   store_dir=store_dir, workers=workers, requests_per_second=requests_per_second,
+                                   retries=retries, query_func=query_func, job_id=job_id, factor_func=factor_func,
+                                   calendar_func=calendar_func)
+
+
+def find_top_gainers(data_folder="daily_data_history", recent_days=30, top_n=10, store_dir=STORE_DIR, panel=None):
+    if panel is None:
+        panel = load_price_panel(store_dir, data_folder)
+    with metrics.span("screen.range_gainers"):
+        screen = range_change_screen(panel, recent_days, top_n)
+    labels = panel.labels()
+
+    top_gainers = [{
+        "Stock": labels[col],
+        "Start Price": round(screen["start_price"][col], 2),
+        "End Price": round(screen["end_price"][col], 2),
+        "Change %": round(screen["change"][col] * 100, 2)
+    } for col in screen["order"]]
     top_df = pd.DataFrame(top_gainers)
 
     
@@ -232,53 +396,175 @@ def ensure_zz500_list(filepath="output/zz500_list.csv") -> tuple[list, dict, dic
 
 
 
-def update_existing_stock_data(stock_code_list: list, stock_dic: dict, end_date: str, data_folder="daily_data_history"):
-
-    total = len(stock_code_list)
+def update_existing_stock_data(stock_code_list: list, stock_dic: dict, end_date: str, data_folder="daily_data_history",
+                               store_dir=STORE_DIR, workers=1, requests_per_second=10.0, retries=3, query_func=None,
+                               factor_func=None, calendar_func=None, queue_size=QUEUE_SIZE):
+    """
+    Fetch the trading days each stored stock is missing, then refresh adjustment factors
+    Stored dates are checked against the exchange calendar (crawler.trade_calendar): besides
+    the days after the last stored date, holes left inside the history by an earlier failed
+    fetch are requested, and nothing is asked for when no trading day is missing (weekends,
+    holidays). Trading days a fetch covered without returning a bar are recorded as suspended
+    and not asked for again. Without a calendar everything after the last stored date is fetched.
+    Only stocks with a corporate action among the new bars (see find_corporate_actions), or whose
+    factors were never fetched, ask for their factor table again; adjusted history is never
+    re-downloaded. Stocks still holding legacy forward-adjusted history are re-downloaded
+    unadjusted once, from their first stored date.
+    Parameters:
+        query_func / factor_func / calendar_func: Stand-ins for bs.query_history_k_data_plus /
+            bs.query_adjust_factor / bs.query_trade_dates
+        queue_size: Stocks held between the fetch, decode and write stages (0 = one at a time)
+    Returns the list of codes whose prices failed to update.
+    """
     bar_length = 30
-    updated_count = 0
-
-    for idx, code in enumerate(stock_code_list):
-        filename_part = code.replace(".", "_")
-        match_files = [f for f in os.listdir(data_folder) if filename_part in f and f.endswith(".csv")]
-        if not match_files:
-            print(f"⚠️ Local file not found, skipping：{code}")
+    updated = set()
+    buffer = []
+    failed = []
+
+    ensure_price_store(data_folder, store_dir)
+    manifest = load_manifest(store_dir)
+    basis = load_price_basis(store_dir)
+    days = _trading_days_through(end_date, calendar_func)
+    suspended = load_suspended_days(store_dir)
+
+    tasks = []
+    legacy = set()
+    # code → trading days expected from its first stored date on (known suspensions left out)
+    expected = {}
+    for code in stock_code_list:
+        if code not in manifest:
+            print(f"⚠️ Local data not found, skipping：{code}")
+            continue
+        if code not in basis:
+            legacy.add(code)
+            tasks.append((code, manifest[code]["first_date"], end_date))
+            continue
+        if days is not None:
+            exp = days[days >= np.datetime64(manifest[code]["first_date"])]
+            expected[code] = exp[~np.isin(exp, np.array(suspended.get(code, []), dtype="datetime64[D]"))]
             continue
 
-        filepath = os.path.join(data_folder, match_files[0])
-        try:
-            old_df = pd.read_csv(filepath)
-            last_date = old_df['date'].max()
-            start_date = pd.to_datetime(last_date) + pd.Timedelta(days=1)
-            start_date_str = start_date.strftime("%Y-%m-%d")
-
-            if start_date_str > end_date:
-                continue  
-
-            new_df = get_price_data_baostock(code, start_date_str, end_date)
-            if new_df.empty:
-                continue
-
-            combined_df = pd.concat([old_df, new_df], ignore_index=True).drop_duplicates(subset="date")
-            combined_df.to_csv(filepath, index=False, encoding="utf-8-sig")
-            updated_count += 1
-        except Exception as e:
-            print(f"❌ Update failed：{code}，错误：{e}")
+        start_date = pd.to_datetime(manifest[code]["last_date"]) + pd.Timedelta(days=1)
+        start_date_str = start_date.strftime("%Y-%m-%d")
+
+        if start_date_str > end_date:
+            continue  
+        tasks.append((code, start_date_str, end_date))
+    if legacy:
+        print(f"⚠️ {len(legacy)} stocks hold forward-adjusted history; re-downloading them unadjusted once")
+
+    # fewer stored rows than trading days up to the last stored date means holes inside the history
+    holed = [code for code, exp in expected.items()
+             if np.count_nonzero(exp <= np.datetime64(manifest[code]["last_date"])) > manifest[code]["rows"]]
+    stored = _stored_dates(holed, store_dir)
+    if holed:
+        print(f"🔍 {len(holed)} stocks have missing trading days inside their history")
+    # code → trading days requested that are not stored
+    wanted = {}
+    for code, exp in expected.items():
+        if code in stored:
+            missing = ~np.isin(exp, stored[code])
+        else:
+            missing = exp > np.datetime64(manifest[code]["last_date"])
+        wanted[code] = exp[missing]
+        tasks.extend((code, start, end) for start, end in missing_ranges(exp, missing))
+
+    total = len(tasks)
+    returned = {}
+    results = download_prices(fetch_price_rows, tasks, workers=workers, requests_per_second=requests_per_second,
+                              retries=retries, query_func=query_func, decode_func=decode_price_rows,
+                              queue_size=queue_size)
+    for idx, (code, new_df, error, _) in enumerate(results):
+        if error is not None:
+            print(f"\n❌ Update failed：{code}，错误：{error}")
+            if code not in failed:
+                failed.append(code)
+        else:
+            # only missing bars are added, stored ones are never rewritten
+            # (legacy stocks are replaced as a whole)
+            if code in wanted:
+                new_dates = new_df["date"].to_numpy().astype("datetime64[D]")
+                returned.setdefault(code, []).append(new_dates)
+                new_df = new_df[np.isin(new_dates, wanted[code]) | (new_df["date"] > manifest[code]["last_date"])]
+            elif code not in legacy:
+                new_df = new_df[new_df["date"] > manifest[code]["last_date"]]
+            if not new_df.empty:
+                buffer.append(new_df)
+                updated.add(code)
 
         
         progress = (idx + 1) / total
         filled = int(bar_length * progress)
         bar = "█" * filled + "-" * (bar_length - filled)
         print(f"\r📊 Update progress：[{bar}] {idx + 1}/{total}", end="")
-
-    print(f"\n✅ Update completed, total updated {updated_count} stocks")
-
-
-
-
-
-
-
-
-
-
+    if total:
+        print(f"\n⏱ Stage utilization: {format_utilization(results)}")
+
+    stale = {code for code in stock_code_list if basis.get(code) == ""}
+    if buffer:
+        new_rows = pd.concat(buffer, ignore_index=True)
+        appended = new_rows[~new_rows["stock_code"].isin(legacy | set(holed))]
+        stale |= find_corporate_actions(appended, _stored_last_close(appended, manifest, store_dir))
+        # a filled hole is not preceded by the last stored close; just refresh those stocks' factors
+        stale |= set(new_rows["stock_code"]) & set(holed)
+        # one small append fragment per run; partitions are folded only once enough have piled up
+        write_price_data(new_rows, store_dir)
+        compact_price_store(store_dir, min_fragments=COMPACT_FRAGMENTS)
+        replaced = set(new_rows["stock_code"]) & legacy
+        mark_unadjusted(replaced, store_dir)
+        stale |= replaced
+        if days is not None:
+            record_suspended_days({code: _days_without_bar(df, days) for code, df in
+                                   new_rows[new_rows["stock_code"].isin(replaced)].groupby("stock_code")}, store_dir)
+    got = {code: np.concatenate(parts) for code, parts in returned.items()}
+    latest = [dates.max() for dates in got.values() if len(dates)]
+    if latest:
+        # a day no stock has a bar for may not be published yet; a day others traded on is a suspension
+        published = max(latest)
+        record_suspended_days({
+            code: [str(d) for d in wanted[code][(wanted[code] <= published) & ~np.isin(wanted[code], dates)]]
+            for code, dates in got.items() if code not in failed
+        }, store_dir)
+    save_stock_names(stock_dic, store_dir)
+    if stale:
+        print(f"\n🔁 Refreshing adjustment factors of {len(stale)} stocks")
+        refresh_adjust_factors(sorted(stale), store_dir, workers=workers, requests_per_second=requests_per_second,
+                               retries=retries, factor_func=factor_func)
+    print(f"\n✅ Update completed, total updated {len(updated)} stocks")
+    return failed
+
+
+def _trading_days_through(end_date: str, calendar_func=None):
+    """Trading days up to end_date from the cached calendar, or None if it cannot be refreshed"""
+    try:
+        return trading_days(update_trade_calendar(end_date, query_func=calendar_func), end_date=end_date)
+    except Exception as e:
+        print(f"⚠️ Trading calendar unavailable ({e}); fetching everything after each stock's last date")
+        return None
+
+
+def _stored_dates(codes: list, store_dir: str) -> dict:
+    """code → stored dates (datetime64[D]) of the given stocks"""
+    if not codes:
+        return {}
+    df = read_prices(columns=[], codes=codes, store_dir=store_dir, adjust="none")
+    return {code: group["date"].to_numpy().astype("datetime64[D]") for code, group in df.groupby("stock_code")}
+
+
+def _days_without_bar(df: pd.DataFrame, days: np.ndarray) -> list:
+    """Trading days between a stock's first and last fetched bar that have no bar (YYYY-MM-DD)"""
+    dates = df["date"].to_numpy().astype("datetime64[D]")
+    if not len(dates):
+        return []
+    span = days[(days >= dates.min()) & (days <= dates.max())]
+    return [str(d) for d in span[~np.isin(span, dates)]]
+
+
+def _stored_last_close(new_df: pd.DataFrame, manifest: dict, store_dir: str) -> dict:
+    """code → stored (unadjusted) close on its recorded last date, for the stocks in new_df"""
+    codes = sorted(set(new_df["stock_code"]))
+    if not codes:
+        return {}
+    start = min(manifest[code]["last_date"] for code in codes)
+    stored = read_prices(start_date=start, columns=["close"], codes=codes, store_dir=store_dir, adjust="none")
+    return stored.groupby("stock_code")["close"].last().to_dict()
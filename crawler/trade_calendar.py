@@ -0,0 +1,86 @@
+"""
+Exchange trading calendar, cached in output/trade_calendar.csv
+
+The cache is extended from baostock's query_trade_dates only past its last cached day, so after
+the first run a refresh asks for a few days at most. The crawler checks every stock's stored
+dates against it (see missing_ranges) and asks only for the trading days that are missing,
+instead of everything after the last stored date, weekends and holidays included.
+"""
+import os
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from crawler import metrics
+from crawler.decode import decode_result
+from crawler.jobs import atomic_write_csv
+from crawler.session import call
+
+
+CALENDAR_PATH = "output/trade_calendar.csv"
+# first trading day of the Shanghai exchange
+CALENDAR_START = "1990-12-19"
+# holes closer than this (in trading days) are fetched in one request, stored days in between included
+MERGE_GAP_DAYS = 20
+
+
+def load_trade_calendar(path=CALENDAR_PATH) -> pd.DataFrame:
+    """Cached calendar: calendar_date (datetime64), is_trading_day (0/1), one row per calendar day"""
+    if not os.path.exists(path):
+        return pd.DataFrame({"calendar_date": pd.Series(dtype="datetime64[ms]"),
+                             "is_trading_day": pd.Series(dtype="int64")})
+    return pd.read_csv(path, parse_dates=["calendar_date"], encoding="utf-8-sig")
+
+
+def update_trade_calendar(end_date: str, path=CALENDAR_PATH, query_func=None) -> pd.DataFrame:
+    """
+    Extend the cached calendar through end_date and return it
+    Parameters:
+        query_func: Stand-in for bs.query_trade_dates, for offline testing
+    Raises RuntimeError if Baostock reports an error for the request.
+    """
+    calendar = load_trade_calendar(path)
+    last = calendar["calendar_date"].max() if len(calendar) else None
+    if last is not None and last.strftime("%Y-%m-%d") >= end_date:
+        return calendar
+    start_date = (last + pd.Timedelta(days=1)).strftime("%Y-%m-%d") if last is not None else CALENDAR_START
+
+    if query_func is None:
+        import baostock as bs
+        query_func = partial(call, bs.query_trade_dates)
+    with metrics.span("fetch.calendar"):
+        rs = query_func(start_date=start_date, end_date=end_date)
+    if rs.error_code != "0":
+        raise RuntimeError(f"Trading calendar query failed: {rs.error_msg}")
+    new = decode_result(rs, "query_trade_dates")
+    calendar = pd.concat([calendar, new[["calendar_date", "is_trading_day"]]], ignore_index=True)
+    calendar = calendar.drop_duplicates("calendar_date", keep="last").sort_values("calendar_date")
+    atomic_write_csv(calendar.assign(calendar_date=calendar["calendar_date"].dt.strftime("%Y-%m-%d")), path)
+    return calendar.reset_index(drop=True)
+
+
+def trading_days(calendar: pd.DataFrame, start_date=None, end_date=None) -> np.ndarray:
+    """Sorted trading days (datetime64[D]) of the calendar within the inclusive bounds"""
+    days = calendar.loc[calendar["is_trading_day"] == 1, "calendar_date"].to_numpy().astype("datetime64[D]")
+    if start_date is not None:
+        days = days[days >= np.datetime64(pd.Timestamp(start_date).date())]
+    if end_date is not None:
+        days = days[days <= np.datetime64(pd.Timestamp(end_date).date())]
+    return np.sort(days)
+
+
+def missing_ranges(expected: np.ndarray, missing_mask: np.ndarray, merge_gap: int = MERGE_GAP_DAYS) -> list:
+    """
+    Group the missing days of `expected` (sorted trading days) into request ranges
+    Runs of missing days fewer than merge_gap trading days apart share one request.
+    Returns:
+        List of (start_date, end_date) strings, inclusive
+    """
+    idx = np.flatnonzero(missing_mask)
+    if not len(idx):
+        return []
+    breaks = np.flatnonzero(np.diff(idx) > merge_gap)
+    starts = np.concatenate([[idx[0]], idx[breaks + 1]])
+    ends = np.concatenate([idx[breaks], [idx[-1]]])
+    return [(str(expected[s]), str(expected[e])) for s, e in zip(starts, ends)]